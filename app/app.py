@@ -2,9 +2,9 @@ import streamlit as st
 import pandas as pd
 import os
 from datetime import datetime, timedelta
-import plotly.express as px
-import plotly.graph_objects as go
-from dashboards import sales_dashboard, product_dashboard, inventory_dashboard, customer_dashboard, marketing_dashboard
+from datastore import ingest, shared, filters, timeindex, store, aggregates, resultcache, products
+# Dashboard pages and their Plotly dependencies are imported when first shown
+import startup
 
 # Page configuration
 st.set_page_config(
@@ -47,6 +47,10 @@ def apply_custom_css():
         font-size: 0.9rem;
         color: #666;
     }
+    .metric-delta {
+        font-size: 0.8rem;
+        color: #888;
+    }
     .sidebar-nav-active {
         background-color: #3a4f41;
         color: white !important;
@@ -71,52 +75,162 @@ def apply_custom_css():
 apply_custom_css()
 
 # Data loading and caching
-@st.cache_data(ttl=3600)
+# The sales export written by generate_mock_data.py; DOGDAYS_SALES_SOURCE can
+# name another export, or a directory whose exports are all read through the
+# unified store (datastore.exports)
+SALES_SOURCE = os.environ.get('DOGDAYS_SALES_SOURCE') or ingest.resolve_data_path('dog_days_sales_data.csv')
+
+# Memory budget of the shared dashboard result cache (MB)
+RESULT_CACHE_MB = int(os.environ.get('DOGDAYS_RESULT_CACHE_MB', 64))
+
+@st.cache_resource
+def get_sales_store():
+    """Create the sales store shared by every session"""
+    return store.SalesStore(SALES_SOURCE)
+
+@st.cache_resource
+def get_result_cache():
+    """Create the dashboard result cache shared by every session"""
+    return resultcache.ResultCache(max_bytes=RESULT_CACHE_MB << 20)
+
 def load_sales_data():
-    """Load and cache sales data"""
+    """
+    Bring the shared sales store up to date and return its data version
+
+    Only appended export lines are parsed when the export grows. Line items
+    stay in their month partitions until a date range asks for them.
+    """
     try:
-        # Path is relative to the root directory when deployed
-        if os.path.exists(os.path.join('data', 'dog_days_sales_data.csv')):
-            # When running from root directory
-            file_path = os.path.join('data', 'dog_days_sales_data.csv')
-        else:
-            # When running from src directory (app.py)
-            file_path = os.path.join('..', 'data', 'dog_days_sales_data.csv')
-        df = pd.read_csv(file_path)
-        return df
+        return get_sales_store().refresh()
     except Exception as e:
         st.error(f"Error loading sales data: {e}")
-        return pd.DataFrame()
+        return None
 
-@st.cache_data(ttl=3600)
-def load_product_data():
+@st.cache_resource(max_entries=1)
+def load_product_data(data_version):
     """Load and cache product data"""
     # In a real implementation, this would load actual product data
-    # For now, we'll extract product info from the sales data
-    sales_df = load_sales_data()
-    if not sales_df.empty:
-        product_df = sales_df[['รหัสสินค้า', 'ชื่อสินค้า', 'ราคาต่อหน่วย', 'หมวดหมู่']].drop_duplicates()
-        return product_df
-    return pd.DataFrame()
-
-@st.cache_data(ttl=3600)
-def load_customer_data():
+    # For now, the store extracts the product info from the sales data
+    product_df = get_sales_store().products
+    return product_df if product_df is not None else pd.DataFrame()
+
+@st.cache_resource(max_entries=1)
+def load_customer_data(data_version):
     """Load and cache customer data"""
     # In a real implementation, this would load actual customer data
-    # For now, we'll extract customer info from the sales data
-    sales_df = load_sales_data()
-    if not sales_df.empty:
-        customer_df = sales_df[['ชื่อลูกค้า', 'อีเมลลูกค้า', 'เบอร์โทรศัพท์ลูกค้า', 'ที่อยู่ลูกค้า', 'จังหวัด']].drop_duplicates()
-        return customer_df
-    return pd.DataFrame()
+    # For now, the store builds the customer dimension from the sales data
+    customer_df = get_sales_store().customers
+    return customer_df if customer_df is not None else pd.DataFrame()
+
+@st.cache_resource(max_entries=1)
+def load_filter_index(data_version, months):
+    """Load the month partitions of a date window and cache their filter index"""
+    # Only the months overlapping the selected range are read, so memory and
+    # load time follow the window rather than the whole history. One window
+    # is kept: the store keeps the months themselves, so another window is
+    # rebuilt from memory without holding a second copy of the lines
+    sales_df = get_sales_store().load_months(months)
+    if sales_df.empty or 'วันที่ทำรายการ' not in sales_df.columns:
+        return None
+    return filters.FilterIndex(sales_df)
+
+@st.cache_resource(max_entries=1)
+def load_sales_cube(data_version):
+    """Build and cache the filter index over the sales rollup cube for one data version"""
+    # The store maintains the cube itself, merging appended lines into it
+    cube = get_sales_store().cube
+    if cube is None or cube.empty:
+        return None
+    return filters.FilterIndex(cube)
+
+@st.cache_resource(max_entries=1)
+def load_time_index(data_version):
+    """Build and cache the prefix-sum index for date-range totals for one data version"""
+    cube_index = load_sales_cube(data_version)
+    if cube_index is None:
+        return None
+    return timeindex.PrefixSumIndex(cube_index.df)
+
+@st.cache_resource(max_entries=1)
+def load_order_index(data_version):
+    """Build and cache the filter index over the order fact table for one data version"""
+    # One row per order, so order-level metrics need no distinct counts
+    order_df = get_sales_store().orders
+    if order_df is None or order_df.empty:
+        return None
+    return filters.FilterIndex(order_df)
+
+@st.cache_resource(max_entries=8)
+def load_product_summary(data_version, months, start_date, end_date, category, channel):
+    """Build and cache the per-product summary of the filtered sales lines"""
+    # One sorted pass per data version and filter state; picking a product is then a lookup
+    filter_index = load_filter_index(data_version, months)
+    if filter_index is None:
+        return None
+    sales_df = filter_index.select(start_date=start_date, end_date=end_date, category=category, channel=channel)
+    if sales_df.empty or 'ชื่อสินค้า' not in sales_df.columns:
+        return None
+    return products.ProductSummary(sales_df)
+
+def load_aggregates(dashboard, months, selected_filters, filtered_df):
+    """
+    Return the backend answering the dashboard aggregations
+
+    With DuckDB installed the aggregations run as SQL over the month
+    partitions; otherwise they are computed with pandas on the filtered rows.
+    Order-level results come from the order fact table unless a category is
+    selected, since an order can span several categories.
+    Results are served from the shared result cache whenever the same
+    dashboard section was already computed for this data version and filters.
+    """
+    def make_backend():
+        sales_store = get_sales_store()
+        order_index = load_order_index(data_version)
+        order_df = None
+        if order_index is not None and selected_filters['category'] == filters.ALL:
+            order_df = order_index.select(**selected_filters)
+        # When no filter narrows the orders, the store's RFM and cohort states already cover them
+        whole = order_df is sales_store.orders
+        customers = sales_store.customer_rfm if whole else None
+        cohort_state = sales_store.cohorts if whole else None
+        # Orders rebuilt from the lines take their customer keys from the whole order table
+        if aggregates.sql_available():
+            return aggregates.SQLAggregates(sales_store.partition_files(months), **selected_filters,
+                                            orders=order_df, customers=customers, cohort_state=cohort_state,
+                                            order_keys=sales_store.orders)
+        return aggregates.FrameAggregates(filtered_df, orders=order_df, customers=customers,
+                                          cohort_state=cohort_state, order_keys=sales_store.orders)
+    return aggregates.CachedAggregates(make_backend, get_result_cache(), data_version, dashboard, selected_filters)
+
+def recent_orders_for(selected_filters):
+    """
+    Return a function answering the latest order lines for the sidebar filters
+
+    The lines come from the store's recent-orders feed, which is maintained
+    as lines are appended, so the sales table is never sorted. In live mode
+    the store is refreshed first, and the end of the date range is dropped
+    so newly appended orders show up.
+    """
+    def recent_orders(n=10, status=filters.ALL, live=False):
+        sales_store = get_sales_store()
+        if live:
+            sales_store.refresh()
+        if sales_store.recent is None:
+            return None
+        selection = dict(selected_filters, end_date=None) if live else selected_filters
+        return sales_store.recent.latest(n, status=status, **selection)
+    return recent_orders
 
 # Load data
-sales_df = load_sales_data()
-product_df = load_product_data()
-customer_df = load_customer_data()
+data_version = load_sales_data()
+product_df = load_product_data(data_version)
+customer_df = load_customer_data(data_version)
+cube_index = load_sales_cube(data_version)
+time_index = load_time_index(data_version)
 
 # Sidebar navigation
 def render_sidebar():
+    """Render the sidebar and return the selected filters"""
     with st.sidebar:
         # Use the logo from the data directory
         if os.path.exists(os.path.join('data', 'logo_dogdays.png')):
@@ -170,51 +284,89 @@ def render_sidebar():
         
         # Date range filter
         st.markdown("**ช่วงวันที่**")
-        # Default to last 30 days
-        default_start_date = datetime.now() - timedelta(days=30)
-        default_end_date = datetime.now()
+        # Default to the last 30 days of available data
+        first_date, last_date = cube_index.date_range if cube_index is not None else (None, None)
+        default_end_date = last_date.date() if last_date is not None else datetime.now().date()
+        default_start_date = default_end_date - timedelta(days=30)
         
         start_date = st.date_input("วันที่เริ่มต้น", value=default_start_date)
         end_date = st.date_input("วันที่สิ้นสุด", value=default_end_date)
         
+        selected_category = filters.ALL
+        selected_channel = filters.ALL
+        
         # Product category filter
-        if not product_df.empty and 'หมวดหมู่' in product_df.columns:
-            categories = ['All'] + sorted(product_df['หมวดหมู่'].dropna().unique().tolist())
+        if cube_index is not None and cube_index.values('category'):
+            categories = [filters.ALL] + cube_index.values('category')
             selected_category = st.selectbox("หมวดหมู่สินค้า", categories)
         
         # Sales channel filter
-        if not sales_df.empty and 'ช่องทางการขาย' in sales_df.columns:
-            channels = ['All'] + sorted(sales_df['ช่องทางการขาย'].dropna().unique().tolist())
+        if cube_index is not None and cube_index.values('channel'):
+            channels = [filters.ALL] + cube_index.values('channel')
             selected_channel = st.selectbox("ช่องทางการขาย", channels)
         
         # Footer
         st.markdown("---")
         st.markdown(f"**อัปเดตล่าสุด:** {datetime.now().strftime('%Y-%m-%d %H:%M')}")
         st.markdown("© 2025 Dog Days")
+    
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'category': selected_category,
+        'channel': selected_channel
+    }
 
 # Main content based on selected dashboard
-def render_main_content():
+def render_main_content(selected_filters):
     # Display header
     st.markdown('<h1 class="main-header">แดชบอร์ด Dog Days</h1>', unsafe_allow_html=True)
     
+    # Load only the months overlapping the selected date range
+    months = get_sales_store().months(selected_filters['start_date'], selected_filters['end_date'])
+    filter_index = load_filter_index(data_version, months) if data_version is not None else None
+    
+    # Apply the sidebar filters through the index instead of scanning the table
+    filtered_df = filter_index.select(**selected_filters) if filter_index is not None else pd.DataFrame()
+    if filtered_df.empty and cube_index is not None:
+        st.warning("ไม่มีข้อมูลตามตัวกรองที่เลือก กรุณาปรับช่วงวันที่หรือตัวกรอง")
+        return
+    
     # Render the selected dashboard
     current_dashboard = st.session_state.get('current_dashboard', 'sales')
+    dashboard_aggregates = load_aggregates(current_dashboard, months, selected_filters, filtered_df)
+    dashboard = startup.load_dashboard(current_dashboard)
     
     if current_dashboard == 'sales':
-        sales_dashboard.render_dashboard(sales_df)
+        # The cube is filtered with the same selections as the line items
+        filtered_cube = cube_index.select(**selected_filters) if cube_index is not None else None
+        # Totals for the selected range and the period before it, two lookups each
+        comparison = time_index.compare(**selected_filters) if time_index is not None else None
+        dashboard.render_dashboard(filtered_df, filtered_cube, comparison, recent_orders_for(selected_filters))
     elif current_dashboard == 'products':
-        product_dashboard.render_dashboard(sales_df, product_df)
+        product_summary = load_product_summary(data_version, months, **selected_filters)
+        dashboard.render_dashboard(filtered_df, product_df, product_summary)
     elif current_dashboard == 'inventory':
-        inventory_dashboard.render_dashboard(sales_df, product_df)
+        dashboard.render_dashboard(filtered_df, product_df)
     elif current_dashboard == 'customers':
-        customer_dashboard.render_dashboard(sales_df, customer_df)
+        dashboard.render_dashboard(filtered_df, customer_df, dashboard_aggregates)
     elif current_dashboard == 'marketing':
-        marketing_dashboard.render_dashboard(sales_df)
+        dashboard.render_dashboard(filtered_df, dashboard_aggregates)
+
+# Import times of the pages loaded so far, for checking the first paint
+def render_import_report():
+    with st.sidebar.expander("เวลานำเข้าโมดูล (Debug)"):
+        report = startup.import_report()
+        if report.empty:
+            st.caption("ยังไม่มีการนำเข้าโมดูลของหน้าแดชบอร์ด")
+        else:
+            st.dataframe(report, use_container_width=True, hide_index=True)
 
 # Main app layout
 def main():
-    render_sidebar()
-    render_main_content()
+    selected_filters = render_sidebar()
+    render_main_content(selected_filters)
+    render_import_report()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,229 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+from datastore import resultcache, shared
+
+# Memory budget of the shared figure cache (MB)
+FIGURE_CACHE_MB = int(os.environ.get('DOGDAYS_FIGURE_CACHE_MB', 32))
+
+# Line charts with more points are downsampled to this many points
+MAX_LINE_POINTS = 2000
+
+# Scatter charts with more points are drawn with WebGL
+WEBGL_SCATTER_POINTS = 1000
+
+# Scatter charts with more points are drawn as a density heatmap, when the
+# points carry no color, size or trendline that a heatmap would lose
+DENSITY_SCATTER_POINTS = 100_000
+
+# Scatter options that have no meaning for a density heatmap
+SCATTER_ONLY_OPTIONS = ['opacity', 'trendline', 'render_mode']
+
+
+def frame_digest(df):
+    """Return a hash of the content of a frame: column names, dtypes and values"""
+    if isinstance(df, pd.Series):
+        df = df.to_frame()
+    digest = hashlib.sha1()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _key_part(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        version = shared.frame_version(value)
+        if version is not None:
+            # A frozen frame never changes, so its version stands for its values
+            return ('frame', version, tuple(str(col) for col in value.columns))
+        return frame_digest(value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _key_part(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_key_part(item) for item in value)
+    if callable(value):
+        return f'{value.__module__}.{value.__qualname__}'
+    return resultcache.normalize(value)
+
+
+def figure_size(entry):
+    """Return the size of a cached figure spec, in bytes"""
+    spec, _ = entry
+    return len(spec.encode())
+
+
+def lttb(x, y, n_out):
+    """
+    Downsample a line with Largest-Triangle-Three-Buckets
+
+    Keeps the first and last points and, from each of n_out - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    point kept before it and the average of the next bucket, so peaks and
+    troughs survive.
+
+    Parameters:
+    -----------
+    x, y : array-like
+        Coordinates of the line, sorted by x; dates are allowed for x
+    n_out : int
+        Number of points to keep
+
+    Returns:
+    --------
+    numpy.ndarray
+        Positions of the kept points, increasing
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    x = x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    keep = np.empty(n_out, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def prepare_chart(chart, data, options, line=None):
+    """
+    Pick how to draw a chart so large data does not flood the browser
+
+    Single-series line charts above MAX_LINE_POINTS are downsampled with
+    LTTB. Scatter charts above WEBGL_SCATTER_POINTS use WebGL, and plain
+    scatters above DENSITY_SCATTER_POINTS become a density heatmap.
+
+    Parameters:
+    -----------
+    chart : callable
+        Chart function
+    data : pandas.DataFrame
+        Data to plot
+    options : dict
+        Chart options
+    line : tuple of str, optional
+        (x, y) columns of a line drawn by a custom chart function; px.line
+        charts are recognized on their own
+
+    Returns:
+    --------
+    tuple
+        (chart, data, options, note) where note describes the change, or None
+    """
+    total = len(data)
+    if line is None and chart is px.line and 'color' not in options:
+        line = (options.get('x'), options.get('y'))
+    if line is not None and total > MAX_LINE_POINTS and all(col in data.columns for col in line):
+        data = data.take(lttb(data[line[0]], data[line[1]], MAX_LINE_POINTS))
+        return chart, data, options, f"แสดง {len(data):,} จาก {total:,} จุด (ลดจำนวนจุดด้วย LTTB, ตัดออก {total - len(data):,} จุด)"
+
+    if chart is px.scatter and total > DENSITY_SCATTER_POINTS and not {'color', 'size', 'trendline'} & set(options):
+        options = {key: value for key, value in options.items() if key not in SCATTER_ONLY_OPTIONS}
+        return px.density_heatmap, data, options, f"แสดง {total:,} จุดเป็นแผนภาพความหนาแน่น"
+    if chart is px.scatter and total > WEBGL_SCATTER_POINTS:
+        return chart, data, {**options, 'render_mode': 'webgl'}, f"แสดง {total:,} จุดด้วย WebGL"
+    return chart, data, options, None
+
+
+@st.cache_resource
+def get_figure_cache():
+    """Create the figure cache shared by every session"""
+    return resultcache.ResultCache(max_bytes=FIGURE_CACHE_MB << 20, sizeof=figure_size)
+
+
+def add_fit_line(fig, data, x, fit):
+    """Draw a fitted (slope, intercept) line over the x range of data"""
+    x_range = pd.to_numeric(data[x], errors='coerce').agg(['min', 'max']).to_numpy(dtype=float)
+    if fit is None or np.isnan(x_range).any():
+        return
+    slope, intercept = fit
+    fig.add_scatter(x=x_range, y=intercept + slope * x_range, mode='lines', name='Trend',
+                    line=dict(color='black', dash='dash'), hovertemplate=f'y = {slope:,.3f}x + {intercept:,.2f}<extra></extra>')
+
+
+def build_figure(chart, data, layout=None, traces=None, line=None, fit=None, **options):
+    """
+    Build a figure with chart(data, **options) and apply the trace and layout updates
+
+    Returns:
+    --------
+    tuple
+        The figure and the rendering note from prepare_chart
+    """
+    chart, data, options, note = prepare_chart(chart, data, options, line)
+    fig = chart(data, **options)
+    if traces:
+        fig.update_traces(**traces)
+    if fit is not None:
+        add_fit_line(fig, data, options['x'], fit)
+    if layout:
+        fig.update_layout(**layout)
+    return fig, note
+
+
+def build_spec(chart, data, layout=None, traces=None, line=None, fit=None, **options):
+    """Build a figure as in build_figure and return its JSON spec and rendering note"""
+    fig, note = build_figure(chart, data, layout, traces, line, fit, **options)
+    return pio.to_json(fig, validate=False), note
+
+
+def render_chart(chart, data, layout=None, traces=None, line=None, fit=None, **options):
+    """
+    Draw a Plotly chart, reusing the figure built for the same data and options
+
+    Figures are cached as their JSON spec, keyed by the plotted data together
+    with the chart function and every option, so all sessions looking at the
+    same numbers share one spec. Frozen data (see datastore.shared) is keyed
+    by its version and columns, so line-level frames are never hashed; other
+    data by a hash of its content. On a hit the spec is handed to Streamlit
+    as it is: Plotly Express is skipped, the figure is not validated again,
+    and no live figure is shared between sessions.
+
+    Large data is drawn in a lighter mode (see prepare_chart), with a caption
+    saying how many points were dropped or how they are drawn.
+
+    Parameters:
+    -----------
+    chart : callable
+        Plotly Express function (px.bar, px.line, ...) or any function
+        building a figure from (data, **options)
+    data : pandas.DataFrame
+        Data to plot
+    layout : dict, optional
+        Arguments for fig.update_layout
+    traces : dict, optional
+        Arguments for fig.update_traces
+    line : tuple of str, optional
+        (x, y) columns to downsample when chart is a custom line chart
+    fit : tuple of float, optional
+        (slope, intercept) of a trend line drawn over the chart, see
+        datastore.trend
+    **options
+        Arguments for chart
+    """
+    key = ('figure', _key_part(chart), _key_part(data),
+           _key_part({'layout': layout, 'traces': traces, 'line': line, 'fit': fit, **options}))
+    spec, note = get_figure_cache().get_or_compute(
+        key, lambda: build_spec(chart, data, layout, traces, line, fit, **options))
+    # The spec was built from a valid figure, so it is wrapped without
+    # validating it again (st.plotly_chart would validate a plain dict)
+    st.plotly_chart(go.Figure(json.loads(spec), _validate=False), use_container_width=True)
+    if note:
+        st.caption(note)
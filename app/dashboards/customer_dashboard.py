@@ -4,8 +4,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime, timedelta
+from datastore.aggregates import FrameAggregates
+from dashboards.sections import render_lazy_sections
+from datastore import cohorts, clv
+from dashboards import charts, tables
 
-def render_dashboard(sales_df, customer_df):
+def render_dashboard(sales_df, customer_df, aggregates=None):
     """
     Render the customer analytics dashboard
     
@@ -15,6 +19,8 @@ def render_dashboard(sales_df, customer_df):
         DataFrame containing sales data
     customer_df : pandas.DataFrame
         DataFrame containing customer data
+    aggregates : FrameAggregates or SQLAggregates, optional
+        Aggregations over the same rows (datastore.aggregates); computed from sales_df if not given
     """
     st.markdown("## แดชบอร์ดวิเคราะห์ลูกค้า (Customer Analytics Dashboard)")
     
@@ -28,29 +34,26 @@ def render_dashboard(sales_df, customer_df):
     
     st.info("นี่เป็นตัวอย่างแดชบอร์ดวิเคราะห์ลูกค้า ในการใช้งานจริง จะเชื่อมต่อกับฐานข้อมูลลูกค้าที่สมบูรณ์")
     
-    # Data preprocessing
-    # Convert date columns to datetime if needed
-    try:
-        if 'วันที่ทำรายการ' in sales_df.columns:
-            if not pd.api.types.is_datetime64_any_dtype(sales_df['วันที่ทำรายการ']):
-                sales_df['วันที่ทำรายการ'] = pd.to_datetime(sales_df['วันที่ทำรายการ'], format='%d/%m/%Y', errors='coerce')
-    except Exception as e:
-        st.warning(f"Error processing date fields: {e}")
-    
     # Customer overview
     st.markdown("### ภาพรวมลูกค้า")
     
     # Calculate customer metrics
     if 'ชื่อลูกค้า' in sales_df.columns:
+        if aggregates is None:
+            aggregates = FrameAggregates(sales_df)
+        
+        # Recency, frequency, spend, RFM segment and lifetime value of every
+        # customer, one row each, highest lifetime value first
+        rfm = aggregates.customer_segments()
+        
         # Count unique customers
-        unique_customers = sales_df['ชื่อลูกค้า'].nunique()
+        unique_customers = len(rfm)
         
         # Calculate average order value per customer
-        customer_orders = sales_df.groupby('ชื่อลูกค้า')['มูลค่า'].sum()
-        avg_customer_value = customer_orders.mean() if not customer_orders.empty else 0
+        avg_customer_value = rfm['Monetary'].mean() if not rfm.empty else 0
         
         # Calculate orders per customer
-        customer_order_counts = sales_df.groupby('ชื่อลูกค้า')['รายการ'].nunique()
+        customer_order_counts = rfm['Frequency']
         avg_orders_per_customer = customer_order_counts.mean() if not customer_order_counts.empty else 0
         
         # Identify repeat customers (more than 1 order)
@@ -88,63 +91,11 @@ def render_dashboard(sales_df, customer_df):
         st.markdown("### การแบ่งกลุ่มลูกค้า")
         
         # Create RFM (Recency, Frequency, Monetary) segmentation
-        if 'วันที่ทำรายการ' in sales_df.columns and not sales_df['วันที่ทำรายการ'].isna().all():
-            # Calculate the most recent date in the dataset
-            max_date = sales_df['วันที่ทำรายการ'].max()
-            
-            # Calculate RFM metrics
-            rfm = sales_df.groupby('ชื่อลูกค้า').agg({
-                'วันที่ทำรายการ': lambda x: (max_date - x.max()).days,  # Recency
-                'รายการ': 'nunique',  # Frequency
-                'มูลค่า': 'sum'  # Monetary
-            }).reset_index()
-            
-            # Rename columns
-            rfm.columns = ['ชื่อลูกค้า', 'Recency', 'Frequency', 'Monetary']
-            
-            # Create segments
-            rfm['RecencyScore'] = pd.qcut(rfm['Recency'], 3, labels=[3, 2, 1])
-            rfm['FrequencyScore'] = pd.qcut(rfm['Frequency'].rank(method='first'), 3, labels=[1, 2, 3])
-            rfm['MonetaryScore'] = pd.qcut(rfm['Monetary'].rank(method='first'), 3, labels=[1, 2, 3])
-            
-            # Calculate RFM Score
-            rfm['RFMScore'] = rfm['RecencyScore'].astype(str) + rfm['FrequencyScore'].astype(str) + rfm['MonetaryScore'].astype(str)
-            
-            # Create segment labels
-            segment_map = {
-                '311': 'New High Spenders',
-                '312': 'New High Spenders',
-                '313': 'New High Spenders',
-                '321': 'New Active Customers',
-                '322': 'New Active Customers',
-                '323': 'New Active Customers',
-                '331': 'New Low Spenders',
-                '332': 'New Low Spenders',
-                '333': 'New Low Spenders',
-                '211': 'Active High Spenders',
-                '212': 'Active High Spenders',
-                '213': 'Active High Spenders',
-                '221': 'Active Regular Customers',
-                '222': 'Active Regular Customers',
-                '223': 'Active Regular Customers',
-                '231': 'Active Low Spenders',
-                '232': 'Active Low Spenders',
-                '233': 'Active Low Spenders',
-                '111': 'Inactive High Spenders',
-                '112': 'Inactive High Spenders',
-                '113': 'Inactive High Spenders',
-                '121': 'Inactive Regular Customers',
-                '122': 'Inactive Regular Customers',
-                '123': 'Inactive Regular Customers',
-                '131': 'Inactive Low Spenders',
-                '132': 'Inactive Low Spenders',
-                '133': 'Inactive Low Spenders'
-            }
-            
-            rfm['Segment'] = rfm['RFMScore'].map(segment_map)
-            
+        if 'วันที่ทำรายการ' in sales_df.columns and not sales_df['วันที่ทำรายการ'].isna().all() and unique_customers >= 3:
+            # Scores and segments come with the RFM table (datastore.rfm.segment)
             # Create a bubble chart for customer segmentation
-            fig = px.scatter(
+            charts.render_chart(
+                px.scatter,
                 rfm,
                 x='Recency',
                 y='Frequency',
@@ -157,79 +108,144 @@ def render_dashboard(sales_df, customer_df):
                     'Frequency': 'Number of Orders',
                     'Monetary': 'Total Spend (฿)'
                 },
-                size_max=50
+                size_max=50,
+                layout=dict(height=500)
             )
-            fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
             
             # Segment distribution
             segment_counts = rfm['Segment'].value_counts().reset_index()
             segment_counts.columns = ['Segment', 'Count']
             
-            fig = px.pie(
+            charts.render_chart(
+                px.pie,
                 segment_counts,
                 values='Count',
                 names='Segment',
                 title='Customer Segment Distribution',
-                hole=0.4
+                hole=0.4,
+                layout=dict(height=400)
             )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
+        elif unique_customers < 3:
+            st.info("Not enough customers in the selected range for segmentation.")
         else:
             st.warning("Date data not available for customer segmentation.")
         
-        # Geographic distribution
-        st.markdown("### การกระจายตัวทางภูมิศาสตร์ของลูกค้า")
-        
-        # Check if we have geographic data
-        if 'จังหวัด' in sales_df.columns:
-            # Group by province and count customers
-            province_customers = sales_df.groupby('จังหวัด')['ชื่อลูกค้า'].nunique().reset_index()
-            province_customers.columns = ['จังหวัด', 'จำนวนลูกค้า']
-            province_customers = province_customers.sort_values('จำนวนลูกค้า', ascending=False)
-            
-            # Create bar chart
-            fig = px.bar(
-                province_customers,
-                x='จังหวัด',
-                y='จำนวนลูกค้า',
-                title='Customers by Province',
-                labels={'จังหวัด': 'Province', 'จำนวนลูกค้า': 'Number of Customers'},
-                color='จำนวนลูกค้า',
-                color_continuous_scale='Viridis'
-            )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
-        else:
-            st.info("Geographic data not available for customer distribution analysis.")
-        
-        # Top customers
-        st.markdown("### ลูกค้าที่มียอดซื้อสูงสุด")
-        
-        # Group by customer and sum sales
-        customer_sales = sales_df.groupby('ชื่อลูกค้า')['มูลค่า'].sum().reset_index()
-        customer_sales = customer_sales.sort_values('มูลค่า', ascending=False)
-        
-        # Display top 10 customers
-        fig = px.bar(
-            customer_sales.head(10),
-            x='ชื่อลูกค้า',
-            y='มูลค่า',
-            title='Top 10 Customers by Sales',
-            labels={'ชื่อลูกค้า': 'Customer', 'มูลค่า': 'Total Sales (฿)'},
-            color='มูลค่า',
-            color_continuous_scale='Viridis'
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Customer details table
-        st.markdown("### รายละเอียดลูกค้า")
-        
-        # Create a searchable customer table
-        if not customer_df.empty:
-            st.dataframe(customer_df, use_container_width=True, height=400)
-        else:
-            st.info("Detailed customer data not available.")
+        # Sections most users skip are only computed when opened
+        render_lazy_sections("customer_sections", {
+            "ภูมิศาสตร์": lambda: render_customer_geography(sales_df, aggregates),
+            "ลูกค้าสูงสุด": lambda: render_top_customers(rfm),
+            "การกลับมาซื้อซ้ำ": lambda: render_customer_retention(aggregates),
+            "รายละเอียดลูกค้า": lambda: render_customer_table(customer_df),
+        })
     else:
         st.warning("Customer data not found in the dataset.")
+
+def render_customer_geography(sales_df, aggregates):
+    """Render the number of customers per province"""
+    # Geographic distribution
+    st.markdown("### การกระจายตัวทางภูมิศาสตร์ของลูกค้า")
+    
+    # Check if we have geographic data
+    if 'จังหวัด' in sales_df.columns:
+        # Group by province and count customers
+        province_customers = aggregates.customers_by_province()
+        
+        # Create bar chart
+        charts.render_chart(
+            px.bar,
+            province_customers,
+            x='จังหวัด',
+            y='จำนวนลูกค้า',
+            title='Customers by Province',
+            labels={'จังหวัด': 'Province', 'จำนวนลูกค้า': 'Number of Customers'},
+            color='จำนวนลูกค้า',
+            color_continuous_scale='Viridis',
+            layout=dict(height=400)
+        )
+    else:
+        st.info("Geographic data not available for customer distribution analysis.")
+
+def render_top_customers(rfm):
+    """Render the customers with the highest total spend"""
+    # Top customers
+    st.markdown("### ลูกค้าที่มียอดซื้อสูงสุด")
+    
+    # Total sales per customer
+    customer_sales = rfm[['ชื่อลูกค้า', 'Monetary']].rename(columns={'Monetary': 'มูลค่า'})
+    customer_sales = customer_sales.sort_values('มูลค่า', ascending=False)
+    
+    # Display top 10 customers
+    charts.render_chart(
+        px.bar,
+        customer_sales.head(10),
+        x='ชื่อลูกค้า',
+        y='มูลค่า',
+        title='Top 10 Customers by Sales',
+        labels={'ชื่อลูกค้า': 'Customer', 'มูลค่า': 'Total Sales (฿)'},
+        color='มูลค่า',
+        color_continuous_scale='Viridis',
+        layout=dict(height=400)
+    )
+    
+    # Customers worth the most over the next year; the table is already sorted by CLV
+    charts.render_chart(
+        px.bar,
+        rfm.head(10),
+        x='ชื่อลูกค้า',
+        y='CLV',
+        title=f'Top 10 Customers by Predicted Value (next {clv.CLV_HORIZON_DAYS} days)',
+        labels={'ชื่อลูกค้า': 'Customer', 'CLV': 'Customer Lifetime Value (฿)'},
+        hover_data={'ExpectedOrders': ':.1f', 'PAlive': ':.0%'},
+        color='CLV',
+        color_continuous_scale='Viridis',
+        layout=dict(height=400)
+    )
+
+def render_customer_retention(aggregates):
+    """Render the retention and revenue of customer cohorts by first-purchase month"""
+    # Repeat purchases by cohort
+    st.markdown("### การกลับมาซื้อซ้ำตามกลุ่มเดือนที่ซื้อครั้งแรก")
+    
+    cohort_table = aggregates.customer_cohorts()
+    
+    # Check if we have at least two months to compare
+    if cohort_table.empty or cohort_table['months_since'].max() < 1:
+        st.info("Not enough months in the selected range for cohort analysis.")
+        return
+    
+    cohort_table = cohort_table.assign(cohort=cohort_table['cohort'].dt.strftime('%Y-%m'))
+    retention = cohorts.matrix(cohort_table, 'retention') * 100
+    revenue = cohorts.matrix(cohort_table, 'revenue')
+    
+    charts.render_chart(
+        px.imshow,
+        retention,
+        text_auto='.0f',
+        aspect='auto',
+        color_continuous_scale='Blues',
+        title='Customer Retention by Cohort (%)',
+        labels={'x': 'Months Since First Purchase', 'y': 'First Purchase Month', 'color': 'Retention (%)'},
+        layout=dict(height=500)
+    )
+    
+    charts.render_chart(
+        px.imshow,
+        revenue,
+        text_auto='.2s',
+        aspect='auto',
+        color_continuous_scale='Viridis',
+        title='Revenue by Cohort (฿)',
+        labels={'x': 'Months Since First Purchase', 'y': 'First Purchase Month', 'color': 'Revenue (฿)'},
+        layout=dict(height=500)
+    )
+
+def render_customer_table(customer_df):
+    """Render the searchable customer table"""
+    # Customer details table
+    st.markdown("### รายละเอียดลูกค้า")
+    
+    # Create a searchable customer table
+    if not customer_df.empty:
+        tables.render_table("customer_table", customer_df, height=400)
+    else:
+        st.info("Detailed customer data not available.")
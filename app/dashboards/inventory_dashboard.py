@@ -3,6 +3,19 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+from dashboards import charts, tables
+from datastore import shared
+
+def freeze_table(product_df, table, name):
+    """
+    Freeze a table derived from the product list for the paged table component
+
+    The table depends on the shared product list alone, so its version is
+    made of the list's version and the table name: the same on every rerun
+    and session, which lets tables.render_table reuse its cached row order.
+    """
+    version = shared.frame_version(product_df)
+    return shared.freeze_frame(table, version=(version, name) if version is not None else None)
 
 def render_dashboard(sales_df, product_df):
     """
@@ -35,7 +48,8 @@ def render_dashboard(sales_df, product_df):
         # Simulate inventory levels
         np.random.seed(42)  # For reproducibility
         unique_products['คงเหลือ'] = np.random.randint(10, 200, size=len(unique_products))
-        unique_products['มูลค่าคงเหลือ'] = unique_products['คงเหลือ'] * product_df['ราคาต่อหน่วย'].values
+        # A product sold at several prices has several rows; value it at the first one
+        unique_products['มูลค่าคงเหลือ'] = unique_products['คงเหลือ'] * product_df.loc[unique_products.index, 'ราคาต่อหน่วย'].values
         unique_products['สถานะ'] = unique_products['คงเหลือ'].apply(
             lambda x: 'ต่ำ' if x < 30 else ('ปานกลาง' if x < 100 else 'สูง')
         )
@@ -83,17 +97,17 @@ def render_dashboard(sales_df, product_df):
         sorted_inventory = unique_products.sort_values('คงเหลือ')
         
         # Create bar chart
-        fig = px.bar(
+        charts.render_chart(
+            px.bar,
             sorted_inventory,
             x='ชื่อสินค้า',
             y='คงเหลือ',
             title='Current Inventory Levels',
             labels={'ชื่อสินค้า': 'Product', 'คงเหลือ': 'Units in Stock'},
             color='สถานะ',
-            color_discrete_map={'ต่ำ': 'red', 'ปานกลาง': 'orange', 'สูง': 'green'}
+            color_discrete_map={'ต่ำ': 'red', 'ปานกลาง': 'orange', 'สูง': 'green'},
+            layout=dict(height=500)
         )
-        fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
         
         # Inventory value by product
         st.markdown("### มูลค่าคลังสินค้าตามสินค้า")
@@ -102,17 +116,17 @@ def render_dashboard(sales_df, product_df):
         sorted_by_value = unique_products.sort_values('มูลค่าคงเหลือ', ascending=False)
         
         # Create bar chart
-        fig = px.bar(
+        charts.render_chart(
+            px.bar,
             sorted_by_value.head(10),  # Top 10 products by value
             x='ชื่อสินค้า',
             y='มูลค่าคงเหลือ',
             title='Top 10 Products by Inventory Value',
             labels={'ชื่อสินค้า': 'Product', 'มูลค่าคงเหลือ': 'Inventory Value (฿)'},
             color='มูลค่าคงเหลือ',
-            color_continuous_scale='Viridis'
+            color_continuous_scale='Viridis',
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
         
         # Low stock alerts
         st.markdown("### แจ้งเตือนสินค้าใกล้หมด")
@@ -122,9 +136,9 @@ def render_dashboard(sales_df, product_df):
         
         if not low_stock.empty:
             # Create a table with conditional formatting
-            st.dataframe(
-                low_stock[['รหัสสินค้า', 'ชื่อสินค้า', 'คงเหลือ', 'มูลค่าคงเหลือ']],
-                use_container_width=True,
+            tables.render_table(
+                "low_stock_table",
+                freeze_table(product_df, low_stock[['รหัสสินค้า', 'ชื่อสินค้า', 'คงเหลือ', 'มูลค่าคงเหลือ']], 'low_stock'),
                 height=400
             )
         else:
@@ -134,9 +148,11 @@ def render_dashboard(sales_df, product_df):
         st.markdown("### การจัดการคลังสินค้า")
         
         # Display full inventory table with search and sort capabilities
-        st.dataframe(
-            unique_products[['รหัสสินค้า', 'ชื่อสินค้า', 'คงเหลือ', 'มูลค่าคงเหลือ', 'สถานะ']],
-            use_container_width=True,
+        # (frozen so paging the table reruns without hashing it)
+        tables.render_table(
+            "inventory_table",
+            freeze_table(product_df, unique_products[['รหัสสินค้า', 'ชื่อสินค้า', 'คงเหลือ', 'มูลค่าคงเหลือ', 'สถานะ']],
+                         'inventory'),
             height=400
         )
     else:
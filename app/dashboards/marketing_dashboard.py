@@ -4,8 +4,12 @@ import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
 from datetime import datetime, timedelta
+from datastore.aggregates import FrameAggregates
+from datastore import trend
+from dashboards.sections import render_lazy_sections
+from dashboards import charts
 
-def render_dashboard(sales_df):
+def render_dashboard(sales_df, aggregates=None):
     """
     Render the marketing performance dashboard
     
@@ -13,6 +17,8 @@ def render_dashboard(sales_df):
     -----------
     sales_df : pandas.DataFrame
         DataFrame containing sales data
+    aggregates : FrameAggregates or SQLAggregates, optional
+        Aggregations over the same rows (datastore.aggregates); computed from sales_df if not given
     """
     st.markdown("## แดชบอร์ดประสิทธิภาพการตลาด (Marketing Performance Dashboard)")
     
@@ -21,25 +27,14 @@ def render_dashboard(sales_df):
         st.error("No sales data available. Please check your data source.")
         return
     
+    if aggregates is None:
+        aggregates = FrameAggregates(sales_df)
+    
     # In a real implementation, this would connect to actual marketing data
     # For this demo, we'll simulate marketing data based on the sales data
     
     st.info("นี่เป็นตัวอย่างแดชบอร์ดประสิทธิภาพการตลาด ในการใช้งานจริง จะเชื่อมต่อกับข้อมูลแคมเปญการตลาดจริง")
     
-    # Data preprocessing
-    # Convert date columns to datetime if needed
-    try:
-        if 'วันที่ทำรายการ' in sales_df.columns:
-            if not pd.api.types.is_datetime64_any_dtype(sales_df['วันที่ทำรายการ']):
-                sales_df['วันที่ทำรายการ'] = pd.to_datetime(sales_df['วันที่ทำรายการ'], format='%d/%m/%Y', errors='coerce')
-                
-                # Extract month and year for trend analysis
-                sales_df['month'] = sales_df['วันที่ทำรายการ'].dt.month
-                sales_df['year'] = sales_df['วันที่ทำรายการ'].dt.year
-                sales_df['month_year'] = sales_df['วันที่ทำรายการ'].dt.strftime('%Y-%m')
-    except Exception as e:
-        st.warning(f"Error processing date fields: {e}")
-    
     # Simulate marketing campaign data
     # In a real implementation, this would come from actual marketing data
     np.random.seed(42)  # For reproducibility
@@ -104,7 +99,8 @@ def render_dashboard(sales_df):
     st.markdown("### เปรียบเทียบ ROI ของแคมเปญ")
     
     # Create bar chart for campaign ROI
-    fig = px.bar(
+    charts.render_chart(
+        px.bar,
         campaign_df.sort_values('roi', ascending=False),
         x='name',
         y='roi',
@@ -112,11 +108,10 @@ def render_dashboard(sales_df):
         labels={'name': 'Campaign', 'roi': 'ROI (%)'},
         color='roi',
         color_continuous_scale='RdYlGn',
-        text='roi'
+        text='roi',
+        traces=dict(texttemplate='%{text:.1f}%', textposition='outside'),
+        layout=dict(height=400)
     )
-    fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-    fig.update_layout(height=400)
-    st.plotly_chart(fig, use_container_width=True)
     
     # Campaign performance metrics
     st.markdown("### ตัวชี้วัดประสิทธิภาพแคมเปญ")
@@ -169,121 +164,134 @@ def render_dashboard(sales_df):
                 radar_metrics[col] = radar_metrics[col] / max_val * 100
     
     # Create radar chart
-    fig = go.Figure()
-    
-    for i, channel in enumerate(radar_metrics['channel']):
-        fig.add_trace(go.Scatterpolar(
-            r=[
-                radar_metrics.loc[radar_metrics['channel'] == channel, 'roi'].values[0],
-                radar_metrics.loc[radar_metrics['channel'] == channel, 'revenue'].values[0],
-                radar_metrics.loc[radar_metrics['channel'] == channel, 'conversions'].values[0],
-                radar_metrics.loc[radar_metrics['channel'] == channel, 'clicks'].values[0],
-                radar_metrics.loc[radar_metrics['channel'] == channel, 'impressions'].values[0]
-            ],
-            theta=['ROI', 'Revenue', 'Conversions', 'Clicks', 'Impressions'],
-            fill='toself',
-            name=channel
-        ))
+    charts.render_chart(build_channel_radar, radar_metrics)
     
-    fig.update_layout(
-        polar=dict(
-            radialaxis=dict(
-                visible=True,
-                range=[0, 100]
-            )
-        ),
-        title='Channel Performance Comparison',
-        height=500
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    # Draw the campaign highlight colors here so they stay the same when the
+    # trend section reruns on its own
+    campaign_colors = [
+        f"rgba({np.random.randint(0, 256)}, {np.random.randint(0, 256)}, {np.random.randint(0, 256)}, 0.2)"
+        for _ in range(len(campaign_df))
+    ]
     
+    # Sections most users skip are only computed when opened
+    render_lazy_sections("marketing_sections", {
+        "แนวโน้มยอดขาย": lambda: render_campaign_trend(sales_df, campaign_df, campaign_colors, aggregates),
+        "ผลกระทบของส่วนลด": lambda: render_discount_analysis(sales_df, aggregates),
+    })
+
+def render_campaign_trend(sales_df, campaign_df, campaign_colors, aggregates):
+    """Render the daily sales with the campaign periods highlighted"""
     # Sales trend with campaign overlay
     st.markdown("### แนวโน้มยอดขายพร้อมช่วงเวลาแคมเปญ")
     
     # Check if we have date data
     if 'วันที่ทำรายการ' in sales_df.columns and 'มูลค่า' in sales_df.columns:
         # Group by date and sum sales
-        daily_sales = sales_df.groupby('วันที่ทำรายการ')['มูลค่า'].sum().reset_index()
-        daily_sales = daily_sales.sort_values('วันที่ทำรายการ')
+        daily_sales = aggregates.daily_sales()
         
         # Create line chart with campaign periods highlighted
-        fig = px.line(
-            daily_sales,
-            x='วันที่ทำรายการ',
-            y='มูลค่า',
-            title='Daily Sales with Campaign Periods',
-            labels={'วันที่ทำรายการ': 'Date', 'มูลค่า': 'Sales Amount (฿)'}
-        )
-        
-        # Add campaign periods as shaded regions
-        for _, campaign in campaign_df.iterrows():
-            fig.add_vrect(
-                x0=campaign['start_date'],
-                x1=campaign['end_date'],
-                fillcolor=f"rgba({np.random.randint(0, 256)}, {np.random.randint(0, 256)}, {np.random.randint(0, 256)}, 0.2)",
-                opacity=0.5,
-                layer="below",
-                line_width=0,
-                annotation_text=campaign['name'],
-                annotation_position="top left"
-            )
-        
-        fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        charts.render_chart(build_campaign_trend, daily_sales, line=('วันที่ทำรายการ', 'มูลค่า'),
+                            campaign_df=campaign_df, campaign_colors=campaign_colors)
     else:
         st.info("Date data not available for sales trend analysis.")
-    
+
+def render_discount_analysis(sales_df, aggregates):
+    """Render the impact of discounts on sales"""
     # Discount analysis
     st.markdown("### การวิเคราะห์ผลกระทบของส่วนลด")
     
     # Check if we have discount data
     if 'ส่วนลด' in sales_df.columns and 'มูลค่า' in sales_df.columns:
         # Create a scatter plot of discount vs. sales
-        fig = px.scatter(
+        charts.render_chart(
+            px.scatter,
             sales_df,
             x='ส่วนลด',
             y='มูลค่า',
             title='Discount Impact on Sales',
             labels={'ส่วนลด': 'Discount Amount (฿)', 'มูลค่า': 'Sales Amount (฿)'},
-            trendline="ols",
-            opacity=0.7
+            fit=trend.solve(aggregates.line_fit('ส่วนลด', 'มูลค่า')),
+            opacity=0.7,
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
         
         # Group by discount percentage and calculate average order value
-        if 'ส่วนลดต่อหน่วย' in sales_df.columns and 'ราคาต่อหน่วย' in sales_df.columns:
-            # Calculate discount percentage
-            sales_df['discount_pct'] = (sales_df['ส่วนลดต่อหน่วย'] / sales_df['ราคาต่อหน่วย']) * 100
-            
-            # Create discount bins
-            sales_df['discount_bin'] = pd.cut(
-                sales_df['discount_pct'],
-                bins=[0, 5, 10, 15, 20, 100],
-                labels=['0-5%', '5-10%', '10-15%', '15-20%', '20%+']
-            )
-            
+        # discount_bin is derived once at load time (datastore.preprocess)
+        if 'discount_bin' in sales_df.columns:
             # Group by discount bin and calculate metrics
-            discount_analysis = sales_df.groupby('discount_bin').agg({
-                'มูลค่า': 'mean',
-                'รายการ': 'count'
-            }).reset_index()
+            discount_analysis = aggregates.discount_summary()
             
             # Rename columns
-            discount_analysis.columns = ['Discount Range', 'Avg. Order Value', 'Number of Orders']
+            discount_analysis = discount_analysis.set_axis(['Discount Range', 'Avg. Order Value', 'Number of Orders'], axis=1)
             
             # Create bar chart
-            fig = px.bar(
+            charts.render_chart(
+                px.bar,
                 discount_analysis,
                 x='Discount Range',
                 y='Avg. Order Value',
                 title='Average Order Value by Discount Range',
                 labels={'Discount Range': 'Discount Percentage', 'Avg. Order Value': 'Average Order Value (฿)'},
                 color='Number of Orders',
-                text='Avg. Order Value'
+                text='Avg. Order Value',
+                traces=dict(texttemplate='฿%{text:.2f}', textposition='outside'),
+                layout=dict(height=400)
             )
-            fig.update_traces(texttemplate='฿%{text:.2f}', textposition='outside')
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Discount data not available for impact analysis.")
+
+def build_channel_radar(radar_metrics):
+    """Build the radar chart comparing the normalized campaign channel metrics"""
+    fig = go.Figure()
+    
+    for i, channel in enumerate(radar_metrics['channel']):
+        fig.add_trace(go.Scatterpolar(
+            r=[
+                radar_metrics.loc[radar_metrics['channel'] == channel, 'roi'].values[0],
+                radar_metrics.loc[radar_metrics['channel'] == channel, 'revenue'].values[0],
+                radar_metrics.loc[radar_metrics['channel'] == channel, 'conversions'].values[0],
+                radar_metrics.loc[radar_metrics['channel'] == channel, 'clicks'].values[0],
+                radar_metrics.loc[radar_metrics['channel'] == channel, 'impressions'].values[0]
+            ],
+            theta=['ROI', 'Revenue', 'Conversions', 'Clicks', 'Impressions'],
+            fill='toself',
+            name=channel
+        ))
+    
+    fig.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 100]
+            )
+        ),
+        title='Channel Performance Comparison',
+        height=500
+    )
+    return fig
+
+def build_campaign_trend(daily_sales, campaign_df, campaign_colors):
+    """Build the daily sales line chart with the campaign periods shaded"""
+    fig = px.line(
+        daily_sales,
+        x='วันที่ทำรายการ',
+        y='มูลค่า',
+        title='Daily Sales with Campaign Periods',
+        labels={'วันที่ทำรายการ': 'Date', 'มูลค่า': 'Sales Amount (฿)'}
+    )
+    
+    # Add campaign periods as shaded regions
+    for (_, campaign), color in zip(campaign_df.iterrows(), campaign_colors):
+        fig.add_vrect(
+            x0=campaign['start_date'],
+            x1=campaign['end_date'],
+            fillcolor=color,
+            opacity=0.5,
+            layer="below",
+            line_width=0,
+            annotation_text=campaign['name'],
+            annotation_position="top left"
+        )
+    
+    fig.update_layout(height=500)
+    return fig
@@ -3,8 +3,11 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import numpy as np
+from datastore.products import ProductSummary
+from dashboards.sections import render_lazy_sections
+from dashboards import charts
 
-def render_dashboard(sales_df, product_df):
+def render_dashboard(sales_df, product_df, summary=None):
     """
     Render the product performance dashboard
     
@@ -14,6 +17,8 @@ def render_dashboard(sales_df, product_df):
         DataFrame containing sales data
     product_df : pandas.DataFrame
         DataFrame containing product data
+    summary : ProductSummary, optional
+        Per-product metrics and series of the same rows (datastore.products); built from sales_df if not given
     """
     st.markdown("## แดชบอร์ดประสิทธิภาพสินค้า (Product Performance Dashboard)")
     
@@ -22,31 +27,63 @@ def render_dashboard(sales_df, product_df):
         st.error("No product data available. Please check your data source.")
         return
     
-    # Data preprocessing
-    # Merge product data with sales data if needed
-    
     # Product selection
-    if 'ชื่อสินค้า' in sales_df.columns:
-        # Get unique products
-        products = sorted(sales_df['ชื่อสินค้า'].unique())
-        
-        # Create a selectbox for product selection
-        selected_product = st.selectbox("เลือกสินค้าเพื่อวิเคราะห์โดยละเอียด", products)
-        
-        # Filter data for the selected product
-        product_sales = sales_df[sales_df['ชื่อสินค้า'] == selected_product]
-    else:
+    if 'ชื่อสินค้า' not in sales_df.columns:
         st.warning("Product name column not found in the dataset.")
         return
     
+    # Metrics and series of every product, computed in one pass
+    if summary is None:
+        summary = ProductSummary(sales_df)
+    
+    render_product_analysis(sales_df, summary)
+
+@st.fragment
+def render_product_analysis(sales_df, summary):
+    """
+    Render the product selector and every section that depends on it
+    
+    Runs as a fragment: picking another product reruns only this function,
+    not the sidebar, the data loading or the rest of the page. Its inputs are
+    exactly its arguments, and each section below receives only what it uses.
+    Everything about the selected product is looked up in the summary, so
+    switching products does not scan the sales data.
+    
+    Parameters:
+    -----------
+    sales_df : pandas.DataFrame
+        Filtered sales data
+    summary : ProductSummary
+        Per-product metrics and series of the filtered sales data
+    """
+    # Create a selectbox for product selection
+    selected_product = st.selectbox("เลือกสินค้าเพื่อวิเคราะห์โดยละเอียด", summary.products)
+    
+    # Lines of the selected product: a row range of the summary's sorted lines
+    product_sales = summary.rows(selected_product)
+    
+    render_product_metrics(summary.product_metrics(selected_product))
+    render_sales_trend(summary.daily_sales(selected_product), selected_product)
+    render_channel_sales(summary.channel_sales(selected_product), selected_product)
+    
+    # Sections most users skip are only computed when opened
+    render_lazy_sections("product_sections", {
+        "ราคา": lambda: render_price_points(product_sales, selected_product),
+        "ส่วนลด": lambda: render_discount_impact(product_sales, selected_product,
+                                                summary.discount_fit(selected_product)),
+        "เปรียบเทียบในหมวดหมู่": lambda: render_category_comparison(summary, selected_product),
+    })
+
+def render_product_metrics(metrics):
+    """Render the metric cards of the selected product from its summary row"""
     # Product performance metrics
     st.markdown("### ตัวชี้วัดประสิทธิภาพสินค้า")
     
-    # Calculate metrics for the selected product
-    total_units_sold = product_sales['จำนวน'].sum() if 'จำนวน' in product_sales.columns else 0
-    total_revenue = product_sales['มูลค่า'].sum() if 'มูลค่า' in product_sales.columns else 0
-    avg_price = product_sales['ราคาต่อหน่วย'].mean() if 'ราคาต่อหน่วย' in product_sales.columns else 0
-    avg_discount = product_sales['ส่วนลดต่อหน่วย'].mean() if 'ส่วนลดต่อหน่วย' in product_sales.columns else 0
+    # Metrics of the selected product, precomputed in the summary
+    total_units_sold = metrics.get('จำนวน', 0)
+    total_revenue = metrics.get('มูลค่า', 0)
+    avg_price = metrics.get('ราคาต่อหน่วย', 0)
+    avg_discount = metrics.get('ส่วนลดต่อหน่วย', 0)
     
     # Display metrics in cards
     col1, col2, col3, col4 = st.columns(4)
@@ -74,124 +111,122 @@ def render_dashboard(sales_df, product_df):
         st.markdown(f'<div class="metric-value">฿{avg_discount:,.2f}</div>', unsafe_allow_html=True)
         st.markdown('<div class="metric-label">ส่วนลดเฉลี่ย</div>', unsafe_allow_html=True)
         st.markdown('</div>', unsafe_allow_html=True)
-    
+
+def render_sales_trend(daily_sales, selected_product):
+    """Render the daily sales trend of the selected product"""
     # Product sales over time
     st.markdown("### แนวโน้มการขาย")
     
     # Check if we have date data
-    if 'วันที่ทำรายการ' in product_sales.columns and 'มูลค่า' in product_sales.columns:
+    if not daily_sales.empty:
         try:
-            # Convert date column to datetime if not already
-            if not pd.api.types.is_datetime64_any_dtype(product_sales['วันที่ทำรายการ']):
-                product_sales['วันที่ทำรายการ'] = pd.to_datetime(product_sales['วันที่ทำรายการ'], format='%d/%m/%Y', errors='coerce')
-            
-            # Group by date and sum sales
-            daily_sales = product_sales.groupby('วันที่ทำรายการ')['มูลค่า'].sum().reset_index()
-            daily_sales = daily_sales.sort_values('วันที่ทำรายการ')
             
             # Create line chart
-            fig = px.line(
+            charts.render_chart(
+                px.line,
                 daily_sales,
                 x='วันที่ทำรายการ',
                 y='มูลค่า',
                 title=f'Daily Sales Trend for {selected_product}',
-                labels={'วันที่ทำรายการ': 'Date', 'มูลค่า': 'Sales Amount (฿)'}
+                labels={'วันที่ทำรายการ': 'Date', 'มูลค่า': 'Sales Amount (฿)'},
+                layout=dict(height=400)
             )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
         except Exception as e:
             st.warning(f"Error processing date data: {e}")
     else:
         st.info("Date or sales amount data not available for trend analysis.")
-    
+
+def render_channel_sales(channel_sales, selected_product):
+    """Render the sales channel split of the selected product"""
     # Sales by channel for this product
     st.markdown("### ยอดขายตามช่องทาง")
     
     # Check if we have channel data
-    if 'ช่องทางการขาย' in product_sales.columns and 'มูลค่า' in product_sales.columns:
-        # Group by channel and sum sales
-        channel_sales = product_sales.groupby('ช่องทางการขาย')['มูลค่า'].sum().reset_index()
-        channel_sales = channel_sales.sort_values('มูลค่า', ascending=False)
-        
+    if not channel_sales.empty:
         # Create pie chart
-        fig = px.pie(
+        charts.render_chart(
+            px.pie,
             channel_sales,
             values='มูลค่า',
             names='ช่องทางการขาย',
             title=f'Sales Channels for {selected_product}',
-            hole=0.4
+            hole=0.4,
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Sales channel data not available for this product.")
-    
+
+def render_price_points(product_sales, selected_product):
+    """Render the price point distribution of the selected product"""
     # Price point analysis
     st.markdown("### การวิเคราะห์ราคา")
     
     # Check if we have price data
     if 'ราคาต่อหน่วย' in product_sales.columns and 'จำนวน' in product_sales.columns:
         # Create a histogram of price points
-        fig = px.histogram(
+        charts.render_chart(
+            px.histogram,
             product_sales,
             x='ราคาต่อหน่วย',
             y='จำนวน',
             title=f'Price Point Distribution for {selected_product}',
             labels={'ราคาต่อหน่วย': 'Price (฿)', 'จำนวน': 'Units Sold'},
-            nbins=20
+            nbins=20,
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Price data not available for price point analysis.")
-    
+
+def render_discount_impact(product_sales, selected_product, fit=None):
+    """Render the discount impact of the selected product, with its trend line fit from the summary"""
     # Discount impact analysis
     st.markdown("### การวิเคราะห์ผลกระทบของส่วนลด")
     
     # Check if we have discount data
     if 'ส่วนลดต่อหน่วย' in product_sales.columns and 'จำนวน' in product_sales.columns:
         # Create a scatter plot of discount vs. units sold
-        fig = px.scatter(
+        charts.render_chart(
+            px.scatter,
             product_sales,
             x='ส่วนลดต่อหน่วย',
             y='จำนวน',
             title=f'Discount Impact for {selected_product}',
             labels={'ส่วนลดต่อหน่วย': 'Discount Amount (฿)', 'จำนวน': 'Units Sold'},
-            trendline="ols"
+            # Solved from the sums the summary keeps per product
+            fit=fit,
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Discount data not available for impact analysis.")
-    
+
+def render_category_comparison(summary, selected_product):
+    """Render the comparison with the other products of the selected product's category"""
     # Product comparison
     st.markdown("### เปรียบเทียบสินค้าในหมวดหมู่เดียวกัน")
     
     # Check if we have category data
-    if 'หมวดหมู่' in sales_df.columns and 'ชื่อสินค้า' in sales_df.columns and 'มูลค่า' in sales_df.columns:
+    metrics = summary.metrics
+    if 'หมวดหมู่' in metrics.columns and 'มูลค่า' in metrics.columns:
         # Get the category of the selected product
-        selected_category = product_sales['หมวดหมู่'].iloc[0] if not product_sales.empty and 'หมวดหมู่' in product_sales.columns else None
+        selected_category = summary.product_metrics(selected_product)['หมวดหมู่']
         
-        if selected_category:
-            # Filter sales data for the same category
-            category_sales = sales_df[sales_df['หมวดหมู่'] == selected_category]
-            
-            # Group by product and sum sales
-            product_comparison = category_sales.groupby('ชื่อสินค้า')['มูลค่า'].sum().reset_index()
+        if pd.notna(selected_category):
+            # Sales of the products in the same category, from the summary rows
+            product_comparison = metrics.loc[metrics['หมวดหมู่'] == selected_category, ['ชื่อสินค้า', 'มูลค่า']]
             product_comparison = product_comparison.sort_values('มูลค่า', ascending=False)
             
             # Create bar chart
-            fig = px.bar(
+            charts.render_chart(
+                px.bar,
                 product_comparison,
                 x='ชื่อสินค้า',
                 y='มูลค่า',
                 title=f'Product Comparison in {selected_category} Category',
                 labels={'ชื่อสินค้า': 'Product', 'มูลค่า': 'Sales Amount (฿)'},
                 color='มูลค่า',
-                color_continuous_scale='Viridis'
+                color_continuous_scale='Viridis',
+                layout=dict(height=400)
             )
-            fig.update_layout(height=400)
-            st.plotly_chart(fig, use_container_width=True)
         else:
             st.info("Category information not available for the selected product.")
     else:
@@ -4,8 +4,29 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
 import numpy as np
+from datastore import rollup
+from datastore.filters import ALL
+from dashboards.sections import render_lazy_sections
+from dashboards import charts
 
-def render_dashboard(sales_df):
+# Seconds between refreshes of the recent orders in live-tail mode
+LIVE_TAIL_SECONDS = 10
+
+# Columns of the recent orders table
+RECENT_ORDER_COLUMNS = [
+    'รายการ', 'วันที่ทำรายการ', 'ชื่อลูกค้า', 'ชื่อสินค้า',
+    'จำนวน', 'ราคาต่อหน่วย', 'มูลค่า', 'สถานะรายการ'
+]
+
+def render_delta(current, previous):
+    """Render the change against the previous period below a metric card"""
+    if previous > 0:
+        change = (current - previous) / previous * 100
+        st.markdown(f'<div class="metric-delta">{change:+.1f}% จากช่วงก่อนหน้า</div>', unsafe_allow_html=True)
+    else:
+        st.markdown('<div class="metric-delta">ไม่มีข้อมูลช่วงก่อนหน้า</div>', unsafe_allow_html=True)
+
+def render_dashboard(sales_df, cube=None, comparison=None, recent_orders=None):
     """
     Render the sales overview dashboard
     
@@ -13,6 +34,14 @@ def render_dashboard(sales_df):
     -----------
     sales_df : pandas.DataFrame
         DataFrame containing sales data
+    cube : pandas.DataFrame, optional
+        Sales cube for the same rows (datastore.rollup); built from sales_df if not given
+    comparison : tuple of dict, optional
+        (current, previous) period totals from datastore.timeindex.PrefixSumIndex.compare
+    recent_orders : callable, optional
+        recent_orders(n, status, live) returns the n latest lines for the
+        sidebar filters from the store's feed, or None when the feed cannot
+        answer (see datastore.recent.RecentOrders.latest)
     """
     st.markdown("## แดชบอร์ดภาพรวมยอดขาย (Sales Overview Dashboard)")
     
@@ -22,42 +51,35 @@ def render_dashboard(sales_df):
         return
     
     # Data preprocessing
-    # Convert date columns to datetime
-    try:
-        sales_df['วันที่ทำรายการ'] = pd.to_datetime(sales_df['วันที่ทำรายการ'], format='%d/%m/%Y', errors='coerce')
-        
-        # Filter out rows with invalid dates
-        sales_df = sales_df.dropna(subset=['วันที่ทำรายการ'])
-        
-        # Extract additional date components
-        sales_df['month'] = sales_df['วันที่ทำรายการ'].dt.month
-        sales_df['year'] = sales_df['วันที่ทำรายการ'].dt.year
-        sales_df['day'] = sales_df['วันที่ทำรายการ'].dt.day
-        sales_df['weekday'] = sales_df['วันที่ทำรายการ'].dt.day_name()
-    except Exception as e:
-        st.warning(f"Error processing date fields: {e}")
+    # Dates and date parts are derived once at load time (datastore.preprocess)
+    # Filter out rows with invalid dates
+    sales_df = sales_df.dropna(subset=['วันที่ทำรายการ'])
+    
+    # Every chart and metric below is answered from the pre-aggregated cube
+    if cube is None:
+        cube = rollup.build_sales_cube(sales_df)
+    cube = cube.dropna(subset=['วันที่ทำรายการ'])
     
     # Summary metrics section
     st.markdown("### ตัวชี้วัดหลัก (Key Metrics)")
     
     # Calculate metrics
-    total_sales = sales_df['มูลค่า'].sum() if 'มูลค่า' in sales_df.columns else 0
-    total_orders = sales_df['รายการ'].nunique() if 'รายการ' in sales_df.columns else 0
+    if comparison is not None:
+        # Period totals come straight from the prefix-sum index
+        current, previous = comparison
+        total_sales = current['มูลค่า']
+        total_orders = int(current['orders'])
+        previous_aov = previous['มูลค่า'] / previous['orders'] if previous['orders'] > 0 else 0
+    else:
+        total_sales = cube['มูลค่า'].sum()
+        total_orders = rollup.order_count(cube)
     avg_order_value = total_sales / total_orders if total_orders > 0 else 0
     
-    # Get top selling products
-    if 'ชื่อสินค้า' in sales_df.columns and 'จำนวน' in sales_df.columns:
-        product_sales = sales_df.groupby('ชื่อสินค้า')['จำนวน'].sum().sort_values(ascending=False)
-        top_product = product_sales.index[0] if not product_sales.empty else "N/A"
-    else:
-        top_product = "N/A"
+    # Get top selling product
+    top_product = rollup.top_value(cube, 'ชื่อสินค้า', 'จำนวน')
     
     # Get top sales channel
-    if 'ช่องทางการขาย' in sales_df.columns:
-        channel_sales = sales_df.groupby('ช่องทางการขาย')['มูลค่า'].sum().sort_values(ascending=False)
-        top_channel = channel_sales.index[0] if not channel_sales.empty else "N/A"
-    else:
-        top_channel = "N/A"
+    top_channel = rollup.top_value(cube, 'ช่องทางการขาย', 'มูลค่า')
     
     # Display metrics in cards
     col1, col2, col3, col4, col5 = st.columns(5)
@@ -66,18 +88,24 @@ def render_dashboard(sales_df):
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
         st.markdown(f'<div class="metric-value">฿{total_sales:,.2f}</div>', unsafe_allow_html=True)
         st.markdown('<div class="metric-label">ยอดขายรวม</div>', unsafe_allow_html=True)
+        if comparison is not None:
+            render_delta(total_sales, previous['มูลค่า'])
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col2:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
         st.markdown(f'<div class="metric-value">{total_orders:,}</div>', unsafe_allow_html=True)
         st.markdown('<div class="metric-label">จำนวนออเดอร์</div>', unsafe_allow_html=True)
+        if comparison is not None:
+            render_delta(total_orders, previous['orders'])
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col3:
         st.markdown('<div class="metric-card">', unsafe_allow_html=True)
         st.markdown(f'<div class="metric-value">฿{avg_order_value:,.2f}</div>', unsafe_allow_html=True)
         st.markdown('<div class="metric-label">มูลค่าออเดอร์เฉลี่ย</div>', unsafe_allow_html=True)
+        if comparison is not None:
+            render_delta(avg_order_value, previous_aov)
         st.markdown('</div>', unsafe_allow_html=True)
     
     with col4:
@@ -96,23 +124,23 @@ def render_dashboard(sales_df):
     st.markdown("### ยอดขายตามภูมิภาค")
     
     # Check if we have geographic data
-    if 'จังหวัด' in sales_df.columns:
+    if 'จังหวัด' in cube.columns:
         # Group by province and sum sales
-        province_sales = sales_df.groupby('จังหวัด')['มูลค่า'].sum().reset_index()
+        province_sales = cube.groupby('จังหวัด', observed=True)['มูลค่า'].sum().reset_index()
         province_sales = province_sales.sort_values('มูลค่า', ascending=False)
         
         # Create bar chart
-        fig = px.bar(
+        charts.render_chart(
+            px.bar,
             province_sales,
             x='จังหวัด',
             y='มูลค่า',
             title='Sales by Province',
             labels={'จังหวัด': 'Province', 'มูลค่า': 'Sales Amount (฿)'},
             color='มูลค่า',
-            color_continuous_scale='Viridis'
+            color_continuous_scale='Viridis',
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Geographic data not available in the dataset.")
     
@@ -120,57 +148,69 @@ def render_dashboard(sales_df):
     st.markdown("### แนวโน้มยอดขาย")
     
     # Check if we have date data
-    if 'วันที่ทำรายการ' in sales_df.columns:
+    if 'วันที่ทำรายการ' in cube.columns:
         # Group by date and sum sales
-        daily_sales = sales_df.groupby('วันที่ทำรายการ')['มูลค่า'].sum().reset_index()
+        daily_sales = cube.groupby('วันที่ทำรายการ')['มูลค่า'].sum().reset_index()
         daily_sales = daily_sales.sort_values('วันที่ทำรายการ')
         
         # Create line chart
-        fig = px.line(
+        charts.render_chart(
+            px.line,
             daily_sales,
             x='วันที่ทำรายการ',
             y='มูลค่า',
             title='Daily Sales Trend',
-            labels={'วันที่ทำรายการ': 'Date', 'มูลค่า': 'Sales Amount (฿)'}
+            labels={'วันที่ทำรายการ': 'Date', 'มูลค่า': 'Sales Amount (฿)'},
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Date data not available in the dataset.")
     
+    # Sections most users skip are only computed when opened
+    render_lazy_sections("sales_sections", {
+        "หมวดหมู่สินค้า": lambda: render_category_sales(cube),
+        "ช่องทางการขาย": lambda: render_channel_sales(cube),
+        "ออเดอร์ล่าสุด": lambda: render_recent_orders(sales_df, recent_orders),
+    })
+
+def render_category_sales(cube):
+    """Render the sales split by product category"""
     # Sales by product category
     st.markdown("### ยอดขายตามหมวดหมู่สินค้า")
     
     # Check if we have product category data
-    if 'หมวดหมู่' in sales_df.columns and 'มูลค่า' in sales_df.columns:
+    if 'หมวดหมู่' in cube.columns:
         # Group by category and sum sales
-        category_sales = sales_df.groupby('หมวดหมู่')['มูลค่า'].sum().reset_index()
+        category_sales = cube.groupby('หมวดหมู่', observed=True)['มูลค่า'].sum().reset_index()
         category_sales = category_sales.sort_values('มูลค่า', ascending=False)
         
         # Create pie chart
-        fig = px.pie(
+        charts.render_chart(
+            px.pie,
             category_sales,
             values='มูลค่า',
             names='หมวดหมู่',
             title='Sales by Product Category',
-            hole=0.4
+            hole=0.4,
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Product category data not available in the dataset.")
-    
+
+def render_channel_sales(cube):
+    """Render the sales split by sales channel"""
     # Sales by channel
     st.markdown("### ยอดขายตามช่องทางการขาย")
     
     # Check if we have channel data
-    if 'ช่องทางการขาย' in sales_df.columns and 'มูลค่า' in sales_df.columns:
+    if 'ช่องทางการขาย' in cube.columns:
         # Group by channel and sum sales
-        channel_sales_df = sales_df.groupby('ช่องทางการขาย')['มูลค่า'].sum().reset_index()
+        channel_sales_df = cube.groupby('ช่องทางการขาย', observed=True)['มูลค่า'].sum().reset_index()
         channel_sales_df = channel_sales_df.sort_values('มูลค่า', ascending=False)
         
         # Create horizontal bar chart
-        fig = px.bar(
+        charts.render_chart(
+            px.bar,
             channel_sales_df,
             y='ช่องทางการขาย',
             x='มูลค่า',
@@ -178,34 +218,59 @@ def render_dashboard(sales_df):
             labels={'ช่องทางการขาย': 'Channel', 'มูลค่า': 'Sales Amount (฿)'},
             orientation='h',
             color='มูลค่า',
-            color_continuous_scale='Viridis'
+            color_continuous_scale='Viridis',
+            layout=dict(height=400)
         )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("Sales channel data not available in the dataset.")
+
+def latest_orders(sales_df, recent_orders, n=10, status=ALL, live=False):
+    """Return the n latest order lines, from the feed when it can answer"""
+    orders = recent_orders(n, status, live) if recent_orders is not None else None
+    if orders is None:
+        # Select the latest lines instead of sorting the whole table
+        if status != ALL and 'สถานะรายการ' in sales_df.columns:
+            sales_df = sales_df[sales_df['สถานะรายการ'] == status]
+        orders = sales_df.nlargest(n, 'วันที่ทำรายการ')
+    return orders
+
+def render_order_table(sales_df, recent_orders, status, live=False):
+    """Render the table of the latest orders"""
+    recent = latest_orders(sales_df, recent_orders, 10, status, live)
+    
+    # Filter columns that exist in the dataframe
+    display_columns = [col for col in RECENT_ORDER_COLUMNS if col in recent.columns]
     
+    if display_columns:
+        # Display the 10 most recent orders
+        st.dataframe(recent[display_columns], use_container_width=True)
+    else:
+        st.info("Order data columns not available in the dataset.")
+
+@st.fragment(run_every=LIVE_TAIL_SECONDS)
+def render_live_orders(sales_df, recent_orders, status):
+    """Render the latest orders, picking up appended orders every few seconds"""
+    render_order_table(sales_df, recent_orders, status, live=True)
+    st.caption(f"อัปเดตทุก {LIVE_TAIL_SECONDS} วินาที · ล่าสุด {datetime.now().strftime('%H:%M:%S')}")
+
+def render_recent_orders(sales_df, recent_orders=None):
+    """Render the table of the most recent orders"""
     # Recent orders table
     st.markdown("### ออเดอร์ล่าสุด")
     
     # Check if we have order data
-    if not sales_df.empty:
-        # Sort by date (most recent first)
-        recent_orders = sales_df.sort_values('วันที่ทำรายการ', ascending=False)
-        
-        # Select relevant columns for display
-        display_columns = [
-            'รายการ', 'วันที่ทำรายการ', 'ชื่อลูกค้า', 'ชื่อสินค้า', 
-            'จำนวน', 'ราคาต่อหน่วย', 'มูลค่า', 'สถานะรายการ'
-        ]
-        
-        # Filter columns that exist in the dataframe
-        display_columns = [col for col in display_columns if col in recent_orders.columns]
-        
-        if display_columns:
-            # Display the 10 most recent orders
-            st.dataframe(recent_orders[display_columns].head(10), use_container_width=True)
-        else:
-            st.info("Order data columns not available in the dataset.")
-    else:
+    if sales_df.empty or 'วันที่ทำรายการ' not in sales_df.columns:
         st.info("Order data not available in the dataset.")
+        return
+    
+    status_col, live_col = st.columns([3, 1])
+    with status_col:
+        statuses = sales_df['สถานะรายการ'].dropna().unique().tolist() if 'สถานะรายการ' in sales_df.columns else []
+        status = st.selectbox("สถานะรายการ", [ALL] + statuses, key="recent_orders_status")
+    with live_col:
+        live = st.toggle("ติดตามออเดอร์ใหม่", key="recent_orders_live", disabled=recent_orders is None)
+    
+    if live:
+        render_live_orders(sales_df, recent_orders, status)
+    else:
+        render_order_table(sales_df, recent_orders, status)
@@ -0,0 +1,27 @@
+import streamlit as st
+
+@st.fragment
+def render_lazy_sections(key, sections):
+    """
+    Render a row of section tabs and only the section that is opened
+
+    st.tabs and st.expander run the code of every tab on every rerun. Here
+    nothing below the tabs is computed until a section is opened, and only
+    the opened one is; its aggregations then come from the result cache on
+    later reruns. Switching sections reruns only this fragment.
+
+    Parameters:
+    -----------
+    key : str
+        Widget key, unique per dashboard
+    sections : dict
+        Section label -> function drawing the section, called without arguments
+    """
+    st.markdown("### ข้อมูลเพิ่มเติม")
+    selected = st.segmented_control("ข้อมูลเพิ่มเติม", list(sections), key=key, label_visibility="collapsed")
+
+    if selected is None:
+        st.caption("เลือกหัวข้อด้านบนเพื่อดูรายละเอียด")
+        return
+
+    sections[selected]()
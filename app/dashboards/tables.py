@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pandas as pd
+import streamlit as st
+from datastore import resultcache, shared
+from dashboards.charts import frame_digest
+
+# Memory budget of the shared cache of table row orders (MB)
+TABLE_CACHE_MB = int(os.environ.get('DOGDAYS_TABLE_CACHE_MB', 16))
+
+# Rows sent to the browser per page
+DEFAULT_PAGE_SIZE = 50
+
+# Sort option meaning "keep the order of the data"
+NO_SORT = "ไม่เรียง"
+
+
+def table_view(df, search=None, sort_by=None, ascending=True):
+    """
+    Return the positions of the rows matching a search, in sort order
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Full table
+    search : str, optional
+        Text to look for, case-insensitively, in the text columns
+    sort_by : str, optional
+        Column to sort by; missing values go last
+    ascending : bool
+        Sort direction
+
+    Returns:
+    --------
+    numpy.ndarray
+        Row positions in df, in display order
+    """
+    positions = np.arange(len(df))
+    if search:
+        text_columns = df.select_dtypes(include=['object', 'string', 'category']).columns
+        matches = np.zeros(len(df), dtype=bool)
+        for col in text_columns:
+            matches |= df[col].astype(str).str.contains(search, case=False, regex=False).to_numpy()
+        positions = positions[matches]
+    if sort_by is not None:
+        values = df[sort_by].iloc[positions].reset_index(drop=True)
+        order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+        positions = positions[order]
+    return positions
+
+
+def page_rows(df, positions, page, page_size=DEFAULT_PAGE_SIZE):
+    """Return the rows of one page (numbered from 0) of a table view"""
+    start = page * page_size
+    return df.take(positions[start:start + page_size])
+
+
+@st.cache_resource
+def get_table_cache():
+    """Create the cache of table views shared by every session"""
+    return resultcache.ResultCache(max_bytes=TABLE_CACHE_MB << 20, sizeof=lambda positions: positions.nbytes)
+
+
+@st.fragment
+def render_table(key, df, page_size=DEFAULT_PAGE_SIZE, height=400):
+    """
+    Render a table with server-side search, sort and paging
+
+    Only the rows of the visible page are sent to the browser. The row order
+    for a search and sort is computed once per table content and shared by
+    every session, so turning pages only slices it; paging, searching and
+    sorting rerun only this fragment. A frozen frame (see
+    datastore.shared.freeze_frame) is known by its version number, so
+    only regular frames are hashed.
+
+    Parameters:
+    -----------
+    key : str
+        Widget key prefix, unique per table
+    df : pandas.DataFrame
+        Full table
+    page_size : int
+        Rows per page
+    height : int
+        Height of the table in pixels
+    """
+    search_col, sort_col, order_col = st.columns([2, 2, 1])
+    with search_col:
+        search = st.text_input("ค้นหา", key=f"{key}_search").strip()
+    with sort_col:
+        sort_by = st.selectbox("เรียงตาม", [NO_SORT] + list(df.columns), key=f"{key}_sort")
+    with order_col:
+        descending = st.toggle("มากไปน้อย", key=f"{key}_descending")
+    sort_by = None if sort_by == NO_SORT else sort_by
+
+    version = shared.frame_version(df)
+    view_key = ('table', version if version is not None else frame_digest(df), search, sort_by, not descending)
+    positions = get_table_cache().get_or_compute(
+        view_key, lambda: table_view(df, search or None, sort_by, not descending))
+
+    total = len(positions)
+    n_pages = max(1, -(-total // page_size))
+    # A narrower search can leave the selected page past the last one. The
+    # page is set through the session state, so the widget gets no value
+    # (it starts at min_value)
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = n_pages
+    page = st.number_input("หน้า", min_value=1, max_value=n_pages, key=f"{key}_page") - 1
+
+    st.dataframe(page_rows(df, positions, page, page_size), use_container_width=True, height=height)
+    first = page * page_size + 1 if total else 0
+    st.caption(f"แสดงแถว {first:,}–{min((page + 1) * page_size, total):,} จาก {total:,} แถว (หน้า {page + 1:,}/{n_pages:,})")
@@ -0,0 +1 @@
+# Initialize datastore package
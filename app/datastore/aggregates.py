@@ -0,0 +1,329 @@
+import importlib.util
+from datetime import timedelta
+import pandas as pd
+from datastore import shared, trend, rfm, cohorts, clv, orders as order_table
+from datastore.filters import ALL
+from datastore.customers import CUSTOMER_KEY
+from datastore.preprocess import DISCOUNT_LABELS
+
+# DuckDB is optional and only imported when the SQL backend is first used
+duckdb = None
+
+# Aggregations used by the dashboards. Both backends below return the same
+# small result frames, so a dashboard does not care where they are computed.
+
+
+def sql_available():
+    """Return True if the embedded SQL backend (DuckDB) is installed"""
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def _duckdb():
+    global duckdb
+    if duckdb is None:
+        import duckdb
+    return duckdb
+
+
+def _province_customers(orders):
+    """Count the distinct customer keys of order rows per province, largest first"""
+    orders = orders[orders[CUSTOMER_KEY] >= 0]
+    counts = orders.groupby('จังหวัด', observed=True)[CUSTOMER_KEY].nunique().reset_index()
+    counts.columns = ['จังหวัด', 'จำนวนลูกค้า']
+    return counts.sort_values('จำนวนลูกค้า', ascending=False).reset_index(drop=True)
+
+
+def _keyed_orders(order_rows, order_keys=None):
+    """
+    Key order rows built from the lines by customer
+
+    With order_keys (the order fact table), every order takes the customer
+    key and name it has there, so customers sharing a name stay apart and
+    the results match the customer dimension; without it customers are
+    told apart by name.
+    """
+    if order_keys is None:
+        return order_rows.assign(**{CUSTOMER_KEY: pd.factorize(order_rows['ชื่อลูกค้า'])[0]})
+    keyed = order_keys.set_index(order_table.ORDER_KEY).reindex(order_rows[order_table.ORDER_KEY])
+    return order_rows.assign(**{CUSTOMER_KEY: keyed[CUSTOMER_KEY].fillna(-1).to_numpy(dtype='int64'),
+                                'ชื่อลูกค้า': keyed['ชื่อลูกค้า'].to_numpy()})
+
+
+class FrameAggregates:
+    """
+    Dashboard aggregations computed with pandas on an in-memory frame
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Filtered, enriched sales data
+    orders : pandas.DataFrame, optional
+        Order fact table rows of the same orders (see datastore.orders);
+        when given, order-level results are computed per order row instead
+        of counting distinct order numbers over the lines
+    customers : datastore.rfm.CustomerRFM, optional
+        RFM state kept by the store, when the orders are the whole history
+    cohort_state : datastore.cohorts.CohortState, optional
+        Cohort state kept by the store, when the orders are the whole history
+    order_keys : pandas.DataFrame, optional
+        The whole order fact table; when orders is not given, the orders of
+        the lines are keyed by customer through it instead of by name
+    """
+
+    def __init__(self, df, orders=None, customers=None, cohort_state=None, order_keys=None):
+        self.df = df
+        self.orders = orders
+        self.customers = customers
+        self.cohort_state = cohort_state
+        self.order_keys = order_keys
+
+    def _rows(self, where):
+        df = self.df
+        for col, value in (where or {}).items():
+            df = df[df[col] == value]
+        return df
+
+    def _order_rows(self):
+        """Return the orders of the lines, keyed by customer"""
+        return _keyed_orders(order_table.build_orders(self.df), self.order_keys)
+
+    def sales_by(self, key, where=None):
+        """Return the total sales amount (มูลค่า) per value of key, largest first"""
+        df = self._rows(where)
+        totals = df.groupby(key, observed=True)['มูลค่า'].sum().reset_index()
+        return totals.sort_values('มูลค่า', ascending=False).reset_index(drop=True)
+
+    def daily_sales(self, where=None):
+        """Return the total sales amount per order date, in date order"""
+        df = self._rows(where)
+        daily = df.groupby('วันที่ทำรายการ')['มูลค่า'].sum().reset_index()
+        return daily.sort_values('วันที่ทำรายการ').reset_index(drop=True)
+
+    def customer_rfm(self):
+        """
+        Return the recency, frequency and monetary value of every customer
+
+        Recency and Tenure are counted in days from the last order date in
+        the data to the customer's last and first order. Without order rows,
+        the orders are rebuilt from the lines and keyed by customer.
+        """
+        if self.customers is not None:
+            return self.customers.table()
+        if self.orders is not None:
+            return rfm.compute(self.orders)
+        return rfm.compute(self._order_rows())
+
+    def customer_segments(self):
+        """
+        Return the RFM table with the RFM scores, segment and lifetime value of every customer
+
+        Sorted by lifetime value (CLV), highest first (see datastore.clv).
+        """
+        return clv.lifetime_value(rfm.segment(self.customer_rfm()))
+
+    def customer_cohorts(self):
+        """
+        Return the cohort retention and revenue table (see datastore.cohorts)
+
+        Without order rows, the orders are rebuilt from the lines and keyed
+        by customer, like customer_rfm.
+        """
+        if self.cohort_state is not None:
+            return self.cohort_state.table()
+        if self.orders is not None:
+            return cohorts.compute(self.orders)
+        return cohorts.compute(self._order_rows())
+
+    def customers_by_province(self):
+        """Return the number of distinct customers per province, largest first"""
+        if self.orders is not None:
+            return _province_customers(self.orders)
+        return _province_customers(self._order_rows())
+
+    def discount_summary(self):
+        """Return the average sales amount and the line count per discount bin"""
+        summary = self.df.groupby('discount_bin', observed=False).agg({
+            'มูลค่า': 'mean',
+            'รายการ': 'count'
+        }).reset_index()
+        summary['discount_bin'] = summary['discount_bin'].astype(str)
+        return summary
+
+    def line_fit(self, x, y, where=None, weight=None):
+        """
+        Return the sums of the least-squares line of y on x (see datastore.trend)
+
+        Pass the result to trend.solve for the slope and intercept.
+        """
+        df = self._rows(where)
+        weights = df[weight] if weight is not None else None
+        return trend.fit_sums(df[x], df[y], weights)
+
+
+class SQLAggregates:
+    """
+    Dashboard aggregations executed by DuckDB over the month partitions
+
+    Answers the same methods as FrameAggregates with the same result frames.
+    DuckDB scans the Parquet partitions itself, out-of-core and on every
+    core, and pushes the date and sidebar filters down into the scan; only
+    the small result frames reach pandas. The sales lines never have to be
+    loaded into the Streamlit process for these aggregations.
+
+    Parameters:
+    -----------
+    files : list of str
+        Parquet partitions overlapping the selected date range
+    start_date, end_date : date-like, optional
+        Inclusive order date range
+    category, channel : str
+        Selected value, or ALL for no filter
+    orders : pandas.DataFrame, optional
+        Order fact table rows matching the same filters, as for FrameAggregates
+    customers : datastore.rfm.CustomerRFM, optional
+        RFM state kept by the store, as for FrameAggregates
+    cohort_state : datastore.cohorts.CohortState, optional
+        Cohort state kept by the store, as for FrameAggregates
+    order_keys : pandas.DataFrame, optional
+        The whole order fact table, as for FrameAggregates
+    """
+
+    def __init__(self, files, start_date=None, end_date=None, category=ALL, channel=ALL, orders=None,
+                 customers=None, cohort_state=None, order_keys=None):
+        if not sql_available():
+            raise ImportError("The SQL backend requires the duckdb package")
+        self.files = list(files)
+        self.orders = orders
+        self.customers = customers
+        self.cohort_state = cohort_state
+        self.order_keys = order_keys
+        self._where = ['"วันที่ทำรายการ" IS NOT NULL']
+        self._params = []
+        if start_date is not None:
+            self._where.append('"วันที่ทำรายการ" >= ?')
+            self._params.append(pd.Timestamp(start_date).normalize().to_pydatetime())
+        if end_date is not None:
+            self._where.append('"วันที่ทำรายการ" < ?')
+            self._params.append((pd.Timestamp(end_date).normalize() + timedelta(days=1)).to_pydatetime())
+        for col, value in (('หมวดหมู่', category), ('ช่องทางการขาย', channel)):
+            if value is not None and value != ALL:
+                self._where.append(f'"{col}" = ?')
+                self._params.append(value)
+
+    def _query(self, select, where=None, group_by=None, columns=None, not_null=()):
+        if not self.files:
+            return pd.DataFrame(columns=columns)
+        conditions = list(self._where) + [f'"{col}" IS NOT NULL' for col in not_null]
+        params = [self.files] + list(self._params)
+        for col, value in (where or {}).items():
+            conditions.append(f'"{col}" = ?')
+            params.append(value)
+        sql = f"SELECT {select} FROM read_parquet(?) WHERE {' AND '.join(conditions)}"
+        if group_by:
+            sql += f" GROUP BY {group_by}"
+        # A connection per query keeps concurrent sessions independent
+        with _duckdb().connect() as con:
+            result = con.execute(sql, params).df()
+        if columns is not None:
+            result.columns = columns
+        return result
+
+    def _order_rows(self):
+        select = 'MIN("ชื่อลูกค้า"), MIN("จังหวัด"), MIN("วันที่ทำรายการ"), SUM("มูลค่า"), "รายการ"'
+        order_rows = self._query(select, None, '"รายการ"',
+                                 ['ชื่อลูกค้า', 'จังหวัด', 'วันที่ทำรายการ', 'มูลค่า', order_table.ORDER_KEY],
+                                 not_null=[order_table.ORDER_KEY])
+        return _keyed_orders(order_rows, self.order_keys)
+
+    def sales_by(self, key, where=None):
+        totals = self._query(f'"{key}", SUM("มูลค่า")', where, f'"{key}"', [key, 'มูลค่า'])
+        totals = totals.dropna(subset=[key])
+        return totals.sort_values('มูลค่า', ascending=False).reset_index(drop=True)
+
+    def daily_sales(self, where=None):
+        daily = self._query('"วันที่ทำรายการ", SUM("มูลค่า")', where, '"วันที่ทำรายการ"', ['วันที่ทำรายการ', 'มูลค่า'])
+        return daily.sort_values('วันที่ทำรายการ').reset_index(drop=True)
+
+    def customer_rfm(self):
+        if self.customers is not None:
+            return self.customers.table()
+        if self.orders is not None:
+            return rfm.compute(self.orders)
+        return rfm.compute(self._order_rows())
+
+    def customer_segments(self):
+        return clv.lifetime_value(rfm.segment(self.customer_rfm()))
+
+    def customer_cohorts(self):
+        if self.cohort_state is not None:
+            return self.cohort_state.table()
+        if self.orders is not None:
+            return cohorts.compute(self.orders)
+        return cohorts.compute(self._order_rows())
+
+    def customers_by_province(self):
+        if self.orders is not None:
+            return _province_customers(self.orders)
+        return _province_customers(self._order_rows())
+
+    def discount_summary(self):
+        summary = self._query('"discount_bin", AVG("มูลค่า"), COUNT("รายการ")', None, '"discount_bin"',
+                              ['discount_bin', 'มูลค่า', 'รายการ'])
+        # Every bin is reported, also those without lines, like groupby(observed=False)
+        summary = summary.dropna(subset=['discount_bin']).set_index('discount_bin').reindex(DISCOUNT_LABELS)
+        summary['รายการ'] = summary['รายการ'].fillna(0).astype('int64')
+        return summary.rename_axis('discount_bin').reset_index()
+
+    def line_fit(self, x, y, where=None, weight=None):
+        w = f'CAST("{weight}" AS DOUBLE)' if weight is not None else '1.0'
+        select = (f'SUM({w}), SUM({w} * "{x}"), SUM({w} * "{y}"), '
+                  f'SUM({w} * "{x}" * "{x}"), SUM({w} * "{x}" * "{y}")')
+        # Rows with a missing value are skipped, like trend.fit_sums
+        not_null = [x, y] + ([weight] if weight is not None else [])
+        sums = self._query(select, where, None, trend.FIT_SUMS, not_null=not_null)
+        return sums.fillna(0.0)
+
+
+class CachedAggregates:
+    """
+    Serve the aggregations of a backend through a shared ResultCache
+
+    Each method call is one cache section, keyed by the method name and its
+    arguments together with the data version, dashboard and filter state.
+    Results are frozen because every session receives the same object.
+
+    Parameters:
+    -----------
+    make_backend : callable
+        Returns the FrameAggregates or SQLAggregates to compute with; only
+        called on the first cache miss
+    cache : datastore.resultcache.ResultCache
+        Cache shared by every session
+    data_version : str
+        Version of the data the results are computed from
+    dashboard : str
+        Name of the dashboard asking
+    filters : dict
+        Sidebar filter state the backend was built for
+    """
+
+    def __init__(self, make_backend, cache, data_version, dashboard, filters):
+        self._make_backend = make_backend
+        self._backend = None
+        self._cache = cache
+        self._scope = (data_version, dashboard, filters)
+
+    def _compute(self, name, args, kwargs):
+        if self._backend is None:
+            self._backend = self._make_backend()
+        return shared.freeze_frame(getattr(self._backend, name)(*args, **kwargs))
+
+    def __getattr__(self, name):
+        if name.startswith('_') or not callable(getattr(FrameAggregates, name, None)):
+            raise AttributeError(name)
+        data_version, dashboard, filters = self._scope
+
+        def cached(*args, **kwargs):
+            key = self._cache.make_key(data_version, dashboard, (name, args, kwargs), filters)
+            return self._cache.get_or_compute(key, lambda: self._compute(name, args, kwargs))
+        return cached
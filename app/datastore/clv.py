@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+# Period the lifetime value is estimated over (days)
+CLV_HORIZON_DAYS = 365
+
+# Shortest observation period of a customer (days), so a first order made
+# yesterday does not read as a purchase every day
+MIN_EXPOSURE_DAYS = 30
+
+# Weight of the average order value of all customers in a customer's own
+# average, in orders; customers with few orders lean towards it
+AOV_PRIOR_ORDERS = 1.0
+
+
+def purchase_prior(repeats, exposure):
+    """
+    Fit a gamma distribution to the repeat purchase rates of all customers
+
+    Method of moments over the observed rates (repeat orders per day), one
+    fit for the whole customer base instead of a model per customer.
+
+    Returns:
+    --------
+    tuple of float
+        Shape and rate of the gamma distribution
+    """
+    rates = repeats / exposure
+    mean, var = rates.mean(), rates.var()
+    if not var > 0:
+        # Every customer buys at the same rate: a prior worth many orders
+        return mean * 1e6, 1e6
+    return mean * mean / var, mean / var
+
+
+def lifetime_value(table, horizon_days=CLV_HORIZON_DAYS):
+    """
+    Estimate the lifetime value of every customer of an RFM table
+
+    All customers are scored at once with array math:
+
+    - purchase rate: the customer's repeat orders (after the first) over
+      their tenure, shrunk towards the rate of all customers (gamma-Poisson
+      posterior mean)
+    - chance of still buying: the chance of no order since the last one at
+      that rate, exp(-rate * Recency)
+    - order value: the customer's average order value, shrunk towards the
+      average of all customers by AOV_PRIOR_ORDERS orders
+
+    Parameters:
+    -----------
+    table : pandas.DataFrame
+        RFM table with Recency, Frequency, Monetary and Tenure columns
+    horizon_days : int
+        Period to estimate the value over
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Copy of the table with PAlive, ExpectedOrders and CLV columns added,
+        highest CLV first
+    """
+    table = table.copy()
+    frequency = table['Frequency'].to_numpy(dtype=np.float64)
+    monetary = table['Monetary'].to_numpy(dtype=np.float64)
+    recency = table['Recency'].to_numpy(dtype=np.float64)
+    exposure = np.maximum(table['Tenure'].to_numpy(dtype=np.float64) + 1, MIN_EXPOSURE_DAYS)
+    if len(table):
+        repeats = np.maximum(frequency - 1, 0)
+        shape, rate = purchase_prior(repeats, exposure)
+        purchase_rate = (shape + repeats) / (rate + exposure)
+        mean_order = monetary.sum() / max(frequency.sum(), 1)
+        order_value = (monetary + AOV_PRIOR_ORDERS * mean_order) / (frequency + AOV_PRIOR_ORDERS)
+    else:
+        purchase_rate = order_value = np.empty(0)
+
+    table['PAlive'] = np.exp(-purchase_rate * recency)
+    table['ExpectedOrders'] = purchase_rate * horizon_days * table['PAlive'].to_numpy()
+    table['CLV'] = table['ExpectedOrders'].to_numpy() * order_value
+    # Sorted once here, so the top customers are the first rows
+    return table.sort_values('CLV', ascending=False, kind='stable').reset_index(drop=True)
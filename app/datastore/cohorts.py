@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from datastore.customers import CUSTOMER_KEY
+
+# Columns of a cohort table, one row per (cohort, months since first purchase)
+COHORT_COLUMNS = ['cohort', 'months_since', 'customers', 'cohort_size', 'retention', 'revenue']
+
+# First and latest month of a customer without orders yet
+_NO_FIRST = np.iinfo(np.int64).max
+_NO_LAST = np.iinfo(np.int64).min
+
+
+def _order_months(orders):
+    """Return the customer key, month number (months since 1970-01) and amount of the order rows with both"""
+    keys = orders[CUSTOMER_KEY].to_numpy(dtype=np.int64)
+    dates = orders['วันที่ทำรายการ'].to_numpy(dtype='datetime64[ns]')
+    months = dates.astype('datetime64[M]').astype(np.int64)
+    amounts = np.nan_to_num(orders['มูลค่า'].to_numpy(dtype=np.float64))
+    valid = (keys >= 0) & ~np.isnat(dates)
+    return keys[valid], months[valid], amounts[valid]
+
+
+class CohortState:
+    """
+    Cohort retention and revenue of customers by first-purchase month
+
+    A customer's cohort is the month of their first order. Two dense
+    matrices are kept over (cohort, months since the first purchase): the
+    number of customers of the cohort ordering in that month and the amount
+    they spent. Per customer only the first and the latest month with an
+    order are kept, so a batch of new orders is added in one vectorized
+    pass over the batch.
+
+    Orders must arrive in month order per customer; add() returns False for
+    a batch with an order older than its customer's latest month, and the
+    state should then be rebuilt over all orders.
+    """
+
+    def __init__(self):
+        self.base = None
+        self.latest = None
+        self._first = np.empty(0, dtype=np.int64)
+        self._last = np.empty(0, dtype=np.int64)
+        self._customers = np.zeros((0, 0), dtype=np.int64)
+        self._revenue = np.zeros((0, 0))
+
+    def _grow(self, n_keys, first_month, last_month):
+        if len(self._first) < n_keys:
+            grow = n_keys - len(self._first)
+            self._first = np.concatenate([self._first, np.full(grow, _NO_FIRST)])
+            self._last = np.concatenate([self._last, np.full(grow, _NO_LAST)])
+        if self.base is None:
+            self.base = first_month
+        self.latest = last_month if self.latest is None else max(self.latest, last_month)
+        size = self.latest - self.base + 1
+        if self._customers.shape[0] < size:
+            pad = ((0, size - self._customers.shape[0]), (0, size - self._customers.shape[1]))
+            self._customers = np.pad(self._customers, pad)
+            self._revenue = np.pad(self._revenue, pad)
+
+    def add(self, orders, sign=1):
+        """
+        Add order rows to the state; sign=-1 only takes their amount out
+
+        Taking out is used to replace an order with its recombined row,
+        which has the same customer and date (see datastore.orders.merge_orders).
+
+        Returns:
+        --------
+        bool
+            False when the rows could not be added in order (nothing changed)
+        """
+        keys, months, amounts = _order_months(orders)
+        if not len(keys):
+            return True
+        if sign < 0:
+            cohort = self._first[keys] - self.base
+            np.add.at(self._revenue, (cohort, months - self._first[keys]), -amounts)
+            return True
+        known = keys < len(self._last)
+        if (self.base is not None and months.min() < self.base) or \
+                (months[known] < self._last[keys[known]]).any():
+            return False
+
+        self._grow(int(keys.max()) + 1, int(months.min()), int(months.max()))
+        np.minimum.at(self._first, keys, months)
+        # Months a customer is seen ordering for the first time
+        pairs = np.unique(keys * (self.latest - self.base + 1) + (months - self.base))
+        pair_keys, pair_months = np.divmod(pairs, self.latest - self.base + 1)
+        active = pair_months + self.base > self._last[pair_keys]
+        np.maximum.at(self._last, keys, months)
+
+        first = self._first - self.base
+        np.add.at(self._customers, (first[pair_keys[active]], pair_months[active] - first[pair_keys[active]]), 1)
+        np.add.at(self._revenue, (first[keys], months - self.base - first[keys]), amounts)
+        return True
+
+    def table(self):
+        """
+        Return the cohort table: one row per cohort and month since the first purchase
+
+        Months after the latest month of the data are left out, so the
+        table is the triangle of observed cells.
+        """
+        if self.base is None:
+            return pd.DataFrame(columns=COHORT_COLUMNS)
+        size = self.latest - self.base + 1
+        cohort, age = np.nonzero(np.add.outer(np.arange(size), np.arange(size)) < size)
+        cohort_size = self._customers[:size, 0]
+        table = pd.DataFrame({
+            'cohort': (self.base + cohort).astype('datetime64[M]').astype('datetime64[ns]'),
+            'months_since': age,
+            'customers': self._customers[cohort, age],
+            'cohort_size': cohort_size[cohort],
+            'retention': self._customers[cohort, age] / np.maximum(cohort_size[cohort], 1),
+            'revenue': self._revenue[cohort, age],
+        })
+        return table[table['cohort_size'] > 0].reset_index(drop=True)
+
+
+def compute(orders):
+    """
+    Return the cohort table of order fact table rows (see CohortState.table)
+
+    Parameters:
+    -----------
+    orders : pandas.DataFrame
+        Order rows with customer_key, order date and sales amount
+
+    Returns:
+    --------
+    pandas.DataFrame
+        cohort (first-purchase month), months_since, customers ordering,
+        cohort_size, retention (customers / cohort_size) and revenue
+    """
+    state = CohortState()
+    state.add(orders)
+    return state.table()
+
+
+def matrix(table, value='retention'):
+    """Pivot a cohort table into a cohort x months-since matrix of one column"""
+    return table.pivot(index='cohort', columns='months_since', values=value)
@@ -0,0 +1,218 @@
+import numpy as np
+import pandas as pd
+
+# Identifiers that make two orders the same customer; the name is only used
+# for orders that have none of them, since different people share names
+IDENTITY_FIELDS = ['รหัสลูกค้า', 'อีเมลลูกค้า', 'เบอร์โทรศัพท์ลูกค้า']
+
+# Attributes of a customer in the dimension table, from the first order seen
+CUSTOMER_FIELDS = ['ชื่อลูกค้า', 'อีเมลลูกค้า', 'เบอร์โทรศัพท์ลูกค้า', 'ที่อยู่ลูกค้า', 'จังหวัด', 'รหัสลูกค้า']
+
+# Surrogate key column; -1 for an order without any customer information
+CUSTOMER_KEY = 'customer_key'
+
+
+def _text(values):
+    text = pd.Series(values, dtype='string').str.strip()
+    return text.mask(text == '')
+
+
+def normalize_code(values):
+    """Return customer codes as text; whole-number floats (codes read with gaps) lose their .0"""
+    values = pd.Series(values)
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype('Int64')
+    return _text(values.astype('string'))
+
+
+def normalize_email(values):
+    """Return emails trimmed and lower-cased; blank values become missing"""
+    return _text(values).str.lower()
+
+
+def normalize_phone(values):
+    """Return phone numbers as digits in the local 0xxxxxxxxx form; too short values become missing"""
+    digits = _text(values).str.replace(r'\D', '', regex=True)
+    digits = digits.mask(digits.str.match(r'^66\d{9}$', na=False), '0' + digits.str[2:])
+    return digits.mask(digits.str.len() < 6)
+
+
+def _block(values, normalize):
+    """Hash a column into block codes, normalizing only its distinct values"""
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    normalized = normalize(pd.Series(uniques, dtype=values.dtype))
+    blocks, distinct = pd.factorize(normalized.to_numpy(dtype=object, na_value=None), use_na_sentinel=True)
+    if not len(blocks):
+        # The column is blank in every record
+        return np.full(len(values), -1, dtype=np.int64), distinct
+    return np.where(codes >= 0, blocks[np.maximum(codes, 0)], -1), distinct
+
+
+def identity_blocks(records):
+    """
+    Return the identity blocks of every record, one per identifier
+
+    Records sharing a block of any identifier are the same customer.
+
+    Returns:
+    --------
+    dict
+        Identifier name -> (block code of every record, -1 when missing;
+        normalized value of every block)
+    """
+    blocks = {}
+    for name, col, normalize in (('code', 'รหัสลูกค้า', normalize_code), ('email', 'อีเมลลูกค้า', normalize_email),
+                                 ('phone', 'เบอร์โทรศัพท์ลูกค้า', normalize_phone)):
+        if col in records.columns:
+            blocks[name] = _block(records[col], normalize)
+    if 'ชื่อลูกค้า' in records.columns:
+        identified = np.zeros(len(records), dtype=bool)
+        for codes, _ in blocks.values():
+            identified |= codes >= 0
+        codes, names = _block(records['ชื่อลูกค้า'], _text)
+        blocks['name'] = (np.where(identified, -1, codes), names)
+    return blocks
+
+
+def _components(codes, n):
+    """Label connected records: records sharing a code in any array get the lowest record position"""
+    labels = np.arange(n)
+    while True:
+        previous = labels
+        for block in codes:
+            has = block >= 0
+            if not has.any():
+                continue
+            lowest = np.full(block.max() + 1, n)
+            np.minimum.at(lowest, block[has], labels[has])
+            labels = np.where(has, np.minimum(labels, lowest[np.maximum(block, 0)]), labels)
+        # Labels are record positions, so following them shortens the chains
+        labels = labels[labels]
+        if (labels == previous).all():
+            return labels
+
+
+class CustomerDimension:
+    """
+    Customer dimension with integer surrogate keys and an identity index
+
+    Orders are resolved to customers by hash-blocking on the customer code,
+    normalized email and normalized phone number: orders sharing any of
+    them are one customer. The identity index maps every identifier seen to
+    its customer key, so appended orders are resolved against it without
+    revisiting old orders. When a new order links customers that had been
+    kept apart, they are merged into the lower key and the merges counter
+    goes up, telling the caller to remap the keys it stored (see canonical()).
+    """
+
+    def __init__(self):
+        self._parent = np.empty(0, dtype=np.int32)
+        self._index = {}
+        self._rows = pd.DataFrame(columns=[CUSTOMER_KEY] + CUSTOMER_FIELDS)
+        self.merges = 0
+
+    def __len__(self):
+        return len(self._parent)
+
+    def canonical(self, keys):
+        """Map keys, including keys merged into others, to their current key; -1 stays -1"""
+        keys = np.asarray(keys)
+        return np.where(keys >= 0, self._parent[np.maximum(keys, 0)], -1).astype(np.int32)
+
+    def resolve(self, records):
+        """
+        Return the customer key of every record, adding new customers
+
+        Parameters:
+        -----------
+        records : pandas.DataFrame
+            Orders (or lines) with the customer fields that exist
+
+        Returns:
+        --------
+        numpy.ndarray
+            int32 customer key of every record, -1 when it has no identifier
+        """
+        n = len(records)
+        blocks = identity_blocks(records)
+        labels = _components([codes for codes, _ in blocks.values()], n)
+        has_identity = np.zeros(n, dtype=bool)
+        for codes, _ in blocks.values():
+            has_identity |= codes >= 0
+
+        # Keys already known for any identifier of a record, looked up once
+        # per distinct value
+        found_records, found_keys = [], []
+        for name, (codes, values) in blocks.items():
+            if name not in self._index or not len(values):
+                continue
+            known = self._index[name].reindex(values).to_numpy()
+            hit = codes >= 0
+            hit[hit] = ~np.isnan(known[codes[hit]])
+            found_records.append(np.flatnonzero(hit))
+            found_keys.append(self.canonical(known[codes[hit]].astype(np.int64)))
+        found_records = np.concatenate(found_records) if found_records else np.empty(0, dtype=np.int64)
+        found_keys = np.concatenate(found_keys) if found_keys else np.empty(0, dtype=np.int32)
+        component_key = np.full(n, -1, dtype=np.int64)
+        if len(found_keys):
+            lowest = np.full(n, np.iinfo(np.int64).max)
+            np.minimum.at(lowest, labels[found_records], found_keys)
+            component_key[lowest < np.iinfo(np.int64).max] = lowest[lowest < np.iinfo(np.int64).max]
+            # A component reaching several known customers merges them
+            merged = found_keys != component_key[labels[found_records]]
+            if merged.any():
+                self._merge(found_keys[merged], component_key[labels[found_records[merged]]])
+                component_key = np.where(component_key >= 0, self.canonical(np.maximum(component_key, 0)), -1)
+
+        # Components without a known customer become new customers
+        roots = np.flatnonzero((labels == np.arange(n)) & has_identity & (component_key < 0))
+        component_key[roots] = len(self._parent) + np.arange(len(roots))
+        self._parent = np.concatenate([self._parent, np.arange(len(self._parent), len(self._parent) + len(roots),
+                                                               dtype=np.int32)])
+        fields = [col for col in CUSTOMER_FIELDS if col in records.columns]
+        new_rows = records.iloc[roots][fields].reset_index(drop=True)
+        new_rows.insert(0, CUSTOMER_KEY, component_key[roots])
+        self._rows = pd.concat([self._rows, new_rows], ignore_index=True) if len(self._rows) else new_rows
+
+        keys = np.where(has_identity, component_key[labels], -1).astype(np.int32)
+        for name, (codes, values) in blocks.items():
+            self._register(name, codes, values, keys)
+        return keys
+
+    def _merge(self, keys, into):
+        self.merges += 1
+        target = self._parent.copy()
+        np.minimum.at(target, keys, into.astype(np.int32))
+        # Follow the merges until every key points at its final customer
+        while True:
+            following = target[target]
+            if (following == target).all():
+                break
+            target = following
+        self._parent = target.astype(np.int32)
+
+    def _register(self, name, codes, values, keys):
+        present = (codes >= 0) & (keys >= 0)
+        block_keys = np.full(len(values), -1, dtype=np.int32)
+        # Every record of a block has the same key
+        block_keys[codes[present]] = keys[present]
+        entries = pd.Series(block_keys, index=pd.Index(values, dtype=object))[block_keys >= 0]
+        if name in self._index:
+            entries = entries[~entries.index.isin(self._index[name].index)]
+            entries = pd.concat([self._index[name], entries])
+        self._index[name] = entries
+
+    def names(self):
+        """Return the customer name of every key (merged keys take their customer's name)"""
+        names = self._rows.set_index(CUSTOMER_KEY)['ชื่อลูกค้า'] if 'ชื่อลูกค้า' in self._rows.columns else None
+        if names is None or not len(self._parent):
+            return np.full(len(self._parent), None, dtype=object)
+        return names.reindex(self._parent).to_numpy(dtype=object)
+
+    def table(self):
+        """Return the dimension table: one row per current customer key"""
+        rows = self._rows[self._parent[self._rows[CUSTOMER_KEY].to_numpy(dtype=np.int64)]
+                          == self._rows[CUSTOMER_KEY].to_numpy()]
+        rows = rows.reset_index(drop=True)
+        rows[CUSTOMER_KEY] = rows[CUSTOMER_KEY].astype(np.int32)
+        return rows
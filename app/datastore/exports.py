@@ -0,0 +1,227 @@
+import os
+import glob
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from datastore import ingest
+
+# Common schema of the sales exports (the column order of the platform export)
+SALES_COLUMNS = [
+    'Unnamed: 0', '#', 'ประเภท', 'รายการ', 'สร้างโดย', 'ชื่อลูกค้า', 'รหัสลูกค้า', 'อีเมลลูกค้า',
+    'เบอร์โทรศัพท์ลูกค้า', 'ที่อยู่ลูกค้า', 'เลขผู้เสียภาษี', 'อ้างอิง', 'ช่องทางการขาย', 'วันที่ทำรายการ',
+    'ส่วนลด', 'รายได้จาก Platform', 'ค่าส่ง (ที่เรียกเก็บจากลูกค้า)', 'มูลค่ารวมก่อนภาษี', 'ภาษีมูลค่าเพิ่ม',
+    'วันส่งสินค้า', 'Tracking No', 'ช่องทางจัดส่ง', 'ชื่อผู้รับ', 'เบอร์โทรศัพท์ผู้รับ', 'อีเมลผู้รับ',
+    'ที่อยู่/จัดส่ง', 'รหัสไปรษณีย์', 'จังหวัด', 'อำเภอ/เขต', 'ตำบล/แขวง', 'มูลค่า', 'หมายเหตุ', 'Tag',
+    'สถานะรายการ', 'คลัง/สาขา', 'สถานะการชำระเงิน', 'ใบกำกับภาษี', 'ช่องทางการชำระเงิน',
+    'จำนวนเงินที่ชำระ', 'วันที่ชำระเงิน', 'Payment ID', 'รหัสสินค้า', 'ชื่อสินค้า', 'จำนวน',
+    'ราคาต่อหน่วย', 'ส่วนลดต่อหน่วย', 'ราคารวม', 'ล็อต', 'หมวดหมู่'
+]
+
+# Export file types picked up from the data directory
+EXPORT_PATTERNS = ['*.xlsx', '*.xls']
+
+# Directory (inside the cache directory) holding the unified store
+STORE_DIR_NAME = 'exports'
+
+
+def discover_exports(data_dir, patterns=None):
+    """
+    Return every sales export in the data directory, sorted by file name
+
+    Excel lock files (~$...) are skipped.
+    """
+    paths = set()
+    for pattern in patterns or EXPORT_PATTERNS:
+        for path in glob.glob(os.path.join(data_dir, pattern)):
+            if not os.path.basename(path).startswith('~$'):
+                paths.add(path)
+    return sorted(paths)
+
+
+def normalize_export(df):
+    """
+    Bring a raw export into the common 49-column schema
+
+    The unnamed first column is renamed to "Unnamed: 0", missing columns are
+    added as empty and columns outside the schema are dropped.
+    """
+    df = df.rename(columns=lambda name: name.strip() if isinstance(name, str) else name)
+    first = df.columns[0] if len(df.columns) else None
+    if first is not None and first not in SALES_COLUMNS and str(first).startswith('Unnamed'):
+        df = df.rename(columns={first: 'Unnamed: 0'})
+    return df.reindex(columns=SALES_COLUMNS)
+
+
+def partition_name(source_path):
+    """Return the partition file name for an export"""
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    ext = os.path.splitext(source_path)[1].lstrip('.').lower()
+    return f'source={stem}.{ext}.parquet'
+
+
+def convert_export(source_path, store_dir):
+    """
+    Parse one export into a typed partition of the unified store
+
+    Runs in a worker process; only the small summary is sent back.
+
+    Returns:
+    --------
+    dict
+        Partition file name, row count and the source signature
+    """
+    df = ingest.apply_schema(normalize_export(ingest.read_source(source_path)))
+    name = partition_name(source_path)
+    tmp_path = os.path.join(store_dir, name + '.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(store_dir, name))
+    return {'file': name, 'rows': len(df), **ingest.source_signature(source_path)}
+
+
+def _manifest_path(store_dir):
+    return os.path.join(store_dir, 'manifest.json')
+
+
+def read_manifest(store_dir):
+    """Return the unified store manifest, mapping export file names to partitions"""
+    try:
+        with open(_manifest_path(store_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def ingest_exports(data_dir, store_dir=None, patterns=None, max_workers=None):
+    """
+    Convert every export in the data directory into the unified store, in parallel
+
+    Exports are parsed in a process pool, one partition per export. Exports
+    whose mtime and size match the manifest are skipped, and partitions of
+    exports that no longer exist are removed.
+
+    Parameters:
+    -----------
+    data_dir : str
+        Directory holding the exports
+    store_dir : str, optional
+        Directory of the unified store (defaults to data/.cache/exports)
+    patterns : list of str, optional
+        Glob patterns of the exports to ingest (defaults to EXPORT_PATTERNS)
+    max_workers : int, optional
+        Size of the process pool (defaults to the number of CPUs)
+
+    Returns:
+    --------
+    dict
+        The new manifest
+    """
+    if store_dir is None:
+        store_dir = os.path.join(data_dir, ingest.CACHE_DIR_NAME, STORE_DIR_NAME)
+    os.makedirs(store_dir, exist_ok=True)
+
+    previous = read_manifest(store_dir)
+    manifest = {}
+    pending = []
+    for path in discover_exports(data_dir, patterns):
+        name = os.path.basename(path)
+        entry = previous.get(name)
+        signature = ingest.source_signature(path)
+        if (entry is not None and entry['mtime'] == signature['mtime'] and entry['size'] == signature['size']
+                and os.path.exists(os.path.join(store_dir, entry['file']))):
+            manifest[name] = entry
+        else:
+            pending.append(path)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            for path, entry in zip(pending, pool.map(convert_export, pending, [store_dir] * len(pending))):
+                manifest[os.path.basename(path)] = entry
+
+    for name, entry in previous.items():
+        if name not in manifest and os.path.exists(os.path.join(store_dir, entry['file'])):
+            os.remove(os.path.join(store_dir, entry['file']))
+
+    tmp_path = _manifest_path(store_dir) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, _manifest_path(store_dir))
+    return manifest
+
+
+def load_exports(store_dir, names=None):
+    """Read the partitions of the unified store (all, or the exports in names) into one typed frame"""
+    manifest = read_manifest(store_dir)
+    frames = [pd.read_parquet(os.path.join(store_dir, entry['file'])) for name, entry in sorted(manifest.items())
+              if names is None or name in names]
+    return ingest.concat_sales(frames)
+
+
+def _signatures(paths):
+    signatures = {}
+    for path in paths:
+        signature = ingest.source_signature(path)
+        signatures[os.path.basename(path)] = [signature['mtime'], signature['size']]
+    return signatures
+
+
+def exports_version(data_dir, patterns=None):
+    """
+    Return a string identifying the current exports of a data directory
+
+    Only the names, mtimes and sizes are checked, so it is cheap enough to
+    call on every rerun. A directory without exports has a version too, so
+    it is not synced again on every rerun; None when it cannot be read.
+    """
+    try:
+        signatures = _signatures(discover_exports(data_dir, patterns))
+    except OSError:
+        return None
+    return hashlib.sha1(json.dumps(sorted(signatures.items())).encode()).hexdigest()
+
+
+def sync_exports(data_dir, store_dir=None, watermark=None, patterns=None, max_workers=None, batches=False):
+    """
+    Bring the unified store up to date with the exports and read it
+
+    The counterpart of ingest.sync_typed_sales for a directory of exports.
+    Exports are converted with ingest_exports; when every export read at
+    the watermark is unchanged, only the exports added since are returned,
+    as an increment. Any other change returns every row.
+
+    Parameters:
+    -----------
+    data_dir : str
+        Directory holding the exports
+    store_dir : str, optional
+        Directory of the unified store (defaults to data/.cache/exports)
+    watermark : dict, optional
+        Watermark returned by an earlier call
+    batches : bool
+        Return every row as an iterator of frames (see ingest.iter_parquet)
+        instead of one frame; increments are still one frame
+
+    Returns:
+    --------
+    tuple of (pandas.DataFrame, dict, bool)
+        The rows, the new watermark, and whether the rows are an increment
+        to append to the data read at `watermark`
+    """
+    if store_dir is None:
+        store_dir = os.path.join(data_dir, ingest.CACHE_DIR_NAME, STORE_DIR_NAME)
+    manifest = ingest_exports(data_dir, store_dir, patterns, max_workers)
+    signatures = {name: [entry['mtime'], entry['size']] for name, entry in manifest.items()}
+    rows = sum(entry['rows'] for entry in manifest.values())
+
+    previous = watermark.get('exports') if watermark is not None else None
+    if previous is not None and all(signatures.get(name) == signature for name, signature in previous.items()):
+        added = [name for name in signatures if name not in previous]
+        new_watermark = {'generation': watermark['generation'], 'rows': rows, 'exports': signatures}
+        return load_exports(store_dir, added), new_watermark, True
+
+    generation = hashlib.sha1(json.dumps(sorted(signatures.items())).encode()).hexdigest()
+    new_watermark = {'generation': generation, 'rows': rows, 'exports': signatures}
+    if batches:
+        paths = [os.path.join(store_dir, entry['file']) for _, entry in sorted(manifest.items())]
+        return ingest.iter_parquet(paths), new_watermark, False
+    return load_exports(store_dir), new_watermark, False
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from datastore import shared
+
+# Sidebar value meaning "no filter"
+ALL = 'All'
+
+
+class FilterIndex:
+    """
+    Index over the sales data answering the sidebar filters without full scans
+
+    Rows are kept in date order so a date range is found with two binary
+    searches. For every category and channel there is a precomputed row bitmap
+    in the same order, so applying a filter is a slice plus a bitwise AND.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Data to index (the sales data or any frame with the same columns)
+    date_col, category_col, channel_col : str
+        Columns used for the date range, category and channel filters
+    """
+
+    def __init__(self, df, date_col='วันที่ทำรายการ', category_col='หมวดหมู่', channel_col='ช่องทางการขาย'):
+        self.df = df
+        self.columns = {'category': category_col, 'channel': channel_col}
+
+        dates = df[date_col].to_numpy(dtype='datetime64[ns]')
+        # Rows without a valid date never match a date range
+        valid = np.flatnonzero(~np.isnat(dates))
+        self._order = valid[np.argsort(dates[valid], kind='stable')]
+        self._sorted_dates = dates[self._order]
+
+        self._bitmaps = {}
+        for key, col in self.columns.items():
+            if col not in df.columns:
+                continue
+            codes, uniques = pd.factorize(df[col].to_numpy()[self._order])
+            self._bitmaps[key] = {value: codes == i for i, value in enumerate(uniques)}
+
+    @property
+    def date_range(self):
+        """Return the (first, last) order dates as Timestamps, or (None, None)"""
+        if len(self._sorted_dates) == 0:
+            return None, None
+        return pd.Timestamp(self._sorted_dates[0]), pd.Timestamp(self._sorted_dates[-1])
+
+    def values(self, key):
+        """Return the sorted distinct values available for a filter ('category' or 'channel')"""
+        return sorted(self._bitmaps.get(key, {}))
+
+    def positions(self, start_date=None, end_date=None, category=ALL, channel=ALL):
+        """
+        Return the row positions matching the filters, in original row order
+
+        Parameters:
+        -----------
+        start_date, end_date : date-like, optional
+            Inclusive date range; None leaves that side open
+        category, channel : str
+            Selected value, or ALL for no filter
+
+        Returns:
+        --------
+        numpy.ndarray
+            Positions of the matching rows in the indexed frame
+        """
+        lo, hi = 0, len(self._sorted_dates)
+        if start_date is not None:
+            start = np.datetime64(pd.Timestamp(start_date).normalize(), 'ns')
+            lo = np.searchsorted(self._sorted_dates, start, side='left')
+        if end_date is not None:
+            end = np.datetime64(pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1), 'ns')
+            hi = np.searchsorted(self._sorted_dates, end, side='left')
+        hi = max(lo, hi)
+
+        mask = None
+        for key, value in (('category', category), ('channel', channel)):
+            if value is None or value == ALL or key not in self._bitmaps:
+                continue
+            bitmap = self._bitmaps[key].get(value)
+            if bitmap is None:
+                return np.empty(0, dtype=np.intp)
+            mask = bitmap[lo:hi] if mask is None else mask & bitmap[lo:hi]
+
+        window = self._order[lo:hi]
+        if mask is not None:
+            window = window[mask]
+        return np.sort(window)
+
+    def select(self, start_date=None, end_date=None, category=ALL, channel=ALL):
+        """
+        Return the rows of the indexed frame matching the filters
+
+        When no filter narrows the data, the indexed frame itself is returned
+        instead of a copy. The rows of a frozen frame come back frozen, with
+        a version made of the frame's version and the filters.
+        """
+        positions = self.positions(start_date, end_date, category, channel)
+        if len(positions) == len(self.df):
+            return self.df
+        version = shared.frame_version(self.df)
+        if version is None:
+            return self.df.take(positions)
+        return shared.freeze_frame(self.df.take(positions),
+                                   version=(version, 'select', start_date, end_date, category, channel))
@@ -0,0 +1,491 @@
+import io
+import os
+import json
+import uuid
+import hashlib
+import numpy as np
+import pandas as pd
+
+# Name of the directory (inside the data directory) that holds the typed columnar cache
+CACHE_DIR_NAME = '.cache'
+
+# Columns exported as dd/mm/yyyy strings
+DATE_COLUMNS = ['วันที่ทำรายการ', 'วันส่งสินค้า', 'วันที่ชำระเงิน']
+
+# Low-cardinality text columns stored as categoricals
+CATEGORY_COLUMNS = [
+    'ช่องทางการขาย', 'จังหวัด', 'หมวดหมู่', 'สถานะรายการ',
+    'สถานะการชำระเงิน', 'ช่องทางการชำระเงิน', 'ช่องทางจัดส่ง'
+]
+
+# Number of bytes before the ingest watermark that must be unchanged for new
+# lines to be treated as an append
+FINGERPRINT_BYTES = 1 << 16
+
+# Rows per frame when cached rows are read in batches (see iter_parquet)
+BATCH_ROWS = 200_000
+
+# Identifier columns that look numeric but must keep their leading zeros
+STRING_COLUMNS = ['รายการ', 'เบอร์โทรศัพท์ลูกค้า', 'เบอร์โทรศัพท์ผู้รับ', 'รหัสไปรษณีย์']
+
+
+def resolve_data_path(filename):
+    """
+    Return the path of a file in the data directory
+
+    The app can be started from the repository root or from the app directory,
+    so both locations are checked.
+    """
+    # When running from root directory
+    file_path = os.path.join('data', filename)
+    if os.path.exists(file_path):
+        return file_path
+    # When running from the app directory
+    return os.path.join('..', 'data', filename)
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Return the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_signature(source_path):
+    """Return the cheap (mtime, size) signature of a source file"""
+    stat = os.stat(source_path)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def data_version(source_path):
+    """
+    Return a string identifying the current version of a source file
+
+    Used as the cache key for everything derived from the sales data, so
+    derived frames are rebuilt exactly when the export changes.
+    """
+    try:
+        signature = source_signature(source_path)
+    except OSError:
+        return None
+    return f"{signature['mtime']:.6f}-{signature['size']}"
+
+
+def read_source(source_path):
+    """
+    Parse a raw CSV or XLSX sales export
+
+    Parameters:
+    -----------
+    source_path : str
+        Path to a .csv, .xlsx or .xls export
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Untyped export exactly as stored in the file
+    """
+    dtype = {col: str for col in STRING_COLUMNS}
+    if source_path.lower().endswith(('.xlsx', '.xls')):
+        return read_xlsx(source_path, dtype=dtype)
+    return pd.read_csv(source_path, dtype=dtype)
+
+
+def _identifier_text(value):
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def read_xlsx(source_path, dtype=None):
+    """
+    Read the first sheet of an Excel export with a fast read-only reader
+
+    Uses the Rust-based calamine engine when python-calamine is installed and
+    falls back to streaming the sheet with openpyxl in read-only mode, which
+    is still far faster than the default openpyxl reader.
+
+    Parameters:
+    -----------
+    source_path : str
+        Path to the .xlsx or .xls file
+    dtype : dict, optional
+        Columns to read as str
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Untyped sheet contents with the first row as header
+    """
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        return pd.read_excel(source_path, engine='calamine', dtype=dtype)
+
+    import openpyxl
+    workbook = openpyxl.load_workbook(source_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        columns = [name if name is not None else f'Unnamed: {i}' for i, name in enumerate(header)]
+        df = pd.DataFrame.from_records(list(rows), columns=columns)
+    finally:
+        workbook.close()
+    for col in (dtype or {}):
+        if col in df.columns:
+            df[col] = df[col].map(_identifier_text)
+    return df
+
+
+def parse_dates(values):
+    """Parse dd/mm/yyyy dates, with or without an hh:mm time, into datetimes"""
+    parsed = pd.to_datetime(values, format='%d/%m/%Y', errors='coerce')
+    # Platform exports add the time to some columns (e.g. payment date)
+    missing = parsed.isna() & values.notna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(values[missing], format='%d/%m/%Y %H:%M', errors='coerce')
+    return parsed
+
+
+def apply_schema(df):
+    """
+    Convert a raw export into the typed sales schema
+
+    Dates are parsed from dd/mm/yyyy, low-cardinality text columns become
+    categoricals and integer columns are downcast to the smallest integer type.
+    Float columns are left as float64 so that revenue sums keep full precision.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Raw export as returned by read_source
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Typed copy of the export
+    """
+    df = df.copy()
+
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = parse_dates(df[col])
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    return df
+
+
+def concat_sales(frames):
+    """
+    Concatenate typed sales frames in order
+
+    Categorical columns whose categories differ between frames are turned
+    back into categoricals over the union of the categories.
+    """
+    frames = [df for df in frames if df is not None and len(df.columns) > 0]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    combined = pd.concat(frames, ignore_index=True)
+    for col in CATEGORY_COLUMNS:
+        if col in combined.columns and not isinstance(combined[col].dtype, pd.CategoricalDtype):
+            combined[col] = combined[col].astype('category')
+    return combined
+
+
+def _cache_paths(source_path, cache_dir):
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(source_path) or '.', CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return cache_dir, os.path.join(cache_dir, stem), os.path.join(cache_dir, f'{stem}.json')
+
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(manifest_path, manifest):
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def _write_part(parts_dir, index, df):
+    name = f'part-{index:05d}.parquet'
+    # Write to a temporary file first so concurrent sessions never read a partial file
+    tmp_path = os.path.join(parts_dir, name + '.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(parts_dir, name))
+    return name
+
+
+def _is_csv(source_path):
+    return source_path.lower().endswith('.csv')
+
+
+def _last_line_end(source_path, size):
+    """Return the offset just past the last newline in the file (0 if there is none)"""
+    with open(source_path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - FINGERPRINT_BYTES)
+            f.seek(start)
+            newline = f.read(position - start).rfind(b'\n')
+            if newline >= 0:
+                return start + newline + 1
+            position = start
+    return 0
+
+
+def _fingerprint(source_path, offset):
+    """Hash the header line and the bytes just before offset"""
+    with open(source_path, 'rb') as f:
+        header = f.readline()
+        f.seek(max(0, offset - FINGERPRINT_BYTES))
+        tail = f.read(min(offset, FINGERPRINT_BYTES))
+    return {
+        'header': hashlib.sha256(header).hexdigest(),
+        'tail': hashlib.sha256(tail).hexdigest(),
+    }
+
+
+def _rows_digest(df):
+    """
+    Hash the values of typed rows
+
+    Values are hashed as Python objects, so the digest does not depend on
+    the integer widths apply_schema picks for a given set of rows.
+    """
+    digest = hashlib.sha256(repr(list(df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df.astype(object), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _rebuild(source_path, parts_dir, signature, df=None):
+    """Parse the whole export (unless already parsed into df) into a single new part"""
+    if df is None:
+        df = apply_schema(read_source(source_path))
+
+    os.makedirs(parts_dir, exist_ok=True)
+    for name in os.listdir(parts_dir):
+        os.remove(os.path.join(parts_dir, name))
+    name = _write_part(parts_dir, 0, df)
+
+    offset = _last_line_end(source_path, signature['size']) if _is_csv(source_path) else None
+    return {
+        **signature,
+        'sha256': file_sha256(source_path),
+        'generation': uuid.uuid4().hex,
+        'rows': len(df),
+        'parts': [{'file': name, 'start': 0, 'rows': len(df)}],
+        'offset': offset,
+        'fingerprint': _fingerprint(source_path, offset) if offset is not None else None,
+        'row_digest': _rows_digest(df) if offset is None else None,
+    }
+
+
+def _is_append(source_path, manifest, signature):
+    """Check whether the export only grew by lines appended after the watermark"""
+    offset = manifest.get('offset')
+    if offset is None or signature['size'] <= manifest['size']:
+        return False
+    return _fingerprint(source_path, offset) == manifest['fingerprint']
+
+
+def _append(source_path, parts_dir, manifest, signature):
+    """Parse only the lines appended after the watermark and store them as a new part"""
+    offset = manifest['offset']
+    end = _last_line_end(source_path, signature['size'])
+    # Hashed again so a later same-size edit is never taken for a touch
+    manifest = {**manifest, **signature, 'sha256': file_sha256(source_path)}
+    if end <= offset:
+        # Only a partial line was written so far; pick it up on the next sync
+        return manifest
+
+    with open(source_path, 'rb') as f:
+        header = f.readline()
+        f.seek(offset)
+        appended = f.read(end - offset)
+    dtype = {col: str for col in STRING_COLUMNS}
+    delta = apply_schema(pd.read_csv(io.BytesIO(header + appended), dtype=dtype))
+    # Every line after the watermark is new, even when its รายการ/# key was
+    # seen before: # numbers orders, not lines, and an order can list the
+    # same product twice, so dropping repeated keys would lose real lines
+
+    manifest['offset'] = end
+    manifest['fingerprint'] = _fingerprint(source_path, end)
+    if delta.empty:
+        return manifest
+
+    name = _write_part(parts_dir, len(manifest['parts']), delta)
+    manifest['parts'] = manifest['parts'] + [{'file': name, 'start': manifest['rows'], 'rows': len(delta)}]
+    manifest['rows'] += len(delta)
+    return manifest
+
+
+def _append_rows(source_path, parts_dir, manifest, signature):
+    """
+    Store the rows an Excel export gained after the rows already cached
+
+    An xlsx file is a zip archive, so appended rows have no byte offset and
+    the whole sheet is parsed again. When the rows already cached are still
+    its first rows (same digest), only the rows after them are written as a
+    new part and returned as an increment; otherwise the parsed sheet
+    replaces the cache.
+    """
+    df = apply_schema(read_source(source_path))
+    rows = manifest['rows']
+    if len(df) < rows or _rows_digest(df.iloc[:rows]) != manifest.get('row_digest'):
+        return _rebuild(source_path, parts_dir, signature, df)
+
+    manifest = {**manifest, **signature, 'sha256': file_sha256(source_path), 'row_digest': _rows_digest(df)}
+    if len(df) > rows:
+        name = _write_part(parts_dir, len(manifest['parts']), df.iloc[rows:].reset_index(drop=True))
+        manifest['parts'] = manifest['parts'] + [{'file': name, 'start': rows, 'rows': len(df) - rows}]
+        manifest['rows'] = len(df)
+    return manifest
+
+
+def _read_parts(parts_dir, manifest, since_row=0):
+    frames = []
+    for part in manifest['parts']:
+        if part['start'] + part['rows'] <= since_row:
+            continue
+        df = pd.read_parquet(os.path.join(parts_dir, part['file']))
+        if part['start'] < since_row:
+            df = df.iloc[since_row - part['start']:]
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame()
+    return concat_sales(frames).reset_index(drop=True)
+
+
+def iter_parquet(paths, batch_rows=None):
+    """
+    Yield the rows of Parquet files in order, as typed frames of at most batch_rows rows
+
+    Only one batch is read into memory at a time; batch_rows defaults to BATCH_ROWS.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows or BATCH_ROWS):
+            # The table keeps the pandas metadata, so categoricals and dates come back typed
+            yield pa.Table.from_batches([batch]).to_pandas()
+
+
+def _parts_exist(manifest, parts_dir):
+    if manifest is None or 'parts' not in manifest:
+        return False
+    return all(os.path.exists(os.path.join(parts_dir, part['file'])) for part in manifest['parts'])
+
+
+def sync_typed_sales(source_path, cache_dir=None, watermark=None, batches=False):
+    """
+    Bring the typed columnar cache up to date with the export and read it
+
+    The export is stored as Parquet parts next to a manifest that records the
+    source file's mtime, size and SHA-256 plus an ingest watermark: the byte
+    offset and row count already parsed and a fingerprint of the bytes just
+    before the offset. When a CSV export only grew by appended lines, only
+    those lines are parsed. An XLSX export has no byte offsets, so it is
+    parsed whole, but when its first rows are the rows already cached (row
+    digest) only the rows after them are stored and returned. Any other
+    change rebuilds the cache from scratch.
+
+    Rows are not deduplicated by key: in platform exports # numbers orders
+    rather than lines, is not in export order, and one order can list the
+    same product twice.
+
+    Parameters:
+    -----------
+    source_path : str
+        Path to the CSV or XLSX sales export
+    cache_dir : str, optional
+        Directory for the cache files (defaults to data/.cache)
+    watermark : dict, optional
+        Watermark returned by an earlier call. If the cache has only grown
+        since then, only the rows added after it are returned.
+    batches : bool
+        Return every row as an iterator of frames of at most BATCH_ROWS
+        rows (see iter_parquet) instead of one frame; increments are
+        still one frame
+
+    Returns:
+    --------
+    tuple of (pandas.DataFrame, dict, bool)
+        The rows, the new watermark, and whether the rows are an increment
+        to append to the data read at `watermark` (False means the frame
+        holds every row)
+    """
+    cache_dir, parts_dir, manifest_path = _cache_paths(source_path, cache_dir)
+    signature = source_signature(source_path)
+    manifest = _read_manifest(manifest_path)
+
+    if not _parts_exist(manifest, parts_dir):
+        manifest = _rebuild(source_path, parts_dir, signature)
+        _write_manifest(manifest_path, manifest)
+    elif manifest['mtime'] != signature['mtime'] or manifest['size'] != signature['size']:
+        if _is_append(source_path, manifest, signature):
+            manifest = _append(source_path, parts_dir, manifest, signature)
+        elif (manifest.get('size') == signature['size'] and manifest.get('sha256') is not None
+              and manifest['sha256'] == file_sha256(source_path)):
+            # The file was touched but its content is unchanged
+            manifest = {**manifest, **signature}
+        elif manifest.get('row_digest') is not None:
+            manifest = _append_rows(source_path, parts_dir, manifest, signature)
+        else:
+            manifest = _rebuild(source_path, parts_dir, signature)
+        _write_manifest(manifest_path, manifest)
+
+    new_watermark = {'generation': manifest['generation'], 'rows': manifest['rows']}
+    if (watermark is not None and watermark.get('generation') == manifest['generation']
+            and watermark.get('rows', 0) <= manifest['rows']):
+        return _read_parts(parts_dir, manifest, since_row=watermark['rows']), new_watermark, True
+    if batches:
+        return iter_parquet([os.path.join(parts_dir, part['file']) for part in manifest['parts']]), new_watermark, False
+    return _read_parts(parts_dir, manifest), new_watermark, False
+
+
+def load_typed_sales(source_path, cache_dir=None):
+    """
+    Load the sales export through the typed columnar cache
+
+    The export is only parsed when its content changes, and appended lines
+    are parsed on their own (see sync_typed_sales).
+
+    Parameters:
+    -----------
+    source_path : str
+        Path to the CSV or XLSX sales export
+    cache_dir : str, optional
+        Directory for the cache files (defaults to data/.cache)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Typed sales data
+    """
+    df, _, _ = sync_typed_sales(source_path, cache_dir)
+    return df
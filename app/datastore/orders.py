@@ -0,0 +1,73 @@
+import pandas as pd
+
+# Order number; exports list the lines of an order together under it
+ORDER_KEY = 'รายการ'
+
+# Order-level fields, taken from the first line of an order that has them
+# (exports only fill some of them on the first line)
+ORDER_FIELDS = [
+    'วันที่ทำรายการ', 'ช่องทางการขาย', 'รหัสลูกค้า', 'ชื่อลูกค้า', 'จังหวัด',
+    'สถานะรายการ', 'ส่วนลด', 'ค่าส่ง (ที่เรียกเก็บจากลูกค้า)', 'ช่องทางจัดส่ง', 'วันส่งสินค้า',
+    'สถานะการชำระเงิน', 'ช่องทางการชำระเงิน', 'จำนวนเงินที่ชำระ', 'วันที่ชำระเงิน',
+]
+
+# Line measures summed per order
+ORDER_MEASURES = ['มูลค่า', 'จำนวน']
+
+
+def build_orders(lines, fields=ORDER_FIELDS):
+    """
+    Build the order fact table: one row per order number
+
+    Parameters:
+    -----------
+    lines : pandas.DataFrame
+        Enriched sales lines
+    fields : list of str
+        Order-level fields to take from the first line that has them
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The order number, the order-level fields, the summed sales amount
+        (มูลค่า) and units (จำนวน) and the line count (lines), in the order
+        the orders first appear
+    """
+    fields = [col for col in fields if col in lines.columns]
+    measures = [col for col in ORDER_MEASURES if col in lines.columns]
+    if ORDER_KEY not in lines.columns:
+        return pd.DataFrame(columns=[ORDER_KEY] + fields + measures + ['lines'])
+
+    groups = lines.groupby(ORDER_KEY, sort=False, observed=True)
+    orders = groups[fields].first()
+    for col in measures:
+        orders[col] = groups[col].sum()
+    orders['lines'] = groups.size()
+    return orders.reset_index()
+
+
+def merge_orders(orders, delta):
+    """
+    Merge the orders of newly ingested lines into the order fact table
+
+    Only an order continuing across the boundary is recombined; the other
+    new orders are appended after it.
+    """
+    if orders is None or orders.empty:
+        return delta
+    if delta.empty:
+        return orders
+    continued = delta[ORDER_KEY].isin(orders[ORDER_KEY])
+    if not continued.any():
+        return pd.concat([orders, delta], ignore_index=True)
+
+    existing = orders[ORDER_KEY].isin(delta.loc[continued, ORDER_KEY])
+    both = pd.concat([orders[existing], delta[continued]], ignore_index=True)
+    groups = both.groupby(ORDER_KEY, sort=False, observed=True)
+    measures = [col for col in ORDER_MEASURES + ['lines'] if col in both.columns]
+    merged = groups[[col for col in both.columns if col != ORDER_KEY and col not in measures]].first()
+    for col in measures:
+        merged[col] = groups[col].sum()
+    merged = merged.reset_index()[list(orders.columns)]
+    return pd.concat([orders[~existing], merged, delta[~continued]], ignore_index=True)
+
@@ -0,0 +1,139 @@
+import os
+import json
+import shutil
+import pandas as pd
+from datastore import ingest
+
+# Column holding the month (yyyy-mm) of the order date, added by preprocess.enrich_sales
+PARTITION_COLUMN = 'month_year'
+
+# Partition key of the lines without an order date; never part of a date range
+UNDATED = 'undated'
+
+
+def partition_dir(source_path, cache_dir=None):
+    """Return the directory of the month partitions of a sales export, or of a directory of exports"""
+    if os.path.isdir(source_path):
+        # The exports of a data directory are cached inside it (see datastore.exports)
+        if cache_dir is None:
+            cache_dir = os.path.join(source_path, ingest.CACHE_DIR_NAME)
+        return os.path.join(cache_dir, 'exports-months')
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(source_path) or '.', ingest.CACHE_DIR_NAME)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(cache_dir, f'{stem}-months')
+
+
+def _manifest_path(store_dir):
+    return os.path.join(store_dir, 'manifest.json')
+
+
+def read_manifest(store_dir):
+    """Return the partition manifest, or None if there is no usable one"""
+    try:
+        with open(_manifest_path(store_dir), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_manifest(store_dir, manifest):
+    """Atomically replace the partition manifest"""
+    tmp_path = _manifest_path(store_dir) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, _manifest_path(store_dir))
+
+
+def _split(df):
+    """Yield (partition key, lines) for every month present in df"""
+    if PARTITION_COLUMN not in df.columns:
+        yield UNDATED, df.reset_index(drop=True)
+        return
+    keys = df[PARTITION_COLUMN].fillna(UNDATED)
+    for key, lines in df.groupby(keys, sort=True):
+        yield key, lines.reset_index(drop=True)
+
+
+def write_partition(store_dir, key, df):
+    """
+    Write the lines of one month as a Parquet partition
+
+    Partitions follow the hive layout (month_year=2025-01/part.parquet) and
+    are written to a temporary file first so readers never see a partial file.
+
+    Returns:
+    --------
+    dict
+        Manifest entry with the partition file and row count
+    """
+    name = os.path.join(f'{PARTITION_COLUMN}={key}', 'part.parquet')
+    os.makedirs(os.path.join(store_dir, os.path.dirname(name)), exist_ok=True)
+    tmp_path = os.path.join(store_dir, name + '.tmp')
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(store_dir, name))
+    return {'file': name, 'rows': len(df)}
+
+
+def read_partition(store_dir, entry):
+    """Read one month partition"""
+    return pd.read_parquet(os.path.join(store_dir, entry['file']))
+
+
+def clear_partitions(store_dir, version):
+    """Remove every partition and return the empty manifest of a data version"""
+    if os.path.isdir(store_dir):
+        shutil.rmtree(store_dir)
+    os.makedirs(store_dir)
+    manifest = {'version': version, 'partitions': {}}
+    write_manifest(store_dir, manifest)
+    return manifest
+
+
+def append_partitions(store_dir, manifest, delta, version):
+    """
+    Add appended lines to the partitions of their months
+
+    Only the months the new lines fall in are rewritten.
+
+    Returns:
+    --------
+    tuple of (dict, list of str)
+        The new manifest and the keys of the rewritten partitions
+    """
+    partitions = dict(manifest['partitions'])
+    touched = []
+    for key, lines in _split(delta):
+        if key in partitions:
+            lines = ingest.concat_sales([read_partition(store_dir, partitions[key]), lines])
+        partitions[key] = write_partition(store_dir, key, lines)
+        touched.append(key)
+    manifest = {'version': version, 'partitions': partitions}
+    write_manifest(store_dir, manifest)
+    return manifest, touched
+
+
+def months_overlapping(keys, start_date=None, end_date=None):
+    """
+    Return the partition keys whose month overlaps an inclusive date range
+
+    With no range every partition is returned, including the undated one.
+
+    Parameters:
+    -----------
+    keys : iterable of str
+        Partition keys (yyyy-mm, or UNDATED)
+    start_date, end_date : date-like, optional
+        Inclusive range; None leaves that side open
+
+    Returns:
+    --------
+    tuple of str
+        Matching keys in month order
+    """
+    if start_date is None and end_date is None:
+        return tuple(sorted(keys))
+    first = pd.Timestamp(start_date).strftime('%Y-%m') if start_date is not None else ''
+    last = pd.Timestamp(end_date).strftime('%Y-%m') if end_date is not None else '9999-99'
+    # yyyy-mm keys sort chronologically as plain strings
+    return tuple(sorted(key for key in keys if key != UNDATED and first <= key <= last))
@@ -0,0 +1,44 @@
+import pandas as pd
+
+# Discount bins shared by every dashboard that breaks sales down by discount level
+DISCOUNT_BINS = [0, 5, 10, 15, 20, 100]
+DISCOUNT_LABELS = ['0-5%', '5-10%', '10-15%', '15-20%', '20%+']
+
+
+def enrich_sales(df):
+    """
+    Add the derived columns used by the dashboards
+
+    The result is computed once per data version and shared by every
+    dashboard, which only read from it.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Typed sales data as returned by datastore.ingest.load_typed_sales
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Copy of the sales data with date parts, month_year, discount_pct and
+        discount_bin columns added
+    """
+    df = df.copy()
+
+    if 'วันที่ทำรายการ' in df.columns:
+        # Make sure the order date is parsed even for exports that bypassed the typed cache
+        if not pd.api.types.is_datetime64_any_dtype(df['วันที่ทำรายการ']):
+            df['วันที่ทำรายการ'] = pd.to_datetime(df['วันที่ทำรายการ'], format='%d/%m/%Y', errors='coerce')
+
+        order_date = df['วันที่ทำรายการ'].dt
+        df['month'] = order_date.month
+        df['year'] = order_date.year
+        df['day'] = order_date.day
+        df['weekday'] = order_date.day_name()
+        df['month_year'] = order_date.strftime('%Y-%m')
+
+    if 'ส่วนลดต่อหน่วย' in df.columns and 'ราคาต่อหน่วย' in df.columns:
+        df['discount_pct'] = (df['ส่วนลดต่อหน่วย'] / df['ราคาต่อหน่วย']) * 100
+        df['discount_bin'] = pd.cut(df['discount_pct'], bins=DISCOUNT_BINS, labels=DISCOUNT_LABELS)
+
+    return df
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+from datastore import shared, trend
+
+# Line columns summed per product, and those averaged over its lines
+PRODUCT_SUMS = ['จำนวน', 'มูลค่า']
+PRODUCT_MEANS = ['ราคาต่อหน่วย', 'ส่วนลดต่อหน่วย']
+
+# (x, y) columns of the discount trend line fitted for every product
+DISCOUNT_FIT = ('ส่วนลดต่อหน่วย', 'จำนวน')
+
+
+def _starts(codes, n):
+    """Return the start of every code 0..n-1 in sorted codes, and the end of the last"""
+    return np.searchsorted(codes, np.arange(n + 1))
+
+
+def _reduce(values, starts):
+    """Sum sorted values between consecutive starts; empty ranges sum to 0"""
+    sums = np.add.reduceat(values, np.minimum(starts[:-1], max(len(values) - 1, 0))) if len(values) else \
+        np.zeros(len(starts) - 1)
+    return np.where(starts[1:] > starts[:-1], sums, 0)
+
+
+class ProductSummary:
+    """
+    Metrics, daily sales, channel split and discount trend of every product, computed at once
+
+    The sales lines are sorted by product and order date once; every
+    product's lines are then one row range of the sorted lines, and its
+    metrics and series are taken out of that order with reduceat and
+    bincount, without grouping by product again. Switching products is a
+    dictionary lookup and a slice.
+
+    Parameters:
+    -----------
+    lines : pandas.DataFrame
+        Enriched sales lines, usually the filtered selection
+    """
+
+    def __init__(self, lines, product_col='ชื่อสินค้า', date_col='วันที่ทำรายการ',
+                 channel_col='ช่องทางการขาย', category_col='หมวดหมู่'):
+        self.product_col = product_col
+        self.date_col = date_col
+        codes, names = pd.factorize(lines[product_col], sort=True)
+        n = len(names)
+        has_date = date_col in lines.columns
+        dates = lines[date_col].to_numpy(dtype='datetime64[ns]').view(np.int64) if has_date else np.zeros(len(lines))
+
+        # Products in name order, each product's lines in date order
+        positions = np.flatnonzero(codes >= 0)
+        positions = positions[np.lexsort((dates[positions], codes[positions]))]
+        codes, dates = codes[positions], dates[positions]
+        self.lines = shared.freeze_frame(lines.take(positions).reset_index(drop=True))
+        self.products = list(names)
+        self._position = {name: i for i, name in enumerate(self.products)}
+        self._starts = _starts(codes, n)
+
+        # Metrics per product, from the row ranges
+        metrics = pd.DataFrame({product_col: names})
+        if category_col in self.lines.columns:
+            metrics[category_col] = self.lines[category_col].take(self._starts[:-1]).to_numpy() if len(positions) \
+                else []
+        for col in PRODUCT_SUMS:
+            if col in self.lines.columns:
+                metrics[col] = _reduce(np.nan_to_num(self.lines[col].to_numpy(dtype=np.float64)), self._starts)
+        for col in PRODUCT_MEANS:
+            if col in self.lines.columns:
+                values = self.lines[col].to_numpy(dtype=np.float64)
+                counts = _reduce(~np.isnan(values), self._starts)
+                metrics[col] = _reduce(np.nan_to_num(values), self._starts) / np.where(counts > 0, counts, np.nan)
+        metrics['lines'] = np.diff(self._starts)
+        self.metrics = shared.freeze_frame(metrics)
+
+        # Least-squares sums of the discount trend per product (see
+        # datastore.trend), so a product's fit is solved from one row
+        if all(col in self.lines.columns for col in DISCOUNT_FIT):
+            x, y = (self.lines[col].to_numpy(dtype=np.float64) for col in DISCOUNT_FIT)
+            valid = ~(np.isnan(x) | np.isnan(y))
+            x, y = np.where(valid, x, 0.0), np.where(valid, y, 0.0)
+            self._fit_sums = shared.freeze_frame(pd.DataFrame(
+                {col: _reduce(values, self._starts)
+                 for col, values in zip(trend.FIT_SUMS, [valid.astype(np.float64), x, y, x * x, x * y])}))
+        else:
+            self._fit_sums = None
+
+        amounts = np.nan_to_num(self.lines['มูลค่า'].to_numpy(dtype=np.float64)) if 'มูลค่า' in self.lines.columns \
+            else np.zeros(len(positions))
+
+        # Daily sales: runs of the same product and date in the sorted lines
+        if has_date:
+            dated = np.flatnonzero(dates != np.iinfo(np.int64).min)
+            run = np.r_[True, (codes[dated][1:] != codes[dated][:-1]) | (dates[dated][1:] != dates[dated][:-1])] \
+                if len(dated) else np.zeros(0, dtype=bool)
+            run_starts = np.flatnonzero(run)
+            daily_codes = codes[dated][run_starts]
+            self._daily = shared.freeze_frame(pd.DataFrame({
+                date_col: dates[dated][run_starts].view('datetime64[ns]'),
+                'มูลค่า': np.add.reduceat(amounts[dated], run_starts) if len(run_starts) else np.zeros(0),
+            }))
+            self._daily_starts = _starts(daily_codes, n)
+        else:
+            self._daily = None
+
+        # Channel split: a dense product x channel bincount
+        if channel_col in self.lines.columns:
+            channel_codes, channels = pd.factorize(self.lines[channel_col])
+            k = len(channels)
+            cells = codes.astype(np.int64) * k + channel_codes
+            valid = channel_codes >= 0
+            counts = np.bincount(cells[valid], minlength=n * k)
+            sums = np.bincount(cells[valid], weights=amounts[valid], minlength=n * k)
+            observed = np.flatnonzero(counts)
+            split_codes, split_channels = np.divmod(observed, max(k, 1))
+            order = np.lexsort((-sums[observed], split_codes))
+            self._channels = shared.freeze_frame(pd.DataFrame({
+                channel_col: np.asarray(channels, dtype=object)[split_channels[order]],
+                'มูลค่า': sums[observed][order],
+            }))
+            self._channel_starts = _starts(split_codes[order], n)
+        else:
+            self._channels = None
+
+    def __contains__(self, product):
+        return product in self._position
+
+    def _range(self, product, starts):
+        i = self._position.get(product)
+        return (0, 0) if i is None else (starts[i], starts[i + 1])
+
+    def product_metrics(self, product):
+        """Return the metrics row of a product (units, revenue, average price and discount, lines)"""
+        i = self._position.get(product)
+        return self.metrics.iloc[i] if i is not None else None
+
+    def discount_fit(self, product):
+        """Return the (slope, intercept) of units sold on discount per unit for a product, or None"""
+        i = self._position.get(product)
+        if i is None or self._fit_sums is None:
+            return None
+        return trend.solve(self._fit_sums.iloc[i])
+
+    def rows(self, product):
+        """Return the sales lines of a product, in date order, as a frozen slice of the sorted lines"""
+        start, stop = self._range(product, self._starts)
+        return shared.freeze_frame(self.lines.iloc[start:stop],
+                                   version=(shared.frame_version(self.lines), 'rows', product))
+
+    def daily_sales(self, product):
+        """Return the sales amount per order date of a product, like aggregates.daily_sales"""
+        if self._daily is None:
+            return pd.DataFrame(columns=[self.date_col, 'มูลค่า'])
+        start, stop = self._range(product, self._daily_starts)
+        return self._daily.iloc[start:stop]
+
+    def channel_sales(self, product):
+        """Return the sales amount per sales channel of a product, largest first"""
+        if self._channels is None:
+            return pd.DataFrame(columns=['ช่องทางการขาย', 'มูลค่า'])
+        start, stop = self._range(product, self._channel_starts)
+        return self._channels.iloc[start:stop]
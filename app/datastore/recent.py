@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from datastore import shared
+from datastore.filters import ALL
+
+# Lines kept per (channel, status) pair
+RECENT_CAPACITY = 200
+
+# Arrival number of a line, breaking ties between lines of the same date
+SEQ_COLUMN = '_seq'
+
+
+def _latest(df, n, date_col):
+    """Return the n latest lines of df, newest first, without sorting all of it"""
+    if len(df) > n:
+        # Selection instead of a sort: only the lines from the n-th latest
+        # date on are ordered below
+        keys = df[date_col].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+        keys = np.where(df[date_col].isna().to_numpy(), np.iinfo(np.int64).min, keys)
+        df = df[keys >= np.partition(keys, len(keys) - n)[len(keys) - n]]
+    return df.sort_values([date_col, SEQ_COLUMN], ascending=False).head(n)
+
+
+class RecentOrders:
+    """
+    Latest sales lines per sales channel and order status, kept at ingest
+
+    Holds the RECENT_CAPACITY latest lines (by order date, later arrivals
+    first on the same date) of every (channel, status) pair. The store
+    updates it with each batch of appended lines, so the latest orders are
+    answered from a few small buffers instead of sorting the sales table.
+
+    Parameters:
+    -----------
+    capacity : int
+        Lines kept per (channel, status) pair
+    """
+
+    def __init__(self, capacity=RECENT_CAPACITY, date_col='วันที่ทำรายการ',
+                 channel_col='ช่องทางการขาย', status_col='สถานะรายการ'):
+        self.capacity = capacity
+        self.date_col = date_col
+        self.channel_col = channel_col
+        self.status_col = status_col
+        self.seen = 0
+        self._buffers = {}
+
+    def update(self, lines):
+        """Add a batch of sales lines, in arrival order"""
+        if lines.empty or self.date_col not in lines.columns:
+            self.seen += len(lines)
+            return
+        lines = lines.assign(**{SEQ_COLUMN: np.arange(self.seen, self.seen + len(lines))})
+        self.seen += len(lines)
+
+        keys = [col for col in (self.channel_col, self.status_col) if col in lines.columns]
+        buffers = dict(self._buffers)
+        groups = lines.groupby(keys, dropna=False, observed=True, sort=False) if keys else [((), lines)]
+        for key, group in groups:
+            key = key if isinstance(key, tuple) else (key,)
+            previous = buffers.get(key)
+            if previous is not None:
+                group = pd.concat([previous, group], ignore_index=True)
+            buffers[key] = shared.freeze_frame(_latest(group, self.capacity, self.date_col).reset_index(drop=True))
+        # Swapped in whole, so readers never see a half-updated set of buffers
+        self._buffers = buffers
+
+    def latest(self, n=10, channel=ALL, status=ALL, start_date=None, end_date=None, category=ALL,
+               category_col='หมวดหมู่'):
+        """
+        Return the n latest sales lines matching the filters, newest first
+
+        Parameters:
+        -----------
+        n : int
+            Number of lines
+        channel, status : str
+            Selected sales channel and order status, or ALL
+        start_date, end_date : date-like, optional
+            Inclusive order date range
+        category : str
+            Selected category, or ALL
+
+        Returns:
+        --------
+        pandas.DataFrame or None
+            The lines, or None when lines dropped from a full buffer could
+            belong to the answer; the caller then selects from the full data
+        """
+        start = pd.Timestamp(start_date).normalize() if start_date is not None else None
+        candidates, full = [], []
+        for (key_channel, *rest), buffer in self._buffers.items():
+            key_status = rest[0] if rest else None
+            if channel not in (None, ALL) and key_channel != channel:
+                continue
+            if status not in (None, ALL) and key_status != status:
+                continue
+            candidates.append(buffer)
+            # Lines dropped from a full buffer are older than its last line,
+            # so they only matter if that line is still in the date range
+            if len(buffer) >= self.capacity and (start is None or not buffer[self.date_col].iloc[-1] < start):
+                full.append(buffer.iloc[-1])
+        if not candidates:
+            return pd.DataFrame()
+
+        lines = pd.concat(candidates, ignore_index=True)
+        dates = lines[self.date_col]
+        keep = pd.Series(True, index=lines.index)
+        if start is not None:
+            keep &= dates >= start
+        if end_date is not None:
+            keep &= dates < pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+        if category not in (None, ALL) and category_col in lines.columns:
+            keep &= lines[category_col] == category
+        lines = _latest(lines[keep], n, self.date_col)
+
+        # The answer holds if its n-th line is newer than the last line of
+        # every full buffer
+        if full:
+            if len(lines) < n:
+                return None
+            last = lines.iloc[n - 1]
+            if any((last[self.date_col], last[SEQ_COLUMN]) <= (row[self.date_col], row[SEQ_COLUMN]) for row in full):
+                return None
+        return lines.drop(columns=SEQ_COLUMN).reset_index(drop=True)
@@ -0,0 +1,118 @@
+import sys
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Default memory budget of the result cache
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+def estimate_size(value):
+    """Return the approximate memory used by a cached result, in bytes"""
+    if isinstance(value, pd.Series):
+        value = value.to_frame()
+    if isinstance(value, pd.DataFrame):
+        size = int(value.memory_usage(index=True).sum())
+        # memory_usage(deep=True) cannot read the read-only arrays of frozen
+        # frames, so the objects of text columns are measured here
+        for col in value.select_dtypes(include='object').columns:
+            size += sum(sys.getsizeof(item) for item in value[col].to_numpy())
+        return size
+    return sys.getsizeof(value)
+
+
+def normalize(value):
+    """
+    Turn filter values and call arguments into a hashable, canonical key part
+
+    Dates become ISO strings so that a date and the equal Timestamp map to the
+    same key, and dicts are sorted so argument order does not matter.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, normalize(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(normalize(item) for item in value)
+    if hasattr(value, 'isoformat'):
+        return pd.Timestamp(value).isoformat()
+    return value
+
+
+class ResultCache:
+    """
+    Bounded LRU cache for section-level dashboard results
+
+    Entries are keyed by (data version, dashboard, section, normalized filter
+    state), so every session looking at the same view shares one result.
+    When the cached results outgrow the memory budget the least recently used
+    ones are evicted. Results are stored as given; callers should only put
+    read-only objects (see datastore.shared.freeze_frame).
+
+    Parameters:
+    -----------
+    max_bytes : int
+        Memory budget for all cached results together
+    sizeof : callable, optional
+        Returns the size of a result in bytes (defaults to estimate_size)
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(data_version, dashboard, section, filters=None):
+        """Build the cache key of a section of a dashboard for a filter state"""
+        return (data_version, dashboard, normalize(section), normalize(filters or {}))
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached result for key, computing and caching it on a miss
+
+        compute runs outside the lock, so a slow section does not block other
+        sessions; if two sessions miss the same key at once, both compute it.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = compute()
+        size = self.sizeof(value)
+        with self._lock:
+            if size > self.max_bytes or key in self._entries:
+                return value
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """Drop every cached result (the counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Return the hit/miss counters and the current size of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
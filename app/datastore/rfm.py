@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from datastore.customers import CUSTOMER_KEY
+
+# Segment of every (RecencyScore, FrequencyScore) pair; row 0 is recency
+# score 1. The monetary score does not change the segment.
+SEGMENT_LABELS = np.array([
+    ['Inactive High Spenders', 'Inactive Regular Customers', 'Inactive Low Spenders'],
+    ['Active High Spenders', 'Active Regular Customers', 'Active Low Spenders'],
+    ['New High Spenders', 'New Active Customers', 'New Low Spenders'],
+], dtype=object)
+
+_NAT = np.iinfo(np.int64).min
+
+
+def tercile_scores(values, reverse=False):
+    """
+    Score values 1-3 by tercile of their rank
+
+    Same result as pd.qcut(values.rank(method='first'), 3, labels=[1, 2, 3])
+    (labels [3, 2, 1] with reverse=True) without sorting: each of the two
+    edges is found with a partition, and equal values are ranked in order
+    of position like rank(method='first').
+    """
+    values = np.asarray(values)
+    n = len(values)
+    scores = np.ones(n, dtype=np.int8)
+    # qcut's edges over the ranks 1..n, with the same rounding; bins are
+    # closed on the right, so a value scores higher when its rank > edge
+    edges = np.percentile(np.arange(1, n + 1, dtype=np.float64), np.linspace(0, 1, 4) * 100) if n else []
+    for edge in edges[1:3]:
+        k = int(np.floor(edge))
+        if k >= n:
+            continue
+        kth = np.partition(values, k - 1)[k - 1]
+        ties = values == kth
+        tie_ranks = np.count_nonzero(values < kth) + np.cumsum(ties)
+        scores += (values > kth) | (ties & (tie_ranks > k))
+    return (4 - scores if reverse else scores).astype(np.int8)
+
+
+def segment(table):
+    """
+    Add the RFM scores and the segment of every customer to an RFM table
+
+    Parameters:
+    -----------
+    table : pandas.DataFrame
+        RFM table with Recency, Frequency and Monetary columns
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Copy of the table with RecencyScore, FrequencyScore, MonetaryScore
+        and Segment columns added
+    """
+    table = table.copy()
+    table['RecencyScore'] = tercile_scores(table['Recency'], reverse=True)
+    table['FrequencyScore'] = tercile_scores(table['Frequency'])
+    table['MonetaryScore'] = tercile_scores(table['Monetary'])
+    codes = (table['RecencyScore'].to_numpy() - 1) * 3 + table['FrequencyScore'].to_numpy() - 1
+    table['Segment'] = pd.Categorical.from_codes(codes, categories=SEGMENT_LABELS.ravel())
+    return table
+
+
+def _totals(keys, dates, amounts, n):
+    """Return the first and last order date (as int64), order count and amount of customer keys 0..n-1"""
+    first = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first, keys, dates)
+    last = np.full(n, _NAT, dtype=np.int64)
+    np.maximum.at(last, keys, dates)
+    frequency = np.bincount(keys, minlength=n)
+    monetary = np.bincount(keys, weights=amounts, minlength=n)
+    return first, last, frequency, monetary
+
+
+def _order_arrays(orders):
+    keys = orders[CUSTOMER_KEY].to_numpy()
+    dates = orders['วันที่ทำรายการ'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    amounts = np.nan_to_num(orders['มูลค่า'].to_numpy(dtype=np.float64))
+    valid = keys >= 0
+    return keys[valid], dates[valid], amounts[valid]
+
+
+def _table(names, first, last, frequency, monetary, max_date):
+    first = pd.Series(first.view('datetime64[ns]'))
+    last = pd.Series(last.view('datetime64[ns]'))
+    return pd.DataFrame({
+        'ชื่อลูกค้า': names,
+        'Recency': (max_date - last).dt.days.to_numpy(),
+        'Frequency': frequency,
+        'Monetary': monetary,
+        'Tenure': (max_date - first).dt.days.to_numpy(),
+    })
+
+
+def compute(orders):
+    """
+    Return the recency, frequency and monetary value of every customer
+
+    Reduces the order fact table rows with bincounts over their integer
+    customer keys; no customer name is hashed. Recency is counted in days
+    from the last order date of the rows, Frequency is the number of orders
+    and Tenure is counted in days from the customer's first order.
+
+    Parameters:
+    -----------
+    orders : pandas.DataFrame
+        Order fact table rows with a customer_key column
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per customer: ชื่อลูกค้า, Recency, Frequency, Monetary and Tenure
+    """
+    max_date = orders['วันที่ทำรายการ'].max()
+    keys, dates, amounts = _order_arrays(orders)
+    n = int(keys.max()) + 1 if len(keys) else 0
+    first_date, last, frequency, monetary = _totals(keys, dates, amounts, n)
+    # Position of the first order of every key, for its name
+    first = np.zeros(n, dtype=np.int64)
+    first[keys[::-1]] = np.arange(len(keys))[::-1]
+    names = orders['ชื่อลูกค้า'].to_numpy()[orders[CUSTOMER_KEY].to_numpy() >= 0]
+    active = frequency > 0
+    return _table(names[first[active]], first_date[active], last[active], frequency[active], monetary[active],
+                  max_date)
+
+
+class CustomerRFM:
+    """
+    Recency, frequency and monetary state of every customer over the history
+
+    Keeps the first and last order date, order count and total amount per customer
+    key of the order fact table (see datastore.customers), so new orders
+    only touch the entries of their own customers.
+
+    Parameters:
+    -----------
+    dimension : datastore.customers.CustomerDimension
+        Customer dimension owning the keys, for the customer names
+    """
+
+    def __init__(self, dimension):
+        self.dimension = dimension
+        self.max_date = pd.NaT
+        self._first = np.empty(0, dtype=np.int64)
+        self._last = np.empty(0, dtype=np.int64)
+        self._frequency = np.empty(0, dtype=np.int64)
+        self._monetary = np.empty(0, dtype=np.float64)
+
+    def add(self, orders, sign=1):
+        """
+        Add order rows to the state, or take them out with sign=-1
+
+        Taking out an order does not change the order dates; it is only
+        used to replace an order with its recombined row, which has the same
+        date (see datastore.orders.merge_orders).
+        """
+        n = len(self.dimension)
+        if len(self._last) < n:
+            grow = n - len(self._last)
+            self._first = np.concatenate([self._first, np.full(grow, np.iinfo(np.int64).max, dtype=np.int64)])
+            self._last = np.concatenate([self._last, np.full(grow, _NAT, dtype=np.int64)])
+            self._frequency = np.concatenate([self._frequency, np.zeros(grow, dtype=np.int64)])
+            self._monetary = np.concatenate([self._monetary, np.zeros(grow)])
+        keys, dates, amounts = _order_arrays(orders)
+        np.add.at(self._frequency, keys, sign)
+        np.add.at(self._monetary, keys, sign * amounts)
+        if sign > 0:
+            np.minimum.at(self._first, keys, dates)
+            np.maximum.at(self._last, keys, dates)
+            latest = orders['วันที่ทำรายการ'].max()
+            if pd.notna(latest) and (pd.isna(self.max_date) or latest > self.max_date):
+                self.max_date = latest
+
+    def table(self):
+        """Return the RFM table of every customer with orders, like compute() over all orders"""
+        active = self._frequency > 0
+        return _table(self.dimension.names()[:len(active)][active], self._first[active], self._last[active],
+                      self._frequency[active], self._monetary[active], self.max_date)
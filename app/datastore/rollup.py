@@ -0,0 +1,112 @@
+import pandas as pd
+
+# Dimensions of the sales cube; the day keeps the order date column name so the
+# cube can be filtered with the same FilterIndex as the line items
+CUBE_KEYS = ['วันที่ทำรายการ', 'ช่องทางการขาย', 'จังหวัด', 'หมวดหมู่', 'ชื่อสินค้า']
+
+# Totals answered from the cube
+TOTAL_MEASURES = ['มูลค่า', 'จำนวน', 'orders']
+
+# Measures held for every cube cell; category_orders is the order count
+# within a single category (see build_sales_cube)
+CUBE_MEASURES = TOTAL_MEASURES + ['category_orders']
+
+
+def build_sales_cube(df, counted_lines=None):
+    """
+    Roll the sales lines up to one row per (day, channel, province, category, product)
+
+    Each cell holds the summed sales amount (มูลค่า), summed units (จำนวน)
+    and two order counts:
+
+    - orders: an order is counted in the cell of its first line, so the
+      count adds up exactly along day, channel and province
+    - category_orders: an order is counted in the cell of its first line in
+      each of its categories, so the count of the cells of one category is
+      exact even for orders whose first line is in another category
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Enriched sales data
+    counted_lines : pandas.DataFrame, optional
+        Lines (รายการ and หมวดหมู่) already counted in another cube; orders
+        and (order, category) pairs among them add to the sums but not to
+        the order counts (see merge_cubes)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Cube with the key columns that exist in df plus the measures
+    """
+    keys = [col for col in CUBE_KEYS if col in df.columns]
+    if df.empty or not keys:
+        return pd.DataFrame(columns=keys + CUBE_MEASURES)
+
+    lines = pd.DataFrame({col: df[col] for col in keys})
+    if 'วันที่ทำรายการ' in lines.columns:
+        lines['วันที่ทำรายการ'] = lines['วันที่ทำรายการ'].dt.normalize()
+    # Exports can leave the amount or units of a line blank; those lines add nothing
+    lines['มูลค่า'] = df['มูลค่า'].fillna(0.0) if 'มูลค่า' in df.columns else 0.0
+    # Units are downcast at ingest; widen them so cube sums never depend on the input dtype
+    lines['จำนวน'] = df['จำนวน'].fillna(0).astype('int64') if 'จำนวน' in df.columns else 0
+    if 'รายการ' in df.columns:
+        lines['orders'] = ~df['รายการ'].duplicated()
+        pair_cols = ['รายการ', 'หมวดหมู่'] if 'หมวดหมู่' in df.columns else ['รายการ']
+        lines['category_orders'] = ~df.duplicated(subset=pair_cols)
+        if counted_lines is not None:
+            lines['orders'] &= ~df['รายการ'].isin(counted_lines['รายการ'])
+            pairs = pd.MultiIndex.from_frame(df[pair_cols].astype(object))
+            lines['category_orders'] &= ~pairs.isin(pd.MultiIndex.from_frame(counted_lines[pair_cols].astype(object)))
+    else:
+        lines['orders'] = True
+        lines['category_orders'] = True
+
+    cube = lines.groupby(keys, observed=True, dropna=False, sort=False)[CUBE_MEASURES].sum().reset_index()
+    cube[['orders', 'category_orders']] = cube[['orders', 'category_orders']].astype('int64')
+    return cube
+
+
+def order_count(cube, category_col='หมวดหมู่'):
+    """
+    Return the number of orders in a (filtered) cube
+
+    Within a single category the category_orders count is exact; across
+    categories an order is counted once per category, so the orders count
+    is used instead.
+    """
+    if cube.empty:
+        return 0
+    single_category = category_col in cube.columns and cube[category_col].nunique(dropna=False) == 1
+    measure = 'category_orders' if single_category and 'category_orders' in cube.columns else 'orders'
+    return int(cube[measure].sum())
+
+
+def merge_cubes(cube, delta):
+    """
+    Merge the cube of newly ingested lines into an existing cube
+
+    The cost depends on the number of cube cells, not on the number of lines
+    behind them. Build the delta with counted_lines set to the last lines
+    already in the existing cube so an order continuing across the boundary
+    is counted once.
+    """
+    if cube is None or cube.empty:
+        return delta
+    if delta.empty:
+        return cube
+    keys = [col for col in CUBE_KEYS if col in cube.columns]
+    combined = pd.concat([cube, delta], ignore_index=True)
+    for col in keys:
+        # Categories can differ between the two cubes; keep the keys categorical
+        if isinstance(cube[col].dtype, pd.CategoricalDtype) and not isinstance(combined[col].dtype, pd.CategoricalDtype):
+            combined[col] = combined[col].astype('category')
+    return combined.groupby(keys, observed=True, dropna=False, sort=False)[CUBE_MEASURES].sum().reset_index()
+
+
+def top_value(cube, key, measure):
+    """Return the key value with the largest summed measure, or "N/A" if the cube is empty"""
+    if cube.empty or key not in cube.columns:
+        return "N/A"
+    totals = cube.groupby(key, observed=True)[measure].sum()
+    return totals.idxmax() if not totals.empty else "N/A"
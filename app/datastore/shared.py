@@ -0,0 +1,88 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+# Numbers handed to frozen frames, one per freeze_frame call without a version
+_versions = itertools.count(1)
+
+
+class ReadOnlyDataFrameError(TypeError):
+    """Raised when code tries to modify a frame shared between sessions"""
+
+
+class FrozenFrame(pd.DataFrame):
+    """
+    DataFrame shared by every session that refuses to be modified
+
+    Adding, replacing, deleting or renaming columns, assigning the index and
+    the inplace=True methods raise ReadOnlyDataFrameError, and
+    the underlying arrays are flagged read-only so in-place writes through
+    .loc/.iloc/.values raise as well. Anything derived from the frame
+    (filters, groupbys, copies) is a regular, writable pandas.DataFrame.
+    """
+
+    # Version given by freeze_frame; the content never changes, so it stands
+    # for the content in cache keys (see frame_version)
+    _version = None
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _refuse(self, *args, **kwargs):
+        raise ReadOnlyDataFrameError(
+            "Shared sales data is read-only; call .copy() before modifying it"
+        )
+
+    __setitem__ = _refuse
+    __delitem__ = _refuse
+    insert = _refuse
+    isetitem = _refuse
+    pop = _refuse
+    # Assigning columns/index and every inplace=True method (rename, drop,
+    # sort_values, reset_index, fillna, replace, ...) go through these
+    _set_axis = _refuse
+    _update_inplace = _refuse
+
+
+def _freeze_array(values):
+    # Numpy-backed blocks hold an ndarray directly; extension arrays keep one inside
+    for array in (values, getattr(values, '_ndarray', None), getattr(values, '_codes', None),
+                  getattr(values, '_data', None), getattr(values, '_mask', None)):
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+
+
+def freeze_frame(df, version=None):
+    """
+    Return a read-only view of a DataFrame for sharing between sessions
+
+    The data is not copied. Use it for frames returned from st.cache_resource,
+    where every session receives the same physical object.
+
+    Parameters:
+    -----------
+    df : pandas.DataFrame
+        Frame to share; it must not be modified through other references
+    version : hashable, optional
+        Version of a frame taken from another frozen frame, made of that
+        frame's version and what was taken (e.g. the filters), so the same
+        selection has the same version on every rerun; a new number otherwise
+
+    Returns:
+    --------
+    FrozenFrame
+        Read-only frame backed by the same memory as df
+    """
+    if isinstance(df, FrozenFrame):
+        return df
+    frozen = FrozenFrame(df)
+    for block in frozen._mgr.blocks:
+        _freeze_array(block.values)
+    object.__setattr__(frozen, '_version', next(_versions) if version is None else version)
+    return frozen
+
+
+def frame_version(df):
+    """Return the version of a frozen frame, unique in the process, or None for a regular frame"""
+    return df._version if isinstance(df, FrozenFrame) else None
@@ -0,0 +1,288 @@
+import os
+import threading
+from collections import OrderedDict
+import pandas as pd
+from datastore import ingest, exports, preprocess, rollup, shared, partitions, recent, orders, rfm, customers, cohorts
+
+# Exports list the lines of an order together, so an order can only continue
+# across an append from the last few lines already loaded
+ORDER_TAIL_ROWS = 1000
+
+# Month partitions kept in memory after a load; the least recently used
+# are dropped first, but never the months of the window being loaded
+LOADED_MONTHS = 12
+
+# Columns of the product list derived from the sales lines
+PRODUCT_COLUMNS = ['รหัสสินค้า', 'ชื่อสินค้า', 'ราคาต่อหน่วย', 'หมวดหมู่']
+
+# Order-level fields read for the customer dimension; only those also in
+# ORDER_FIELDS stay in the order fact table
+ORDER_CUSTOMER_FIELDS = orders.ORDER_FIELDS + [col for col in customers.CUSTOMER_FIELDS
+                                               if col not in orders.ORDER_FIELDS]
+
+
+def _tail_columns(df):
+    """Return the columns of the lines kept to count continuing orders (see rollup.build_sales_cube)"""
+    return [col for col in ('รายการ', 'หมวดหมู่') if col in df.columns]
+
+
+def _distinct(frames, columns):
+    """Return the distinct rows of the given columns over several frames"""
+    frames = [df[[col for col in columns if col in df.columns]] for df in frames if df is not None]
+    return ingest.concat_sales(frames).drop_duplicates().reset_index(drop=True)
+
+
+class SalesStore:
+    """
+    Sales data kept up to date with the export, partitioned by month
+
+    The enriched sales lines are stored as one Parquet partition per month of
+    the order date (see datastore.partitions). Only the rollup cube, the
+    order fact table (see datastore.orders), the per-customer RFM state
+    (see datastore.rfm) and the product and customer lists are held in
+    memory for the whole history;
+    line items are read per month when a date range asks for them and the
+    last LOADED_MONTHS months used are kept, so a wider range only reads the
+    months not loaded yet. The latest lines
+    are kept apart in a RecentOrders feed (see datastore.recent). Everything handed
+    out is frozen so it can be shared by every session.
+
+    refresh() syncs the typed cache (see datastore.ingest.sync_typed_sales);
+    when the export only grew, just the new lines are enriched, written to
+    the partitions of their months and merged into the cube, the order
+    table and the feed. A full build reads the cache in batches and adds
+    them the same way, so it never holds more than one batch of lines. A directory is read through the unified store of
+    every export in it (see datastore.exports.sync_exports), where a new
+    export file is the increment.
+
+    Parameters:
+    -----------
+    source_path : str
+        Path to the CSV or XLSX sales export, or to a directory of exports
+    cache_dir : str, optional
+        Directory for the cache files (defaults to data/.cache)
+    """
+
+    def __init__(self, source_path, cache_dir=None):
+        self.source_path = source_path
+        self.cache_dir = cache_dir
+        self.partition_dir = partitions.partition_dir(source_path, cache_dir)
+        self.version = None
+        self.cube = None
+        self.orders = None
+        self.customer_dim = None
+        self.customer_rfm = None
+        self.cohorts = None
+        self.products = None
+        self.customers = None
+        self.recent = None
+        self._manifest = None
+        self._months = OrderedDict()
+        self._tail_lines = None
+        self._watermark = None
+        self._source_version = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """
+        Bring the store up to date with the export
+
+        Cheap when the export is unchanged: only the file's mtime and size are
+        checked.
+
+        Returns:
+        --------
+        str
+            Version of the data now held; changes whenever the rows change
+        """
+        with self._lock:
+            source_version = self._current_source_version()
+            if source_version is not None and source_version == self._source_version:
+                return self.version
+
+            rows, watermark, appended = self._sync()
+            version = f"{watermark['generation']}:{watermark['rows']}"
+            if appended and self.cube is not None:
+                if not rows.empty:
+                    self._append(rows, version)
+            else:
+                self._build(rows, version)
+
+            self._watermark = watermark
+            self._source_version = source_version
+            self.version = version
+            return self.version
+
+    def _current_source_version(self):
+        if os.path.isdir(self.source_path):
+            return exports.exports_version(self.source_path)
+        return ingest.data_version(self.source_path)
+
+    def _sync(self):
+        if os.path.isdir(self.source_path):
+            store_dir = os.path.join(self.cache_dir, exports.STORE_DIR_NAME) if self.cache_dir is not None else None
+            return exports.sync_exports(self.source_path, store_dir, watermark=self._watermark, batches=True)
+        return ingest.sync_typed_sales(self.source_path, self.cache_dir, watermark=self._watermark, batches=True)
+
+    def _build(self, batches, version):
+        # The history is added batch by batch like appended lines, so only
+        # one batch of lines is enriched and held at a time
+        manifest = partitions.read_manifest(self.partition_dir)
+        write = manifest is None or manifest.get('version') != version
+        # Partitions being written carry no version until the build is done
+        self._manifest = partitions.clear_partitions(self.partition_dir, None) if write else manifest
+        self._months = OrderedDict()
+        self.cube = None
+        self.orders = None
+        self.customer_dim = customers.CustomerDimension()
+        self.customer_rfm = rfm.CustomerRFM(self.customer_dim)
+        self.cohorts = cohorts.CohortState()
+        self.products = None
+        self.customers = None
+        self.recent = recent.RecentOrders()
+        self._tail_lines = None
+
+        for rows in [batches] if isinstance(batches, pd.DataFrame) else batches:
+            self._append(rows, None, write_partitions=write)
+        if write:
+            self._manifest = {**self._manifest, 'version': version}
+            partitions.write_manifest(self.partition_dir, self._manifest)
+        if self.cube is None:
+            # No lines at all
+            self.cube = shared.freeze_frame(rollup.build_sales_cube(pd.DataFrame()))
+            self.orders = shared.freeze_frame(pd.DataFrame(columns=[orders.ORDER_KEY, customers.CUSTOMER_KEY]))
+            self.products = shared.freeze_frame(pd.DataFrame(columns=PRODUCT_COLUMNS))
+            self.customers = shared.freeze_frame(self.customer_dim.table())
+
+    def _append(self, rows, version, write_partitions=True):
+        delta = preprocess.enrich_sales(rows)
+        delta_cube = rollup.build_sales_cube(delta, counted_lines=self._tail_lines)
+
+        if write_partitions:
+            self._manifest, touched = partitions.append_partitions(self.partition_dir, self._manifest, delta, version)
+            for key in touched:
+                # Reloaded on the next request for the month
+                self._months.pop(key, None)
+
+        self.cube = shared.freeze_frame(rollup.merge_cubes(self.cube, delta_cube))
+        self._append_orders(orders.build_orders(delta, ORDER_CUSTOMER_FIELDS))
+        self.products = shared.freeze_frame(_distinct([self.products, delta], PRODUCT_COLUMNS))
+        self.customers = shared.freeze_frame(self.customer_dim.table())
+        self.recent.update(delta)
+        if 'รายการ' in delta.columns:
+            tail = [lines for lines in (self._tail_lines, delta[_tail_columns(delta)]) if lines is not None]
+            self._tail_lines = pd.concat(tail).iloc[-ORDER_TAIL_ROWS:]
+
+    @staticmethod
+    def _keyed_orders(dimension, order_df, keys=None):
+        """Return order rows with their customer keys and names, without the customer-only fields"""
+        if keys is None:
+            keys = dimension.resolve(order_df)
+        order_df = order_df[[col for col in order_df.columns if col in orders.ORDER_FIELDS + [orders.ORDER_KEY]
+                             or col in orders.ORDER_MEASURES + ['lines']]].copy()
+        order_df[customers.CUSTOMER_KEY] = keys
+        if 'ชื่อลูกค้า' in order_df.columns:
+            # One name per customer, so results keyed by name stay consistent
+            names = dimension.names()
+            order_df['ชื่อลูกค้า'] = pd.Series(names[keys], index=order_df.index).where(keys >= 0)
+        return order_df
+
+    def _append_orders(self, new_orders):
+        dimension = self.customer_dim
+        if self.orders is None:
+            # First lines of a build
+            order_df = self._keyed_orders(dimension, new_orders)
+            self.customer_rfm.add(order_df)
+            self.cohorts.add(order_df)
+            self.orders = shared.freeze_frame(order_df)
+            return
+        merges = dimension.merges
+        resolved = pd.Series(dimension.resolve(new_orders), index=new_orders[orders.ORDER_KEY].to_numpy())
+        new_orders = self._keyed_orders(dimension, new_orders, resolved.to_numpy())
+
+        # merge_orders keeps the untouched orders first, so only the tail
+        # (recombined and new orders) needs keys and RFM updates
+        replaced = self.orders[orders.ORDER_KEY].isin(new_orders[orders.ORDER_KEY])
+        merged = orders.merge_orders(self.orders.drop(columns=customers.CUSTOMER_KEY),
+                                     new_orders.drop(columns=customers.CUSTOMER_KEY))
+        kept = len(self.orders) - int(replaced.sum())
+        tail = merged.iloc[kept:]
+        # A continued order keeps its customer unless it had none yet
+        previous = self.orders.loc[replaced].set_index(orders.ORDER_KEY)[customers.CUSTOMER_KEY]
+        tail_keys = previous.reindex(tail[orders.ORDER_KEY]).fillna(-1).to_numpy(dtype='int64')
+        tail_keys = pd.Series(tail_keys).where(tail_keys >= 0, resolved.reindex(tail[orders.ORDER_KEY]).to_numpy())
+        tail = self._keyed_orders(dimension, tail, tail_keys.to_numpy(dtype='int32'))
+
+        keys = pd.concat([self.orders.loc[~replaced, customers.CUSTOMER_KEY], tail[customers.CUSTOMER_KEY]],
+                         ignore_index=True).to_numpy(dtype='int32')
+        merged = pd.concat([self.orders.loc[~replaced], tail], ignore_index=True)
+        if dimension.merges != merges:
+            # New orders linked customers kept apart so far: rekey the
+            # history and rebuild the RFM state over the merged customers
+            merged = self._keyed_orders(dimension, merged, dimension.canonical(keys))
+            self.customer_rfm = rfm.CustomerRFM(dimension)
+            self.customer_rfm.add(merged)
+            self.cohorts = None
+        else:
+            self.customer_rfm.add(self.orders[replaced], sign=-1)
+            self.customer_rfm.add(tail)
+            self.cohorts.add(self.orders[replaced], sign=-1)
+            # Orders older than their customer's latest month need a rebuild
+            if not self.cohorts.add(tail):
+                self.cohorts = None
+        if self.cohorts is None:
+            self.cohorts = cohorts.CohortState()
+            self.cohorts.add(merged)
+        self.orders = shared.freeze_frame(merged)
+
+    def months(self, start_date=None, end_date=None):
+        """
+        Return the month partitions overlapping an inclusive date range
+
+        Returns:
+        --------
+        tuple of str
+            Partition keys in month order; pass them to load_months()
+        """
+        if self._manifest is None:
+            return ()
+        return partitions.months_overlapping(self._manifest['partitions'], start_date, end_date)
+
+    def partition_files(self, months):
+        """Return the Parquet files of the given month partitions"""
+        entries = self._manifest['partitions']
+        return [os.path.join(self.partition_dir, entries[key]['file']) for key in months]
+
+    def load_months(self, months):
+        """
+        Return the sales lines of the given month partitions
+
+        Months not loaded yet are read from their partition and kept for
+        later calls, so widening a date range only reads the added months.
+        Beyond LOADED_MONTHS the least recently used months are dropped.
+
+        Parameters:
+        -----------
+        months : tuple of str
+            Partition keys as returned by months()
+
+        Returns:
+        --------
+        pandas.DataFrame
+            Frozen enriched sales lines of those months, in month order
+        """
+        with self._lock:
+            frames = []
+            for key in months:
+                if key in self._months:
+                    self._months.move_to_end(key)
+                else:
+                    entry = self._manifest['partitions'][key]
+                    self._months[key] = partitions.read_partition(self.partition_dir, entry)
+                frames.append(self._months[key])
+            # The requested months are the most recent, so only older ones are dropped
+            for key in list(self._months)[:max(len(self._months) - max(LOADED_MONTHS, len(months)), 0)]:
+                del self._months[key]
+        if not frames:
+            return pd.DataFrame()
+        return shared.freeze_frame(ingest.concat_sales(frames).reset_index(drop=True))
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from datastore.filters import ALL
+from datastore.rollup import TOTAL_MEASURES
+
+
+class PrefixSumIndex:
+    """
+    Per-day cumulative sums answering any date-range total with two lookups
+
+    Built from the sales cube (datastore.rollup). For every combination of
+    channel and category, including ALL for either, the index holds the
+    running totals of the cube measures over a dense daily calendar, so the
+    total for [start, end] is cumsum[end + 1] - cumsum[start] whatever the
+    length of the history. Order counts of a single category come from the
+    cube's category_orders, so an order spanning categories counts in each.
+
+    Parameters:
+    -----------
+    cube : pandas.DataFrame
+        Sales cube with วันที่ทำรายการ, ช่องทางการขาย and หมวดหมู่ keys
+    """
+
+    def __init__(self, cube, date_col='วันที่ทำรายการ', channel_col='ช่องทางการขาย', category_col='หมวดหมู่'):
+        cube = cube.dropna(subset=[date_col])
+        self.measures = [m for m in TOTAL_MEASURES if m in cube.columns]
+
+        if cube.empty:
+            self.start = None
+            self.n_days = 0
+            self._channels, self._categories = {}, {}
+            self._cumsum = {}
+            return
+
+        days = cube[date_col].to_numpy(dtype='datetime64[D]')
+        self.start = days.min()
+        self.n_days = int((days.max() - self.start).astype(int)) + 1
+        day_pos = (days - self.start).astype(np.int64)
+
+        # Code 0 is ALL, values are numbered from 1 and missing values are -1
+        channel_codes, channels = self._encode(cube, channel_col)
+        category_codes, categories = self._encode(cube, category_col)
+        self._channels = {value: i + 1 for i, value in enumerate(channels)}
+        self._categories = {value: i + 1 for i, value in enumerate(categories)}
+        n_channels, n_categories = len(channels) + 1, len(categories) + 1
+
+        # Every cube row adds to its own (channel, category) series and to the
+        # ALL series of each dimension; rows with a missing key only add to ALL
+        all_codes = np.zeros_like(channel_codes)
+        has_channel = channel_codes > 0
+        has_category = category_codes > 0
+        combos = [
+            (channel_codes, category_codes, has_channel & has_category, True),
+            (channel_codes, all_codes, has_channel, False),
+            (all_codes, category_codes, has_category, True),
+            (all_codes, all_codes, np.ones(len(cube), dtype=bool), False),
+        ]
+        self._cumsum = {}
+        for measure in self.measures:
+            values = cube[measure].to_numpy(dtype=np.float64)
+            category_values = values
+            if measure == 'orders' and 'category_orders' in cube.columns:
+                category_values = cube['category_orders'].to_numpy(dtype=np.float64)
+            daily = np.zeros(n_channels * n_categories * self.n_days)
+            for ch, cat, keep, by_category in combos:
+                flat = (ch[keep] * n_categories + cat[keep]) * self.n_days + day_pos[keep]
+                weights = category_values[keep] if by_category else values[keep]
+                daily += np.bincount(flat, weights=weights, minlength=daily.size)
+            daily = daily.reshape(n_channels * n_categories, self.n_days)
+            cumsum = np.zeros((daily.shape[0], self.n_days + 1))
+            np.cumsum(daily, axis=1, out=cumsum[:, 1:])
+            self._cumsum[measure] = cumsum
+        self._n_categories = n_categories
+
+    @staticmethod
+    def _encode(cube, col):
+        if col not in cube.columns:
+            return np.zeros(len(cube), dtype=np.int64), []
+        codes, uniques = pd.factorize(cube[col].to_numpy())
+        # Shift so that 0 is free for ALL; missing values stay -1
+        codes = np.where(codes >= 0, codes + 1, -1)
+        return codes, list(uniques)
+
+    def _day_offset(self, date, side):
+        offset = int((np.datetime64(pd.Timestamp(date).date(), 'D') - self.start).astype(int))
+        if side == 'end':
+            offset += 1
+        return min(max(offset, 0), self.n_days)
+
+    def totals(self, start_date=None, end_date=None, channel=ALL, category=ALL):
+        """
+        Return the measure totals for an inclusive date range
+
+        Parameters:
+        -----------
+        start_date, end_date : date-like, optional
+            Inclusive range; None uses the first or last indexed day
+        channel, category : str
+            Selected value, or ALL for no filter
+
+        Returns:
+        --------
+        dict
+            Total for each measure (มูลค่า, จำนวน, orders)
+        """
+        empty = {measure: 0.0 for measure in self.measures}
+        if self.start is None:
+            return empty
+        ch = 0 if channel in (None, ALL) else self._channels.get(channel)
+        cat = 0 if category in (None, ALL) else self._categories.get(category)
+        if ch is None or cat is None:
+            return empty
+
+        lo = 0 if start_date is None else self._day_offset(start_date, 'start')
+        hi = self.n_days if end_date is None else self._day_offset(end_date, 'end')
+        if hi <= lo:
+            return empty
+        row = ch * self._n_categories + cat
+        return {measure: float(cumsum[row, hi] - cumsum[row, lo]) for measure, cumsum in self._cumsum.items()}
+
+    def compare(self, start_date, end_date, channel=ALL, category=ALL):
+        """
+        Return the totals for a date range and for the equally long period just before it
+
+        Returns:
+        --------
+        tuple of dict
+            (current, previous) totals as returned by totals()
+        """
+        start = pd.Timestamp(start_date).normalize()
+        end = pd.Timestamp(end_date).normalize()
+        length = end - start + pd.Timedelta(days=1)
+        current = self.totals(start, end, channel, category)
+        previous = self.totals(start - length, start - pd.Timedelta(days=1), channel, category)
+        return current, previous
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+# Sums of a (weighted) least-squares fit of y on x; the aggregation backends
+# return them as a one-row frame so a fit is cached like any other section
+FIT_SUMS = ['n', 'sx', 'sy', 'sxx', 'sxy']
+
+
+def fit_sums(x, y, weights=None):
+    """
+    Return the sums a least-squares line is solved from
+
+    Points with a missing x, y or weight are skipped.
+
+    Parameters:
+    -----------
+    x, y : array-like
+        Coordinates of the points
+    weights : array-like, optional
+        Weight of every point (defaults to 1)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row with the FIT_SUMS columns
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    w = np.ones_like(x) if weights is None else np.asarray(weights, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y) | np.isnan(w))
+    x, y, w = x[valid], y[valid], w[valid]
+    sums = [w.sum(), (w * x).sum(), (w * y).sum(), (w * x * x).sum(), (w * x * y).sum()]
+    return pd.DataFrame([sums], columns=FIT_SUMS)
+
+
+def solve(sums):
+    """
+    Solve the least-squares line from the sums of fit_sums
+
+    Returns:
+    --------
+    tuple of float or None
+        (slope, intercept), or None when there are no points or x does not vary
+    """
+    if isinstance(sums, pd.DataFrame):
+        if sums.empty:
+            return None
+        sums = sums.iloc[0]
+    n, sx, sy, sxx, sxy = (float(sums[col]) for col in FIT_SUMS)
+    denominator = n * sxx - sx * sx
+    if n <= 0 or denominator <= 1e-12 * max(n * sxx, 1.0):
+        return None
+    slope = (n * sxy - sx * sy) / denominator
+    return slope, (sy - slope * sx) / n
+
+
+def fit_line(x, y, weights=None):
+    """Return the (weighted) least-squares (slope, intercept) of y on x, or None"""
+    return solve(fit_sums(x, y, weights))
@@ -0,0 +1,153 @@
+"""
+Lazy loading of the dashboard pages and a check of the cold-start time
+
+A session only shows one page at a time, so app.py imports a dashboard
+module, together with Plotly and the rest of its dependencies, when its
+page is first shown instead of at startup. Every import done through here
+is timed so the cost of a page's first paint can be reported.
+
+Run as a script to measure the imports of a fresh process for every page
+and check them against the startup budget:
+
+    python app/startup.py --budget 3.0
+"""
+import os
+import ast
+import sys
+import json
+import time
+import argparse
+import importlib
+import subprocess
+import pandas as pd
+
+# Module of every dashboard page, by the page key kept in the session state
+DASHBOARD_MODULES = {
+    'sales': 'dashboards.sales_dashboard',
+    'products': 'dashboards.product_dashboard',
+    'inventory': 'dashboards.inventory_dashboard',
+    'customers': 'dashboards.customer_dashboard',
+    'marketing': 'dashboards.marketing_dashboard',
+}
+
+# Directory of app.py and the app packages
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds a fresh process may spend importing the base modules and one page
+STARTUP_BUDGET_S = float(os.environ.get('DOGDAYS_STARTUP_BUDGET_S', 3.0))
+
+# Seconds spent on the first import of every module loaded through timed_import
+_import_times = {}
+
+
+def app_imports(path=os.path.join(APP_DIR, 'app.py')):
+    """
+    Return the modules app.py imports at the top level, in import order
+
+    Read from the source of app.py, so the list follows its imports. A name
+    imported from a package counts as a module when the package has a file
+    for it (from datastore import store); otherwise the package itself is
+    the module (from datetime import datetime). This module is left out.
+    """
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            package_dir = os.path.join(APP_DIR, *node.module.split('.'))
+            names = [f"{node.module}.{alias.name}" if os.path.exists(os.path.join(package_dir, alias.name + '.py'))
+                     else node.module for alias in node.names]
+        else:
+            continue
+        for name in names:
+            if name != 'startup' and name not in modules:
+                modules.append(name)
+    return modules
+
+
+# Modules app.py imports before any page is shown
+BASE_MODULES = app_imports()
+
+
+def timed_import(name):
+    """Import a module, recording how long the first import took"""
+    if name in sys.modules:
+        return sys.modules[name]
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_times[name] = time.perf_counter() - start
+    return module
+
+
+def load_dashboard(page):
+    """Return the dashboard module of a page, importing it on first use"""
+    return timed_import(DASHBOARD_MODULES[page])
+
+
+def import_report():
+    """Return the import times recorded in this process, slowest first"""
+    report = pd.DataFrame(list(_import_times.items()), columns=['module', 'seconds'])
+    return report.sort_values('seconds', ascending=False).reset_index(drop=True)
+
+
+def _measure(modules):
+    # Imports the modules one after the other in a fresh interpreter, so each
+    # time only counts what the modules before it had not loaded yet
+    code = ("import sys, json, time, importlib\n"
+            f"sys.path.insert(0, {APP_DIR!r})\n"
+            "times = {}\n"
+            f"for name in {list(modules)!r}:\n"
+            "    start = time.perf_counter()\n"
+            "    importlib.import_module(name)\n"
+            "    times[name] = time.perf_counter() - start\n"
+            "print(json.dumps(times))\n")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure_cold_start(pages=None):
+    """
+    Measure the imports of a fresh process showing each page
+
+    Parameters:
+    -----------
+    pages : list of str, optional
+        Page keys to measure (defaults to every page)
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per page and module with the import time in seconds; the
+        base modules are measured once, under the page 'base'
+    """
+    rows = [('base', name, seconds) for name, seconds in _measure(BASE_MODULES).items()]
+    for page in pages or list(DASHBOARD_MODULES):
+        module = DASHBOARD_MODULES[page]
+        rows.append((page, module, _measure(BASE_MODULES + [module])[module]))
+    return pd.DataFrame(rows, columns=['page', 'module', 'seconds'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start imports of every dashboard page")
+    parser.add_argument('--budget', type=float, default=STARTUP_BUDGET_S,
+                        help="Seconds allowed for the base imports plus one page")
+    args = parser.parse_args()
+
+    report = measure_cold_start()
+    print(report.to_string(index=False))
+
+    base = report.loc[report['page'] == 'base', 'seconds'].sum()
+    pages = report[report['page'] != 'base'].set_index('page')['seconds']
+    print(f"\nBase imports: {base:.3f}s")
+    over = False
+    for page, seconds in pages.items():
+        total = base + seconds
+        over |= total > args.budget
+        print(f"{page}: {total:.3f}s {'OVER BUDGET' if total > args.budget else 'ok'} (budget {args.budget:.1f}s)")
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
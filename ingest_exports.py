@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+import argparse
+
+# Make the app packages importable when running from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from datastore import exports
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert every monthly/platform sales export in the data directory into the unified columnar store"
+    )
+    parser.add_argument('--data-dir', default='data', help="directory holding the exports (default: data)")
+    parser.add_argument('--store-dir', default=None, help="output directory (default: <data-dir>/.cache/exports)")
+    parser.add_argument('--pattern', action='append', dest='patterns',
+                        help="glob pattern of the exports to ingest; may be repeated (default: *.xlsx, *.xls)")
+    parser.add_argument('--workers', type=int, default=None, help="number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    manifest = exports.ingest_exports(args.data_dir, args.store_dir, args.patterns, args.workers)
+    elapsed = time.perf_counter() - start
+
+    for name, entry in sorted(manifest.items()):
+        print(f"{name}: {entry['rows']} rows -> {entry['file']}")
+    total_rows = sum(entry['rows'] for entry in manifest.values())
+    print(f"Ingested {len(manifest)} exports ({total_rows} rows) in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
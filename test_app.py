@@ -1,7 +1,36 @@
 import os
 import sys
+import shutil
+import tempfile
 import pandas as pd
 
+# Make the app packages importable when running from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+SAMPLE_CSV = os.path.join('data', 'dog_days_sales_data.csv')
+
+def copy_sample(tmp_dir, rows=None):
+    """
+    Copy the sample CSV export into a temporary directory, so its caches are written there
+
+    With rows given, only the header and the first rows lines are copied; the
+    lines left out are returned so a test can append them to grow the export.
+    """
+    with open(SAMPLE_CSV, 'rb') as f:
+        lines = f.readlines()
+    end = len(lines) if rows is None else rows + 1
+    source = os.path.join(tmp_dir, 'sales.csv')
+    with open(source, 'wb') as f:
+        f.writelines(lines[:end])
+    return source, lines[end:]
+
+def sample_store(cache_dir):
+    """Return the refreshed sales store of the sample CSV, with its caches in cache_dir"""
+    from datastore import store
+    sales = store.SalesStore(SAMPLE_CSV, cache_dir=cache_dir)
+    sales.refresh()
+    return sales
+
 def test_data_loading():
     """Test if the data files can be loaded correctly"""
     print("Testing data loading...")
@@ -24,7 +53,8 @@ def test_data_loading():
     
     # Try to load the sales data
     try:
-        df = pd.read_excel(sales_file)
+        from datastore import ingest
+        df = ingest.read_xlsx(sales_file)
         print(f"SUCCESS: Sales data loaded successfully with {len(df)} rows")
     except Exception as e:
         print(f"ERROR: Failed to load sales data: {e}")
@@ -47,6 +77,817 @@ def test_imports():
         print(f"ERROR: Failed to import required modules: {e}")
         return False
 
+def test_lazy_dashboards():
+    """Test that dashboard pages and their Plotly dependencies load on first use"""
+    print("Testing lazy dashboard imports...")
+
+    import subprocess
+    import startup
+
+    # A fresh process importing what app.py needs before a page is shown
+    code = ("import sys; sys.path.insert(0, 'app')\n"
+            + "\n".join(f"import {name}" for name in startup.BASE_MODULES) + "\nimport startup\n"
+            "print(sorted(m for m in ('plotly.express', 'duckdb', 'dashboards.charts') if m in sys.modules))")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]', result.stdout
+    assert 'datastore.products' in startup.BASE_MODULES and 'startup' not in startup.BASE_MODULES
+
+    for page in startup.DASHBOARD_MODULES:
+        assert hasattr(startup.load_dashboard(page), 'render_dashboard')
+    assert list(startup.import_report().columns) == ['module', 'seconds']
+    print("SUCCESS: Dashboards imported on first use")
+
+def test_typed_cache():
+    """Test that the typed columnar cache is built once and reused"""
+    print("Testing typed cache...")
+
+    from datastore import ingest
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        source, _ = copy_sample(tmp_dir)
+        cache_dir = os.path.join(tmp_dir, 'cache')
+
+        df = ingest.load_typed_sales(source, cache_dir)
+        assert pd.api.types.is_datetime64_any_dtype(df['วันที่ทำรายการ'])
+        assert isinstance(df['ช่องทางการขาย'].dtype, pd.CategoricalDtype)
+        assert df['เบอร์โทรศัพท์ลูกค้า'].str.startswith('0').all()
+
+        # A touched but unchanged file must not trigger a rebuild
+        part_path = os.path.join(cache_dir, 'sales', 'part-00000.parquet')
+        built_at = os.stat(part_path).st_mtime_ns
+        os.utime(source)
+        cached = ingest.load_typed_sales(source, cache_dir)
+        assert os.stat(part_path).st_mtime_ns == built_at
+        pd.testing.assert_frame_equal(df, cached)
+        print("SUCCESS: Typed cache built and reused")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_incremental_ingest():
+    """Test that appended export lines are parsed on their own and merged"""
+    print("Testing incremental ingest...")
+
+    from datastore import ingest
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        source, rest = copy_sample(tmp_dir, rows=300)
+        cache_dir = os.path.join(tmp_dir, 'cache')
+
+        initial, watermark, appended = ingest.sync_typed_sales(source, cache_dir)
+        assert len(initial) == 300 and not appended
+
+        # Append the remaining rows; only those are parsed and returned
+        with open(source, 'ab') as f:
+            f.writelines(rest)
+        delta, watermark, appended = ingest.sync_typed_sales(source, cache_dir, watermark=watermark)
+        assert appended and len(delta) == len(rest)
+
+        full = ingest.apply_schema(ingest.read_source(SAMPLE_CSV))
+        merged = ingest.concat_sales([initial, delta])
+        pd.testing.assert_frame_equal(merged, full, check_categorical=False)
+        assert len(ingest.load_typed_sales(source, cache_dir)) == len(full)
+
+        # A line repeating the order and # of a loaded line is kept
+        with open(source, 'ab') as f:
+            f.write(rest[-1])
+        delta, watermark, appended = ingest.sync_typed_sales(source, cache_dir, watermark=watermark)
+        assert appended and len(delta) == 1
+        assert len(ingest.load_typed_sales(source, cache_dir)) == len(full) + 1
+
+        # A same-size edit after an append is a change, not a touch
+        with open(source, 'rb') as f:
+            content = f.read()
+        with open(source, 'wb') as f:
+            f.write(content.replace(b'DD141090', b'DD141091', 1))
+        os.utime(source, ns=(os.stat(source).st_atime_ns, os.stat(source).st_mtime_ns + 10 ** 9))
+        rows, watermark, appended = ingest.sync_typed_sales(source, cache_dir, watermark=watermark)
+        assert not appended and 'DD141091' in set(rows['รายการ'])
+
+        # An Excel export is parsed whole, but only the rows after the cached ones are returned
+        xlsx_source = os.path.join(tmp_dir, 'sales.xlsx')
+        raw = ingest.read_source(os.path.join('data', 'dog_days_sales_data.xlsx'))
+        raw.iloc[:300].to_excel(xlsx_source, index=False)
+        initial, watermark, appended = ingest.sync_typed_sales(xlsx_source, cache_dir)
+        assert len(initial) == 300 and not appended
+        raw.to_excel(xlsx_source, index=False)
+        delta, watermark, appended = ingest.sync_typed_sales(xlsx_source, cache_dir, watermark=watermark)
+        assert appended and len(delta) == len(raw) - 300
+        pd.testing.assert_frame_equal(ingest.concat_sales([initial, delta]),
+                                      ingest.apply_schema(ingest.read_source(xlsx_source)), check_categorical=False)
+
+        # Rows changed before the end make the cache rebuild
+        raw.iloc[::-1].to_excel(xlsx_source, index=False)
+        rows, watermark, appended = ingest.sync_typed_sales(xlsx_source, cache_dir, watermark=watermark)
+        assert not appended and len(rows) == len(raw)
+        print("SUCCESS: Appended rows ingested incrementally")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_export_ingestion():
+    """Test that every Excel export is normalized into the unified store"""
+    print("Testing export ingestion...")
+
+    from datastore import exports, store
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        manifest = exports.ingest_exports('data', store_dir=tmp_dir, max_workers=2)
+        assert len(manifest) == len(exports.discover_exports('data'))
+        df = exports.load_exports(tmp_dir)
+        assert list(df.columns) == exports.SALES_COLUMNS
+        assert len(df) == sum(entry['rows'] for entry in manifest.values())
+        assert pd.api.types.is_datetime64_any_dtype(df['วันที่ทำรายการ'])
+        assert df['วันที่ทำรายการ'].notna().all()
+
+        # The sales store reads a directory of exports through the unified store;
+        # a new export is appended to what it holds
+        data_dir = os.path.join(tmp_dir, 'exports')
+        os.makedirs(data_dir)
+        shutil.copy(os.path.join('data', 'dog_days_sales_data.xlsx'), data_dir)
+        sales_store = store.SalesStore(data_dir, cache_dir=os.path.join(tmp_dir, 'cache'))
+        version = sales_store.refresh()
+        assert sales_store.refresh() == version
+        shutil.copy(os.path.join('data', 'ตัวอย่างรายการขาย Online 05-67.xlsx'), data_dir)
+        sales_store.refresh()
+        assert sales_store._watermark['rows'] == len(df)
+        full = store.SalesStore(data_dir, cache_dir=os.path.join(tmp_dir, 'full'))
+        full.refresh()
+        measures = ['มูลค่า', 'จำนวน', 'orders', 'category_orders']
+        pd.testing.assert_series_equal(sales_store.cube[measures].sum(), full.cube[measures].sum())
+        assert len(sales_store.load_months(sales_store.months())) == len(df)
+
+        # A directory without exports keeps one version, so reruns do not sync it again
+        empty_dir = os.path.join(tmp_dir, 'empty')
+        os.makedirs(empty_dir)
+        empty = store.SalesStore(empty_dir, cache_dir=os.path.join(tmp_dir, 'empty-cache'))
+        version = empty.refresh()
+        assert empty._source_version is not None and empty.refresh() == version
+        assert empty.orders.empty and not empty.months()
+        print("SUCCESS: Exports ingested")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_month_partitions():
+    """Test that a date window only loads the month partitions it overlaps"""
+    print("Testing month partitions...")
+
+    from datastore import ingest, preprocess, store, filters
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        source, rest = copy_sample(tmp_dir, rows=300)
+        sales_store = store.SalesStore(source, cache_dir=os.path.join(tmp_dir, 'cache'))
+        sales_store.refresh()
+        with open(source, 'ab') as f:
+            f.writelines(rest)
+        sales_store.refresh()
+
+        full = preprocess.enrich_sales(ingest.apply_schema(ingest.read_source(source)))
+        start_date = pd.Timestamp('2025-02-10')
+        end_date = pd.Timestamp('2025-03-20')
+        months = sales_store.months(start_date, end_date)
+        assert months == ('2025-02', '2025-03')
+
+        window = sales_store.load_months(months)
+        assert len(window) == full['month_year'].isin(months).sum()
+        assert set(sales_store._months) == set(months)
+
+        # The window answers the range exactly like the full data
+        selected = filters.FilterIndex(window).select(start_date, end_date)
+        expected = full[full['วันที่ทำรายการ'].between(start_date, end_date)]
+        assert sorted(selected['รายการ']) == sorted(expected['รายการ'])
+
+        # Widening the range adds the earlier months to the loaded ones
+        sales_store.load_months(sales_store.months(start_date - pd.Timedelta(days=31), end_date))
+        assert set(sales_store._months) == {'2025-01', '2025-02', '2025-03'}
+        assert len(sales_store.load_months(sales_store.months())) == len(full)
+
+        # Beyond LOADED_MONTHS the least recently used months are dropped,
+        # but a wider window keeps all of its months
+        loaded_months = store.LOADED_MONTHS
+        store.LOADED_MONTHS = 2
+        try:
+            sales_store.load_months(('2025-01',))
+            sales_store.load_months(('2025-02',))
+            assert list(sales_store._months) == ['2025-01', '2025-02']
+            window = sales_store.load_months(('2025-01', '2025-02', '2025-03'))
+            assert list(sales_store._months) == ['2025-01', '2025-02', '2025-03']
+            assert len(window) == full['month_year'].isin(['2025-01', '2025-02', '2025-03']).sum()
+        finally:
+            store.LOADED_MONTHS = loaded_months
+
+        # A full build read in small batches holds the same data
+        batch_rows = ingest.BATCH_ROWS
+        ingest.BATCH_ROWS = 120
+        try:
+            batched = store.SalesStore(source, cache_dir=os.path.join(tmp_dir, 'batched'))
+            batched.refresh()
+        finally:
+            ingest.BATCH_ROWS = batch_rows
+        measures = ['มูลค่า', 'จำนวน', 'orders', 'category_orders']
+        pd.testing.assert_series_equal(batched.cube[measures].sum(), sales_store.cube[measures].sum())
+        assert len(batched.orders) == len(sales_store.orders) == full['รายการ'].nunique()
+        assert len(batched.customers) == len(sales_store.customers)
+        pd.testing.assert_frame_equal(batched.cohorts.table(), sales_store.cohorts.table())
+        assert batched.months() == sales_store.months()
+        assert len(batched.load_months(batched.months())) == len(full)
+        print("SUCCESS: Month partitions load only the selected window")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_sql_aggregates():
+    """Test that the SQL backend returns the same aggregations as pandas"""
+    print("Testing SQL aggregates...")
+
+    from datastore import filters, aggregates
+
+    if not aggregates.sql_available():
+        print("SKIPPED: duckdb is not installed")
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales_store = sample_store(tmp_dir)
+
+        for selected in [{'start_date': pd.Timestamp('2025-01-05'), 'end_date': pd.Timestamp('2025-03-20'),
+                          'category': filters.ALL, 'channel': filters.ALL},
+                         {'start_date': pd.Timestamp('2024-12-01'), 'end_date': pd.Timestamp('2025-05-14'),
+                          'category': 'Treats', 'channel': 'Shopee'}]:
+            months = sales_store.months(selected['start_date'], selected['end_date'])
+            rows = filters.FilterIndex(sales_store.load_months(months)).select(**selected)
+            expected = aggregates.FrameAggregates(rows)
+            actual = aggregates.SQLAggregates(sales_store.partition_files(months), **selected)
+
+            for key in ['จังหวัด', 'หมวดหมู่', 'ช่องทางการขาย']:
+                pd.testing.assert_frame_equal(actual.sales_by(key).sort_values(key, ignore_index=True),
+                                              expected.sales_by(key).sort_values(key, ignore_index=True),
+                                              check_dtype=False, check_categorical=False)
+            pd.testing.assert_frame_equal(actual.daily_sales(), expected.daily_sales(), check_dtype=False)
+            pd.testing.assert_frame_equal(actual.customer_rfm().sort_values('ชื่อลูกค้า', ignore_index=True),
+                                          expected.customer_rfm().sort_values('ชื่อลูกค้า', ignore_index=True),
+                                          check_dtype=False)
+            pd.testing.assert_frame_equal(actual.discount_summary(), expected.discount_summary(), check_dtype=False)
+            assert (actual.customers_by_province().set_index('จังหวัด')['จำนวนลูกค้า'].sort_index().tolist()
+                    == expected.customers_by_province().set_index('จังหวัด')['จำนวนลูกค้า'].sort_index().tolist())
+            product = rows['ชื่อสินค้า'].iloc[0]
+            pd.testing.assert_frame_equal(actual.daily_sales({'ชื่อสินค้า': product}),
+                                          expected.daily_sales({'ชื่อสินค้า': product}), check_dtype=False)
+            pd.testing.assert_frame_equal(actual.line_fit('ส่วนลด', 'มูลค่า', weight='จำนวน'),
+                                          expected.line_fit('ส่วนลด', 'มูลค่า', weight='จำนวน'), check_dtype=False)
+        print("SUCCESS: SQL aggregates match pandas")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_order_table():
+    """Test the order fact table against the line-level results"""
+    print("Testing order fact table...")
+
+    from datastore import orders, aggregates, rfm, customers
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales = sample_store(tmp_dir)
+        lines = sales.load_months(sales.months()).reset_index(drop=True)
+
+        table = orders.build_orders(lines)
+        assert len(table) == lines['รายการ'].nunique() and table['lines'].sum() == len(lines)
+        assert abs(table['มูลค่า'].sum() - lines['มูลค่า'].sum()) < 1e-6
+
+        # Order-level fields only on the first line, and an order split across two batches
+        export = pd.DataFrame({'รายการ': ['A', 'A', 'B', 'B', 'B', 'C'],
+                               'ชื่อลูกค้า': ['Somchai', None, 'Anan', None, None, 'Somchai'],
+                               'วันที่ทำรายการ': pd.to_datetime(['2025-01-01'] * 2 + ['2025-01-02'] * 3 + ['2025-01-03']),
+                               'มูลค่า': [100.0, 50.0, 10.0, 20.0, 30.0, 5.0],
+                               'จำนวน': [1, 2, 1, 1, 1, 3]})
+        expected = orders.build_orders(export)
+        assert expected['ชื่อลูกค้า'].tolist() == ['Somchai', 'Anan', 'Somchai']
+        assert expected['มูลค่า'].tolist() == [150.0, 60.0, 5.0] and expected['lines'].tolist() == [2, 3, 1]
+        merged = orders.merge_orders(orders.build_orders(export.iloc[:3]), orders.build_orders(export.iloc[3:]))
+        pd.testing.assert_frame_equal(merged, expected, check_dtype=False)
+        expected['customer_key'] = customers.CustomerDimension().resolve(expected)
+        assert rfm.compute(expected).set_index('ชื่อลูกค้า')['Frequency'].to_dict() == {'Anan': 1, 'Somchai': 2}
+
+        # Customers are resolved by identity, so group the lines by the same keys
+        by_orders = aggregates.FrameAggregates(lines, orders=sales.orders).customer_rfm()
+        keyed = lines.assign(customer_key=customers.CustomerDimension().resolve(lines))
+        by_lines = keyed.groupby('customer_key').agg(Frequency=('รายการ', 'nunique'), Monetary=('มูลค่า', 'sum'))
+        assert len(by_orders) == len(by_lines) == len(sales.customers)
+        assert sorted(zip(by_orders['Frequency'], by_orders['Monetary'].round(6))) == \
+            sorted(zip(by_lines['Frequency'], by_lines['Monetary'].round(6)))
+
+        # Without order rows, both backends key the lines' orders through the order table
+        backends = [aggregates.FrameAggregates(lines, order_keys=sales.orders)]
+        if aggregates.sql_available():
+            backends.append(aggregates.SQLAggregates(sales.partition_files(sales.months()), order_keys=sales.orders))
+        for backend in backends:
+            pd.testing.assert_frame_equal(backend.customer_rfm().sort_values(['ชื่อลูกค้า', 'Monetary'], ignore_index=True),
+                                          by_orders.sort_values(['ชื่อลูกค้า', 'Monetary'], ignore_index=True),
+                                          check_dtype=False)
+            pd.testing.assert_frame_equal(backend.customers_by_province().sort_values('จังหวัด', ignore_index=True),
+                                          aggregates.FrameAggregates(lines, orders=sales.orders).customers_by_province()
+                                          .sort_values('จังหวัด', ignore_index=True),
+                                          check_dtype=False, check_categorical=False)
+        print("SUCCESS: Order table matches the lines")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_rfm_segments():
+    """Test the vectorized RFM engine against the pandas segmentation"""
+    print("Testing RFM segments...")
+
+    import numpy as np
+    from datastore import orders, rfm
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales = sample_store(tmp_dir)
+        table = rfm.compute(sales.orders)
+
+        # Scores as pd.qcut over first-ranks, for ties and small tables too
+        for values in [table['Recency'], table['Monetary'], pd.Series([5, 5, 5, 1]), pd.Series([2.0, 1.0, 3.0])]:
+            expected = pd.qcut(values.rank(method='first'), 3, labels=[1, 2, 3]).astype(int).to_numpy()
+            assert (rfm.tercile_scores(values) == expected).all()
+        segments = rfm.segment(table)
+        assert segments['Segment'].notna().all()
+        assert segments['RecencyScore'].value_counts().between(len(table) // 3, -(-len(table) // 3)).all()
+
+        # The store state matches a fresh computation, also after an update
+        state = rfm.CustomerRFM(sales.customer_dim)
+        for part in (sales.orders.iloc[:300], sales.orders.iloc[300:]):
+            state.add(part)
+        pd.testing.assert_frame_equal(state.table().sort_values('ชื่อลูกค้า', ignore_index=True),
+                                      table.sort_values('ชื่อลูกค้า', ignore_index=True))
+        print("SUCCESS: RFM segments computed on integer keys")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_customer_dimension():
+    """Test customer identity resolution and its surrogate keys"""
+    print("Testing customer dimension...")
+
+    from datastore import store, customers, rfm, cohorts
+
+    # Linked through any identifier, also in a chain; names only without one
+    records = pd.DataFrame({
+        'รหัสลูกค้า': [1, None, None, None, 2, None, None],
+        'ชื่อลูกค้า': ['Anan', 'Anan K.', 'Anan', 'Malee', 'Malee', 'Nok', 'Nok'],
+        'อีเมลลูกค้า': ['anan@x.com', ' ANAN@x.com', 'a2@x.com', None, None, None, None],
+        'เบอร์โทรศัพท์ลูกค้า': [None, None, '+66 81 234 5678', None, '081-234-5678', None, None],
+    })
+    dimension = customers.CustomerDimension()
+    keys = dimension.resolve(records)
+    assert keys.dtype == 'int32' and keys.tolist() == [0, 0, 1, 2, 1, 3, 3]
+
+    # A later order linking two customers merges them into the lower key
+    later = pd.DataFrame({'รหัสลูกค้า': [1], 'ชื่อลูกค้า': ['Anan'], 'อีเมลลูกค้า': ['a2@x.com']})
+    assert dimension.resolve(later).tolist() == [0] and dimension.merges == 1
+    assert dimension.canonical(keys).tolist() == [0, 0, 0, 2, 0, 3, 3]
+    assert dimension.table()['customer_key'].tolist() == [0, 2, 3]
+
+    # Exports can leave an identifier blank in every record of a batch
+    blank = pd.DataFrame({'รหัสลูกค้า': [float('nan')] * 2, 'ชื่อลูกค้า': ['Ploy', 'Anan'],
+                          'อีเมลลูกค้า': ['ploy@x.com', 'anan@x.com']})
+    assert dimension.resolve(blank).tolist() == [4, 0]
+
+    # Appending to the store keeps the same customers as building it at once
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        source, rest = copy_sample(tmp_dir, rows=300)
+        sales = store.SalesStore(source, cache_dir=os.path.join(tmp_dir, 'cache'))
+        sales.refresh()
+        with open(source, 'ab') as f:
+            f.writelines(rest)
+        sales.refresh()
+        full = sample_store(os.path.join(tmp_dir, 'full'))
+
+        assert len(sales.customers) == len(full.customers)
+        assert sales.orders['customer_key'].dtype == 'int32'
+        assert (sales.orders['customer_key'] >= 0).all()
+        pd.testing.assert_frame_equal(sales.customer_rfm.table().sort_values(['ชื่อลูกค้า', 'Monetary'], ignore_index=True),
+                                      rfm.compute(full.orders).sort_values(['ชื่อลูกค้า', 'Monetary'], ignore_index=True))
+        pd.testing.assert_frame_equal(sales.cohorts.table(), cohorts.compute(full.orders))
+        print("SUCCESS: Customers resolved to integer keys")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_customer_cohorts():
+    """Test the cohort retention matrices against a pandas groupby"""
+    print("Testing customer cohorts...")
+
+    from datastore import cohorts, aggregates
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales = sample_store(tmp_dir)
+        table = cohorts.compute(sales.orders)
+        pd.testing.assert_frame_equal(sales.cohorts.table(), table)
+
+        # Same customers and revenue per cell as grouping by first-purchase month
+        months = sales.orders['วันที่ทำรายการ'].dt.to_period('M')
+        first = months.groupby(sales.orders['customer_key']).transform('min')
+        ages = (months.dt.year - first.dt.year) * 12 + months.dt.month - first.dt.month
+        expected = sales.orders.groupby([first.dt.to_timestamp(), ages]).agg(
+            customers=('customer_key', 'nunique'), revenue=('มูลค่า', 'sum'))
+        observed = table[table['customers'] > 0].set_index(['cohort', 'months_since'])
+        assert observed['customers'].tolist() == expected['customers'].tolist()
+        assert ((observed['revenue'] - expected['revenue'].to_numpy()).abs() < 1e-6).all()
+        assert (table.loc[table['months_since'] == 0, 'retention'] == 1).all()
+
+        # Adding one month at a time gives the same matrices; older orders are refused
+        state = cohorts.CohortState()
+        for _, month in sales.orders.groupby(months):
+            assert state.add(month)
+        pd.testing.assert_frame_equal(state.table(), table)
+        assert not state.add(sales.orders.iloc[:5])
+
+        # Without order rows both backends key the orders through the order table
+        lines = sales.load_months(sales.months())
+        by_frame = aggregates.FrameAggregates(lines, order_keys=sales.orders).customer_cohorts()
+        if aggregates.sql_available():
+            by_sql = aggregates.SQLAggregates(sales.partition_files(sales.months()),
+                                              order_keys=sales.orders).customer_cohorts()
+            pd.testing.assert_frame_equal(by_sql, by_frame)
+        pd.testing.assert_frame_equal(by_frame, table, check_dtype=False)
+        print("SUCCESS: Cohort matrices match")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_customer_lifetime_value():
+    """Test the batched CLV against a per-customer calculation"""
+    print("Testing customer lifetime value...")
+
+    import math
+    from datastore import rfm, clv
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales = sample_store(tmp_dir)
+        table = rfm.compute(sales.orders)
+        scored = clv.lifetime_value(table)
+        assert len(scored) == len(table) and scored['CLV'].is_monotonic_decreasing
+        assert scored['PAlive'].between(0, 1).all() and (scored['CLV'] >= 0).all()
+
+        # The same numbers one customer at a time
+        repeats = (table['Frequency'] - 1).clip(lower=0)
+        exposure = (table['Tenure'] + 1).clip(lower=clv.MIN_EXPOSURE_DAYS)
+        shape, rate = clv.purchase_prior(repeats.to_numpy(float), exposure.to_numpy(float))
+        mean_order = table['Monetary'].sum() / table['Frequency'].sum()
+        for row in scored.head(5).itertuples():
+            purchase_rate = (shape + max(row.Frequency - 1, 0)) / (rate + max(row.Tenure + 1, clv.MIN_EXPOSURE_DAYS))
+            order_value = (row.Monetary + clv.AOV_PRIOR_ORDERS * mean_order) / (row.Frequency + clv.AOV_PRIOR_ORDERS)
+            expected = purchase_rate * clv.CLV_HORIZON_DAYS * math.exp(-purchase_rate * row.Recency) * order_value
+            assert abs(row.CLV - expected) < 1e-6 * expected
+
+        assert clv.lifetime_value(table.iloc[:0])['CLV'].empty
+        print("SUCCESS: Lifetime value computed for every customer")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_product_summary():
+    """Test the per-product summary against filtering the lines per product"""
+    print("Testing product summary...")
+
+    import numpy as np
+    from datastore import products, aggregates, trend
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales = sample_store(tmp_dir)
+        lines = sales.load_months(sales.months())
+        summary = products.ProductSummary(lines)
+        assert summary.products == sorted(lines['ชื่อสินค้า'].unique())
+
+        frame = aggregates.FrameAggregates(lines)
+        for product in summary.products:
+            product_lines = lines[lines['ชื่อสินค้า'] == product]
+            metrics = summary.product_metrics(product)
+            assert metrics['จำนวน'] == product_lines['จำนวน'].sum()
+            assert abs(metrics['มูลค่า'] - product_lines['มูลค่า'].sum()) < 1e-6
+            assert abs(metrics['ส่วนลดต่อหน่วย'] - product_lines['ส่วนลดต่อหน่วย'].mean()) < 1e-9
+            assert sorted(summary.rows(product)['รายการ']) == sorted(product_lines['รายการ'])
+            pd.testing.assert_frame_equal(summary.daily_sales(product).reset_index(drop=True),
+                                          frame.daily_sales(where={'ชื่อสินค้า': product}), check_dtype=False)
+            channels = frame.sales_by('ช่องทางการขาย', where={'ชื่อสินค้า': product})
+            assert summary.channel_sales(product).set_index('ช่องทางการขาย')['มูลค่า'].to_dict() == \
+                channels.set_index('ช่องทางการขาย')['มูลค่า'].to_dict()
+            # The discount trend line is solved from the sums kept per product
+            fit = summary.discount_fit(product)
+            expected = trend.solve(frame.line_fit('ส่วนลดต่อหน่วย', 'จำนวน', where={'ชื่อสินค้า': product}))
+            assert (fit is None and expected is None) or np.allclose(fit, expected)
+
+        assert summary.product_metrics('no such product') is None and summary.rows('no such product').empty
+        assert summary.discount_fit('no such product') is None
+        print("SUCCESS: Product summary matches the lines")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_recent_orders():
+    """Test that the recent-orders feed matches sorting the whole table"""
+    print("Testing recent orders feed...")
+
+    import numpy as np
+    from datastore import filters, recent
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sales = sample_store(tmp_dir)
+        lines = sales.load_months(sales.months()).reset_index(drop=True)
+
+        # A small capacity so some answers have to fall back to the full data
+        feed = recent.RecentOrders(capacity=20)
+        for batch in np.array_split(np.arange(len(lines)), 3):
+            feed.update(lines.take(batch))
+
+        ordered = lines.assign(seq=np.arange(len(lines))).sort_values(['วันที่ทำรายการ', 'seq'], ascending=False)
+        answered = 0
+        for selection in [{}, {'channel': 'Shopee'}, {'status': 'ยกเลิก'},
+                          {'category': 'Treats', 'start_date': pd.Timestamp('2025-01-01')},
+                          {'end_date': pd.Timestamp('2024-12-31')}]:
+            latest = feed.latest(10, **selection)
+            if latest is None:
+                continue
+            expected = ordered
+            for key, col in [('channel', 'ช่องทางการขาย'), ('status', 'สถานะรายการ'), ('category', 'หมวดหมู่')]:
+                if key in selection:
+                    expected = expected[expected[col] == selection[key]]
+            if 'start_date' in selection:
+                expected = expected[expected['วันที่ทำรายการ'] >= selection['start_date']]
+            if 'end_date' in selection:
+                expected = expected[expected['วันที่ทำรายการ'] <= selection['end_date']]
+            assert latest['รายการ'].tolist() == expected['รายการ'].head(10).tolist(), selection
+            answered += 1
+        assert answered >= 3
+        assert feed.latest(10, channel=filters.ALL, status=filters.ALL) is not None
+        print("SUCCESS: Recent orders answered without sorting the table")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_result_cache():
+    """Test LRU eviction and hit counting of the dashboard result cache"""
+    print("Testing result cache...")
+
+    from datastore import ingest, preprocess, resultcache, aggregates, filters
+
+    frame = pd.DataFrame({'มูลค่า': range(100)})
+    size = resultcache.estimate_size(frame)
+    cache = resultcache.ResultCache(max_bytes=2 * size)
+    for section in ['a', 'b', 'a', 'c']:
+        cache.get_or_compute(cache.make_key('v1', 'sales', section), lambda: frame)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (1, 3, 1, 2)
+    # 'b' was least recently used, so it was evicted and 'a' kept
+    cache.get_or_compute(cache.make_key('v1', 'sales', 'a'), lambda: frame)
+    assert cache.stats()['hits'] == 2
+
+    # Equal filter states hit the same entry whatever their date types
+    df = preprocess.enrich_sales(ingest.apply_schema(ingest.read_source(os.path.join('data', 'dog_days_sales_data.csv'))))
+    selected = {'start_date': pd.Timestamp('2025-01-01').date(), 'end_date': pd.Timestamp('2025-03-31'),
+                'category': filters.ALL, 'channel': filters.ALL}
+    cache = resultcache.ResultCache()
+    first = aggregates.CachedAggregates(lambda: aggregates.FrameAggregates(df), cache, 'v1', 'products', selected)
+    again = aggregates.CachedAggregates(lambda: aggregates.FrameAggregates(df), cache,
+                                        'v1', 'products', {**selected, 'start_date': pd.Timestamp('2025-01-01')})
+    result = first.sales_by('ชื่อสินค้า', where={'หมวดหมู่': 'Treats'})
+    assert again.sales_by('ชื่อสินค้า', where={'หมวดหมู่': 'Treats'}) is result
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+    print("SUCCESS: Result cache evicts and counts")
+
+def test_figure_cache():
+    """Test that equal data and options reuse the cached figure"""
+    print("Testing figure cache...")
+
+    import plotly.express as px
+    from dashboards import charts
+
+    data = pd.DataFrame({'ช่องทางการขาย': ['Shopee', 'Lazada'], 'มูลค่า': [100.0, 50.0]})
+    assert charts.frame_digest(data) == charts.frame_digest(data.copy())
+    assert charts.frame_digest(data) != charts.frame_digest(data.assign(มูลค่า=[100.0, 60.0]))
+
+    cache = charts.get_figure_cache()
+    cache.clear()
+    before = cache.stats()
+    for df in (data, data.copy()):
+        charts.render_chart(px.bar, df, x='ช่องทางการขาย', y='มูลค่า', layout=dict(height=400))
+    charts.render_chart(px.bar, data, x='ช่องทางการขาย', y='มูลค่า', layout=dict(height=500))
+    stats = cache.stats()
+    assert stats['hits'] - before['hits'] == 1 and stats['misses'] - before['misses'] == 2
+
+    # The cache holds JSON specs, sized by their encoded length
+    spec, _ = charts.build_spec(px.bar, data, x='ช่องทางการขาย', y='มูลค่า', layout=dict(height=400))
+    assert isinstance(spec, str) and stats['bytes'] > len(spec.encode())
+
+    # Selections of frozen data are keyed by version and filters, without hashing the rows
+    from datastore import shared, filters
+    lines = shared.freeze_frame(pd.DataFrame({'วันที่ทำรายการ': pd.to_datetime(['2025-01-01', '2025-01-02']),
+                                              'ช่องทางการขาย': ['Shopee', 'Lazada'], 'มูลค่า': [100.0, 50.0]}))
+    index = filters.FilterIndex(lines)
+    first, again = index.select(channel='Shopee'), index.select(channel='Shopee')
+    assert first is not again and shared.frame_version(first) == shared.frame_version(again)
+    assert shared.frame_version(index.select(channel='Lazada')) != shared.frame_version(first)
+    digest = charts.frame_digest
+    charts.frame_digest = None
+    try:
+        before = cache.stats()
+        for df in (first, again):
+            charts.render_chart(px.bar, df, x='ช่องทางการขาย', y='มูลค่า')
+    finally:
+        charts.frame_digest = digest
+    stats = cache.stats()
+    assert stats['hits'] - before['hits'] == 1 and stats['misses'] - before['misses'] == 1
+    print("SUCCESS: Figures reused from the cache")
+
+def test_trend_fit():
+    """Test the closed-form trend line against numpy's polynomial fit"""
+    print("Testing trend fit...")
+
+    import numpy as np
+    from datastore import trend
+
+    rng = np.random.default_rng(0)
+    x = rng.uniform(0, 100, 1000)
+    y = 3.0 * x + 5.0 + rng.normal(0, 10, 1000)
+    w = rng.uniform(1, 5, 1000)
+    np.testing.assert_allclose(trend.fit_line(x, y), np.polyfit(x, y, 1))
+    # polyfit weights the residuals, so squared weights give the same fit
+    np.testing.assert_allclose(trend.fit_line(x, y, w), np.polyfit(x, y, 1, w=np.sqrt(w)))
+    assert trend.fit_line(np.full(5, 2.0), np.arange(5.0)) is None
+    assert trend.fit_line([], []) is None
+    print("SUCCESS: Trend fit matches numpy")
+
+def test_large_chart_modes():
+    """Test that long lines are downsampled and large scatters drawn lighter"""
+    print("Testing large chart modes...")
+
+    import numpy as np
+    import plotly.express as px
+    from dashboards import charts
+
+    dates = pd.date_range('2020-01-01', periods=5000, freq='D')
+    values = np.sin(np.arange(5000) / 50.0)
+    values[1234] = 10.0
+    keep = charts.lttb(dates, values, 500)
+    assert len(keep) == 500 and keep[0] == 0 and keep[-1] == 4999
+    assert (np.diff(keep) > 0).all() and 1234 in keep
+    assert len(charts.lttb(dates[:100], values[:100], 500)) == 100
+
+    daily = pd.DataFrame({'วันที่ทำรายการ': dates, 'มูลค่า': values})
+    _, data, _, note = charts.prepare_chart(px.line, daily, {'x': 'วันที่ทำรายการ', 'y': 'มูลค่า'})
+    assert len(data) == charts.MAX_LINE_POINTS and f"{5000 - charts.MAX_LINE_POINTS:,}" in note
+    _, _, options, _ = charts.prepare_chart(px.scatter, daily, {'x': 'วันที่ทำรายการ', 'y': 'มูลค่า'})
+    assert options['render_mode'] == 'webgl'
+    print("SUCCESS: Large charts drawn in a lighter mode")
+
+def test_table_pages():
+    """Test server-side search, sort and paging of the table component"""
+    print("Testing table pages...")
+
+    from dashboards import tables
+
+    df = pd.DataFrame({'ชื่อลูกค้า': ['Somchai', 'Anan', None, 'Somsri', 'Niran'],
+                       'มูลค่า': [300.0, None, 100.0, 500.0, 200.0]})
+    positions = tables.table_view(df, search='som')
+    assert df.take(positions)['ชื่อลูกค้า'].tolist() == ['Somchai', 'Somsri']
+
+    positions = tables.table_view(df, sort_by='มูลค่า', ascending=False)
+    assert df.take(positions)['มูลค่า'].tolist()[:4] == [500.0, 300.0, 200.0, 100.0]
+    assert pd.isna(df.take(positions)['มูลค่า'].iloc[-1])
+
+    assert len(tables.page_rows(df, positions, 0, page_size=2)) == 2
+    assert tables.page_rows(df, positions, 2, page_size=2)['ชื่อลูกค้า'].tolist() == ['Anan']
+
+    # Frozen frames are keyed by their version instead of their content
+    from datastore import shared
+    frozen = shared.freeze_frame(df.copy())
+    assert shared.frame_version(frozen) is not None and shared.frame_version(df) is None
+    assert shared.frame_version(shared.freeze_frame(df.copy())) != shared.frame_version(frozen)
+    assert shared.frame_version(frozen.copy()) is None
+
+    # Tables derived from the shared product list keep one version across reruns
+    from dashboards import inventory_dashboard
+    product_df = shared.freeze_frame(pd.DataFrame({'รหัสสินค้า': ['DD001', 'DD002'], 'ชื่อสินค้า': ['A', 'B']}))
+    first, again = (inventory_dashboard.freeze_table(product_df, product_df.copy(), 'inventory') for _ in range(2))
+    assert first is not again and shared.frame_version(first) == shared.frame_version(again)
+    assert shared.frame_version(inventory_dashboard.freeze_table(product_df, product_df.copy(), 'low_stock')) \
+        != shared.frame_version(first)
+    print("SUCCESS: Tables searched, sorted and paged on the server")
+
+def test_shared_frame_is_read_only():
+    """Test that the frame shared between sessions rejects modification"""
+    print("Testing shared frame...")
+
+    from datastore import shared
+
+    frozen = shared.freeze_frame(pd.DataFrame({'มูลค่า': [100.0, 200.0], 'จำนวน': [1, 2]}))
+    for mutate in (lambda: frozen.__setitem__('new', 1),
+                   lambda: frozen.iloc.__setitem__((0, 0), 0.0),
+                   lambda: frozen['จำนวน'].to_numpy().__setitem__(0, 5),
+                   lambda: frozen.rename(columns={'จำนวน': 'units'}, inplace=True),
+                   lambda: frozen.drop(columns=['จำนวน'], inplace=True),
+                   lambda: setattr(frozen, 'columns', ['a', 'b']),
+                   lambda: setattr(frozen, 'index', [1, 0]),
+                   lambda: frozen.sort_values('มูลค่า', ascending=False, inplace=True),
+                   lambda: frozen.sort_index(ascending=False, inplace=True),
+                   lambda: frozen.reset_index(drop=True, inplace=True),
+                   lambda: frozen.fillna(0, inplace=True),
+                   lambda: frozen.replace(100.0, 0.0, inplace=True),
+                   lambda: frozen.isetitem(1, [3, 4])):
+        try:
+            mutate()
+        except (shared.ReadOnlyDataFrameError, ValueError):
+            pass
+        else:
+            raise AssertionError("Shared frame was modified")
+    assert list(frozen.columns) == ['มูลค่า', 'จำนวน'] and frozen['จำนวน'].tolist() == [1, 2]
+
+    # Derived frames are ordinary, writable DataFrames
+    derived = frozen[frozen['จำนวน'] > 1].copy()
+    derived['new'] = 1
+    assert type(derived) is pd.DataFrame
+    print("SUCCESS: Shared frame is read-only")
+
+def test_filter_index():
+    """Test that the filter index matches a plain boolean scan"""
+    print("Testing filter index...")
+
+    from datastore import ingest, filters
+
+    df = ingest.apply_schema(ingest.read_source(os.path.join('data', 'dog_days_sales_data.csv')))
+    index = filters.FilterIndex(df)
+    first_date, last_date = index.date_range
+    start_date = first_date + pd.Timedelta(days=20)
+    end_date = last_date - pd.Timedelta(days=20)
+
+    for category, channel in [(filters.ALL, filters.ALL), ('Treats', filters.ALL), ('Dry Food', 'Shopee')]:
+        expected = df['วันที่ทำรายการ'].between(start_date, end_date)
+        if category != filters.ALL:
+            expected &= df['หมวดหมู่'] == category
+        if channel != filters.ALL:
+            expected &= df['ช่องทางการขาย'] == channel
+        selected = index.select(start_date, end_date, category, channel)
+        pd.testing.assert_frame_equal(selected, df[expected])
+
+    assert index.select(category='Unknown').empty
+    print("SUCCESS: Filter index matches boolean scan")
+
+def test_real_export_cube():
+    """Test that the sales cube is built from a real export with blank amounts and units"""
+    print("Testing sales cube on a real export...")
+
+    from datastore import ingest, preprocess, rollup
+
+    source = os.path.join('data', 'ตัวอย่างรายการขาย Online 05-67.xlsx')
+    df = preprocess.enrich_sales(ingest.apply_schema(ingest.read_source(source)))
+    assert df['จำนวน'].isna().any() and df['มูลค่า'].isna().any()
+
+    cube = rollup.build_sales_cube(df)
+    assert cube['จำนวน'].dtype == 'int64'
+    assert cube['จำนวน'].sum() == df['จำนวน'].sum()
+    assert abs(cube['มูลค่า'].sum() - df['มูลค่า'].sum()) < 1e-6
+    assert cube['orders'].sum() == df['รายการ'].nunique()
+    print("SUCCESS: Cube built from the real export")
+
+def test_prefix_sum_totals():
+    """Test that prefix-sum range totals match a scan of the line items"""
+    print("Testing prefix-sum index...")
+
+    from datastore import ingest, preprocess, rollup, timeindex
+
+    df = preprocess.enrich_sales(ingest.apply_schema(ingest.read_source(os.path.join('data', 'dog_days_sales_data.csv'))))
+    start_date = df['วันที่ทำรายการ'].min() + pd.Timedelta(days=30)
+    end_date = start_date + pd.Timedelta(days=45)
+
+    # One order with a Treats line first and a Dry Food line after it
+    multi = pd.concat([df[df['หมวดหมู่'] == 'Treats'].head(1), df[df['หมวดหมู่'] == 'Dry Food'].head(1)])
+    multi['รายการ'] = 'MULTI-CATEGORY'
+    multi['ช่องทางการขาย'] = 'Lazada'
+    multi['วันที่ทำรายการ'] = start_date + pd.Timedelta(days=1)
+    df = pd.concat([df, multi], ignore_index=True)
+    index = timeindex.PrefixSumIndex(rollup.build_sales_cube(df))
+
+    for channel, category in [('All', 'All'), ('Shopee', 'All'), ('All', 'Treats'), ('Lazada', 'Dry Food')]:
+        mask = df['วันที่ทำรายการ'].between(start_date, end_date)
+        if channel != 'All':
+            mask &= df['ช่องทางการขาย'] == channel
+        if category != 'All':
+            mask &= df['หมวดหมู่'] == category
+        totals = index.totals(start_date, end_date, channel, category)
+        assert abs(totals['มูลค่า'] - df.loc[mask, 'มูลค่า'].sum()) < 1e-6
+        assert totals['จำนวน'] == df.loc[mask, 'จำนวน'].sum()
+        assert totals['orders'] == df.loc[mask, 'รายการ'].nunique()
+
+    # The order counts in both of its categories, and once overall
+    day = start_date + pd.Timedelta(days=1)
+    assert index.totals(day, day, 'Lazada', 'Dry Food')['orders'] >= 1
+    assert index.totals(day, day, 'Lazada')['orders'] == df.loc[(df['วันที่ทำรายการ'] == day)
+                                                                 & (df['ช่องทางการขาย'] == 'Lazada'), 'รายการ'].nunique()
+
+    current, previous = index.compare(start_date, end_date)
+    assert current == index.totals(start_date, end_date)
+    assert previous == index.totals(start_date - pd.Timedelta(days=46), start_date - pd.Timedelta(days=1))
+    print("SUCCESS: Prefix-sum totals match")
+
 if __name__ == "__main__":
     print("Running pre-deployment tests...")
     